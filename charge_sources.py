@@ -0,0 +1,379 @@
+import math
+import numpy as np
+from settings import (
+    COULOMB_CONSTANT,
+    CHARGE_RADIUS,
+    LINE_CHARGE_DENSITY,
+    PLATE_CHARGE_DENSITY,
+    SOURCE_QUADRATURE_ORDERS,
+    SOURCE_QUADRATURE_TOLERANCE,
+)
+
+# Gauss-Legendre nodes and weights on [-1, 1] for every quadrature order
+gauss_legendre_rules = {order: np.polynomial.legendre.leggauss(order) for order in SOURCE_QUADRATURE_ORDERS}
+
+# Line and plate charges as arrays, rebuilt only when either list changes
+source_array_cache = {'key': None, 'arrays': None}
+
+def get_source_arrays(line_charges, plate_charges):
+    """
+    Return the line charges (x1, y1, x2, y2, q) and plate charges (x, y, width, height, q) as
+    (N, 5) and (M, 5) arrays, plus the charge of every source in 'qs', reusing the cached arrays
+    if unchanged. Sources are numbered lines first, then plates.
+    """
+    key = (tuple(line_charges), tuple(plate_charges))
+    if key != source_array_cache['key']:
+        lines = np.array(line_charges, dtype=np.float64).reshape(-1, 5)
+        plates = np.array(plate_charges, dtype=np.float64).reshape(-1, 5)
+        source_array_cache['key'] = key
+        source_array_cache['arrays'] = {
+            'lines': lines,
+            'plates': plates,
+            'qs': np.concatenate((lines[:, 4], plates[:, 4])),
+        }
+    return source_array_cache['arrays']
+
+def has_sources(source_arrays):
+    """
+    True if source_arrays (or None) holds any line or plate charge.
+    """
+    return source_arrays is not None and source_arrays['qs'].size > 0
+
+def log_ratio(s1, s2, r1, r2, d_squared):
+    """
+    ln((s2 + r2) / (s1 + r1)) for s1 <= s2 and r = sqrt(s^2 + d^2), without the cancellation
+    of s + r when s is negative. Infinite only when s1 < 0 <= s2 and d = 0.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_2 = np.where(s2 >= 0, np.log(s2 + r2), -np.log(r2 - s2))
+        log_1 = np.where(s1 >= 0, np.log(s1 + r1), -np.log(r1 - s1))
+        # For negative s, ln(s + r) = ln(d^2) - ln(r - s); the ln(d^2) terms cancel unless s1 < 0 <= s2
+        return log_2 - log_1 - np.where((s1 < 0) & (s2 >= 0), np.log(d_squared), 0.0)
+
+def segment_field(points_x, points_y, segment, k_density):
+    """
+    Closed-form vacuum field and potential of a uniformly charged segment (x1, y1, x2, y2), with
+    k_density the Coulomb constant times the charge per unit length. With s measured along the
+    segment from the foot of the perpendicular, d the distance from its line and r1, r2 the
+    distances to its ends:
+        E_t = k lambda (1/r2 - 1/r1),  E_n = k lambda (s2/r2 - s1/r1) / d,
+        V = k lambda ln((s2 + r2) / (s1 + r1))
+    Points on the segment itself get no contribution.
+    """
+    x1, y1, x2, y2 = segment
+    length = math.hypot(x2 - x1, y2 - y1)
+    tx, ty = (x2 - x1) / length, (y2 - y1) / length
+    rx = points_x - x1
+    ry = points_y - y1
+    along = rx * tx + ry * ty
+    perpendicular_x = rx - along * tx
+    perpendicular_y = ry - along * ty
+    d_squared = perpendicular_x * perpendicular_x + perpendicular_y * perpendicular_y
+    s1 = -along
+    s2 = length - along
+    r1 = np.sqrt(s1 * s1 + d_squared)
+    r2 = np.sqrt(s2 * s2 + d_squared)
+
+    on_segment = (d_squared == 0) & (s1 <= 0) & (s2 >= 0)
+    r1 = np.where(on_segment, 1.0, r1)
+    r2 = np.where(on_segment, 1.0, r2)
+    tangential = 1 / r2 - 1 / r1
+    # (s2/r2 - s1/r1) / d^2, using s/r = sign(s) (1 - d^2 / (r (r + |s|))) so it stays exact off the line
+    sign_1 = np.sign(s1)
+    sign_2 = np.sign(s2)
+    normal_over_d = (
+        (sign_2 - sign_1) / np.where(d_squared == 0, 1.0, d_squared)
+        + sign_1 / (r1 * (r1 + np.abs(s1)))
+        - sign_2 / (r2 * (r2 + np.abs(s2)))
+    )
+    ex = k_density * (tangential * tx + normal_over_d * perpendicular_x)
+    ey = k_density * (tangential * ty + normal_over_d * perpendicular_y)
+    potential = k_density * log_ratio(s1, s2, r1, r2, np.where(on_segment, 1.0, d_squared))
+    return np.where(on_segment, 0.0, ex), np.where(on_segment, 0.0, ey), np.where(on_segment, 0.0, potential)
+
+def rectangle_field(points_x, points_y, rectangle, k_density):
+    """
+    Closed-form vacuum field and potential of a uniformly charged rectangle (x, y, width, height)
+    at points in its plane, with k_density the Coulomb constant times the charge per unit area.
+    With a and b the corner offsets from the point, the potential is k sigma times the signed corner
+    sum of a ln(b + r) + b ln(a + r), and Ex, Ey are the signed sums of ln(b + r) and ln(a + r).
+    The field is infinite on the edges; those points get no contribution.
+    """
+    x, y, width, height = rectangle
+    a1 = x - points_x
+    a2 = a1 + width
+    b1 = y - points_y
+    b2 = b1 + height
+    r11 = np.hypot(a1, b1)
+    r12 = np.hypot(a1, b2)
+    r21 = np.hypot(a2, b1)
+    r22 = np.hypot(a2, b2)
+
+    # Differences of the corner logarithms along each edge
+    along_b_1 = log_ratio(b1, b2, r11, r12, a1 * a1)
+    along_b_2 = log_ratio(b1, b2, r21, r22, a2 * a2)
+    along_a_1 = log_ratio(a1, a2, r11, r21, b1 * b1)
+    along_a_2 = log_ratio(a1, a2, r12, r22, b2 * b2)
+
+    with np.errstate(invalid='ignore'):
+        ex = k_density * (along_b_2 - along_b_1)
+        ey = k_density * (along_a_2 - along_a_1)
+        potential = k_density * (
+            np.where(a2 == 0, 0.0, a2 * along_b_2) - np.where(a1 == 0, 0.0, a1 * along_b_1)
+            + np.where(b2 == 0, 0.0, b2 * along_a_2) - np.where(b1 == 0, 0.0, b1 * along_a_1)
+        )
+    on_edge = ~(np.isfinite(ex) & np.isfinite(ey))
+    return np.where(on_edge, 0.0, ex), np.where(on_edge, 0.0, ey), np.where(np.isfinite(potential), potential, 0.0)
+
+def get_source(source_arrays, index):
+    """
+    ('line', (x1, y1, x2, y2), q) or ('plate', (x, y, width, height), q) for a source index.
+    """
+    lines = source_arrays['lines']
+    if index < len(lines):
+        return 'line', tuple(lines[index, :4]), lines[index, 4]
+    plate = source_arrays['plates'][index - len(lines)]
+    return 'plate', tuple(plate[:4]), plate[4]
+
+def get_quadrature_orders(points_x, points_y, kind, shape):
+    """
+    Gauss-Legendre order (per axis) used for a source at each point: the lowest order n in
+    SOURCE_QUADRATURE_ORDERS whose error estimate (radius / distance) ** (2 n) is below
+    SOURCE_QUADRATURE_TOLERANCE, with radius the source's half diagonal and distance measured
+    from its centre, or 0 where the closed form is needed.
+    """
+    if kind == 'line':
+        x1, y1, x2, y2 = shape
+        centre_x, centre_y, radius = 0.5 * (x1 + x2), 0.5 * (y1 + y2), 0.5 * math.hypot(x2 - x1, y2 - y1)
+        degenerate = radius == 0
+    else:
+        x, y, width, height = shape
+        centre_x, centre_y, radius = x + 0.5 * width, y + 0.5 * height, 0.5 * math.hypot(width, height)
+        degenerate = width == 0 or height == 0
+    orders = np.zeros(points_x.shape, dtype=np.int64)
+    with np.errstate(divide='ignore', over='ignore'):
+        ratio = radius / np.hypot(points_x - centre_x, points_y - centre_y)
+        for order in sorted(SOURCE_QUADRATURE_ORDERS, reverse=True):
+            orders[ratio ** (2 * order) < SOURCE_QUADRATURE_TOLERANCE] = order
+    if degenerate:
+        # No closed form for a zero-length line or a zero-area plate
+        orders[orders == 0] = max(SOURCE_QUADRATURE_ORDERS)
+    return orders
+
+def get_quadrature_charges(kind, shape, q, order):
+    """
+    Point charges (xs, ys, qs) at the Gauss-Legendre nodes of a source: order nodes along a line,
+    order x order nodes over a plate.
+    """
+    nodes, weights = gauss_legendre_rules[order]
+    fractions = 0.5 * (nodes + 1)
+    if kind == 'line':
+        x1, y1, x2, y2 = shape
+        return x1 + fractions * (x2 - x1), y1 + fractions * (y2 - y1), 0.5 * q * weights
+    x, y, width, height = shape
+    xs, ys = np.meshgrid(x + fractions * width, y + fractions * height)
+    return xs.ravel(), ys.ravel(), 0.25 * q * np.outer(weights, weights).ravel()
+
+def source_field(points_x, points_y, source_arrays, coulomb_constant=COULOMB_CONSTANT, indices=None):
+    """
+    Vacuum field and potential of the line and plate charges at flat arrays of world coordinates,
+    as float64 Ex, Ey and V arrays; indices restricts the sum to some sources. Each source is
+    evaluated in closed form near by and as a few Gauss-Legendre point charges further away (see
+    get_quadrature_orders), so a plate costs about as much as a handful of point charges instead
+    of the hundreds it replaces.
+    """
+    points_x = np.asarray(points_x, dtype=np.float64)
+    points_y = np.asarray(points_y, dtype=np.float64)
+    ex = np.zeros(points_x.size)
+    ey = np.zeros(points_x.size)
+    potential = np.zeros(points_x.size)
+
+    for index in range(source_arrays['qs'].size) if indices is None else indices:
+        kind, shape, q = get_source(source_arrays, index)
+        orders = get_quadrature_orders(points_x, points_y, kind, shape)
+        for order in np.unique(orders):
+            selected = np.nonzero(orders == order)[0]
+            px = points_x[selected]
+            py = points_y[selected]
+            if order == 0 and kind == 'line':
+                length = math.hypot(shape[2] - shape[0], shape[3] - shape[1])
+                field = segment_field(px, py, shape, coulomb_constant * q / length)
+            elif order == 0:
+                field = rectangle_field(px, py, shape, coulomb_constant * q / (shape[2] * shape[3]))
+            else:
+                xs, ys, qs = get_quadrature_charges(kind, shape, q, order)
+                dx = px[:, None] - xs[None, :]
+                dy = py[:, None] - ys[None, :]
+                r = np.hypot(dx, dy)
+                kq_over_r = coulomb_constant * qs / r
+                e_over_r = kq_over_r / (r * r)
+                field = ((e_over_r * dx).sum(axis=1), (e_over_r * dy).sum(axis=1), kq_over_r.sum(axis=1))
+            ex[selected] += field[0]
+            ey[selected] += field[1]
+            potential[selected] += field[2]
+
+    return ex, ey, potential
+
+def source_distances(source_arrays, xs, ys):
+    """
+    Distance from each point to each source (zero inside a plate), as a (points, sources) array.
+    """
+    xs = np.asarray(xs, dtype=np.float64)[:, None]
+    ys = np.asarray(ys, dtype=np.float64)[:, None]
+    lines = source_arrays['lines']
+    x1, y1, x2, y2 = lines[:, 0], lines[:, 1], lines[:, 2], lines[:, 3]
+    length_squared = np.maximum((x2 - x1) ** 2 + (y2 - y1) ** 2, 1e-300)
+    t = np.clip(((xs - x1) * (x2 - x1) + (ys - y1) * (y2 - y1)) / length_squared, 0, 1)
+    line_distances = np.hypot(xs - (x1 + t * (x2 - x1)), ys - (y1 + t * (y2 - y1)))
+
+    plates = source_arrays['plates']
+    gap_x = np.maximum(np.maximum(plates[:, 0] - xs, xs - (plates[:, 0] + plates[:, 2])), 0)
+    gap_y = np.maximum(np.maximum(plates[:, 1] - ys, ys - (plates[:, 1] + plates[:, 3])), 0)
+    return np.hstack((line_distances, np.hypot(gap_x, gap_y)))
+
+def get_outline(source_arrays, index):
+    """
+    A source as a rectangle (origin_x, origin_y, tx, ty, length, width): it runs length along the
+    unit direction (tx, ty) from the origin and extends width / 2 to either side. Lines have width 0.
+    """
+    kind, shape, _ = get_source(source_arrays, index)
+    if kind == 'line':
+        x1, y1, x2, y2 = shape
+        length = math.hypot(x2 - x1, y2 - y1)
+        if length == 0:
+            return (x1, y1, 1.0, 0.0, 0.0, 0.0)
+        return (x1, y1, (x2 - x1) / length, (y2 - y1) / length, length, 0.0)
+    x, y, width, height = shape
+    return (x, y + 0.5 * height, 1.0, 0.0, width, height)
+
+def get_outline_pieces(outline, offset):
+    """
+    Lengths of the eight pieces of the outline's offset curve, counter-clockwise in the outline's
+    frame from the start of the lower side: side, corner arc, side, arc, side, arc, side, arc.
+    """
+    _, _, _, _, length, width = outline
+    arc = 0.5 * math.pi * offset
+    return [length, arc, width, arc, length, arc, width, arc]
+
+def get_outline_perimeter(outline, offset):
+    """
+    Length of the curve at distance offset around an outline.
+    """
+    return sum(get_outline_pieces(outline, offset))
+
+def outline_point(outline, position, offset):
+    """
+    World point at arc length position along the curve at distance offset around an outline.
+    """
+    origin_x, origin_y, tx, ty, length, width = outline
+    half = 0.5 * width
+    pieces = get_outline_pieces(outline, offset)
+    position %= sum(pieces)
+    piece = 0
+    while piece < 7 and position > pieces[piece]:
+        position -= pieces[piece]
+        piece += 1
+
+    # (u, v) in the outline's frame: u along (tx, ty), v along the normal (-ty, tx)
+    angle = position / offset if offset else 0.0
+    if piece == 0:
+        u, v = position, -half - offset
+    elif piece == 1:
+        u, v = length + offset * math.sin(angle), -half - offset * math.cos(angle)
+    elif piece == 2:
+        u, v = length + offset, -half + position
+    elif piece == 3:
+        u, v = length + offset * math.cos(angle), half + offset * math.sin(angle)
+    elif piece == 4:
+        u, v = length - position, half + offset
+    elif piece == 5:
+        u, v = -offset * math.sin(angle), half + offset * math.cos(angle)
+    elif piece == 6:
+        u, v = -offset, half - position
+    else:
+        u, v = -offset * math.cos(angle), -half - offset * math.sin(angle)
+    return origin_x + u * tx - v * ty, origin_y + u * ty + v * tx
+
+def outline_position(outline, x, y, offset):
+    """
+    Arc length position along the curve at distance offset around an outline of the point of
+    that curve closest to the world point (x, y); the inverse of outline_point.
+    """
+    origin_x, origin_y, tx, ty, length, width = outline
+    half = 0.5 * width
+    pieces = get_outline_pieces(outline, offset)
+    starts = np.concatenate(([0.0], np.cumsum(pieces)))
+    u = (x - origin_x) * tx + (y - origin_y) * ty
+    v = -(x - origin_x) * ty + (y - origin_y) * tx
+    nearest_u = min(max(u, 0.0), length)
+    nearest_v = min(max(v, -half), half)
+    du = u - nearest_u
+    dv = v - nearest_v
+    if du == 0 and dv == 0:
+        # Inside a plate: project onto the closest side
+        du, dv = min(((0.0, -1.0, v + half), (1.0, 0.0, length - u), (0.0, 1.0, half - v), (-1.0, 0.0, u)),
+                     key=lambda side: side[2])[:2]
+    if du == 0:
+        return starts[0] + nearest_u if dv < 0 else starts[4] + length - nearest_u
+    if dv == 0:
+        return starts[2] + nearest_v + half if du > 0 else starts[6] + half - nearest_v
+    angle = math.atan2(dv, du)
+    if du > 0 and dv < 0:
+        return starts[1] + offset * (angle + 0.5 * math.pi)
+    if du > 0:
+        return starts[3] + offset * angle
+    if dv > 0:
+        return starts[5] + offset * (angle - 0.5 * math.pi)
+    return starts[7] + offset * (angle + math.pi)
+
+def add_line_charge(start_x, start_y, end_x, end_y, sign, zoom_level, camera_offset_x, camera_offset_y, line_charges):
+    """
+    Add a line charge between two screen points with LINE_CHARGE_DENSITY charge per unit length.
+    sign is 1 or -1.
+    """
+    x1 = (start_x - camera_offset_x) / zoom_level
+    y1 = (start_y - camera_offset_y) / zoom_level
+    x2 = (end_x - camera_offset_x) / zoom_level
+    y2 = (end_y - camera_offset_y) / zoom_level
+    length = math.hypot(x2 - x1, y2 - y1)
+    if length == 0:
+        return False
+    q = sign * LINE_CHARGE_DENSITY * length
+    line_charges.append((x1, y1, x2, y2, q))
+    print(f"Line charge added from ({x1:.2f}, {y1:.2f}) to ({x2:.2f}, {y2:.2f}) with q = {q:+.3f}")
+    return True
+
+def add_plate_charge(start_x, start_y, end_x, end_y, sign, zoom_level, camera_offset_x, camera_offset_y,
+                     plate_charges):
+    """
+    Add a plate charge spanning two screen corners with PLATE_CHARGE_DENSITY charge per unit area.
+    sign is 1 or -1.
+    """
+    start_world_x = (start_x - camera_offset_x) / zoom_level
+    start_world_y = (start_y - camera_offset_y) / zoom_level
+    end_world_x = (end_x - camera_offset_x) / zoom_level
+    end_world_y = (end_y - camera_offset_y) / zoom_level
+
+    rect_x = min(start_world_x, end_world_x)
+    rect_y = min(start_world_y, end_world_y)
+    rect_width = abs(end_world_x - start_world_x)
+    rect_height = abs(end_world_y - start_world_y)
+    if rect_width == 0 or rect_height == 0:
+        return False
+    q = sign * PLATE_CHARGE_DENSITY * rect_width * rect_height
+    plate_charges.append((rect_x, rect_y, rect_width, rect_height, q))
+    print(f"Plate charge added at ({rect_x:.2f}, {rect_y:.2f}) with size {rect_width:.2f} x {rect_height:.2f}, q = {q:+.3f}")
+    return True
+
+def find_charge_sources(x, y, zoom_level, camera_offset_x, camera_offset_y, line_charges, plate_charges):
+    """
+    Indices of the line charges and of the plate charges near the clicked position, using the
+    same reach as erasing a point charge.
+    """
+    if not line_charges and not plate_charges:
+        return [], []
+    world_x = (x - camera_offset_x) / zoom_level
+    world_y = (y - camera_offset_y) / zoom_level
+    distances = source_distances(get_source_arrays(line_charges, plate_charges), [world_x], [world_y])[0]
+    near = distances <= (CHARGE_RADIUS * 2) / zoom_level
+    return np.nonzero(near[:len(line_charges)])[0].tolist(), np.nonzero(near[len(line_charges):])[0].tolist()
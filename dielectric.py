@@ -6,6 +6,7 @@ from settings import (
     POSITIVE_COLOR,
     NEGATIVE_COLOR
 )
+from surface_pool import get_translucent_surface
 
 def add_dielectric(start_x, start_y, end_x, end_y, epsilon_r, zoom_level, camera_offset_x, camera_offset_y, dielectrics):
     """
@@ -27,19 +28,14 @@ def add_dielectric(start_x, start_y, end_x, end_y, epsilon_r, zoom_level, camera
     dielectrics.append((rect_x, rect_y, rect_width, rect_height, epsilon_r))
     print(f"Dielectric added at ({rect_x:.2f}, {rect_y:.2f}) with size {rect_width:.2f} x {rect_height:.2f}, epsilon_r = {epsilon_r}")
 
-def remove_dielectric(x, y, zoom_level, camera_offset_x, camera_offset_y, dielectrics):
+def find_dielectric(world_x, world_y, dielectrics):
     """
-    Remove the dielectric near the clicked position.
+    Index of the first dielectric containing a world coordinate, or None.
     """
-    world_x = (x - camera_offset_x) / zoom_level
-    world_y = (y - camera_offset_y) / zoom_level
-
     for idx, (rect_x, rect_y, rect_width, rect_height, epsilon_r) in enumerate(dielectrics):
         if rect_x <= world_x <= rect_x + rect_width and rect_y <= world_y <= rect_y + rect_height:
-            del dielectrics[idx]
-            print(f"Dielectric removed at ({rect_x}, {rect_y})")
-            return
-    print("No dielectric found at the clicked position.")
+            return idx
+    return None
 
 def calculate_field_at_point(charges, world_x, world_y, epsilon_r=1.0):
     """
@@ -58,11 +54,93 @@ def calculate_field_at_point(charges, world_x, world_y, epsilon_r=1.0):
         Ey += E * (dy / r)
     return Ex, Ey
 
+def compute_bound_charge_layout(charges, world_x, world_y, width, height, epsilon_r, screen_width, screen_height):
+    """
+    Work out which sides carry bound charges for one dielectric and where they sit.
+    Returns a list of (dx, dy, color) offsets relative to the rectangle's top-left corner on screen.
+    """
+    # Calculate polarization direction based on electric field at the center
+    center_world_x = world_x + width / 2
+    center_world_y = world_y + height / 2
+    Ex, Ey = calculate_field_at_point(charges, center_world_x, center_world_y, epsilon_r)
+
+    # Determine dominant field direction
+    abs_Ex = abs(Ex)
+    abs_Ey = abs(Ey)
+
+    # Threshold to determine dominance (you can adjust this as needed)
+    threshold = 0.1 * max(abs_Ex, abs_Ey)
+
+    # Initialize sides to None
+    top_side = bottom_side = left_side = right_side = None
+
+    # Decide which sides to place bound charges on based on field direction
+    if abs_Ey > threshold:
+        if Ey > 0:
+            top_side = "negative"
+            bottom_side = "positive"
+        else:
+            top_side = "positive"
+            bottom_side = "negative"
+
+    if abs_Ex > threshold:
+        if Ex > 0:
+            right_side = "positive"
+            left_side = "negative"
+        else:
+            right_side = "negative"
+            left_side = "positive"
+
+    layout = []
+
+    # Place bound charges along a side
+    def place_bound_charges(side):
+        num_charges = max(5, (screen_width if side in ["top", "bottom"] else screen_height) // 30)
+        for i in range(num_charges):
+            if side == "top":
+                x = int(i * screen_width / num_charges)
+                y = 0
+                color = NEGATIVE_COLOR if top_side == "negative" else POSITIVE_COLOR
+            elif side == "bottom":
+                x = int(i * screen_width / num_charges)
+                y = screen_height
+                color = POSITIVE_COLOR if bottom_side == "positive" else NEGATIVE_COLOR
+            elif side == "left":
+                x = 0
+                y = int(i * screen_height / num_charges)
+                color = NEGATIVE_COLOR if left_side == "negative" else POSITIVE_COLOR
+            elif side == "right":
+                x = screen_width
+                y = int(i * screen_height / num_charges)
+                color = POSITIVE_COLOR if right_side == "positive" else NEGATIVE_COLOR
+            layout.append((x, y, color))
+
+    if top_side:
+        place_bound_charges("top")
+    if bottom_side:
+        place_bound_charges("bottom")
+    if left_side:
+        place_bound_charges("left")
+    if right_side:
+        place_bound_charges("right")
+
+    return layout
+
+# Bound charge layouts per dielectric, reused until the charges or the zoom level change
+bound_charge_cache = {}
+
 def draw_dielectrics(screen, zoom_level, camera_offset_x, camera_offset_y, dielectrics, charges):
     """
     Draw dielectrics as rectangles on the screen, including bound charges based on the field direction.
     """
-    for (world_x, world_y, width, height, epsilon_r) in dielectrics:
+    global bound_charge_cache
+    charges_key = hash(tuple(charges))
+    previous_cache = bound_charge_cache
+    bound_charge_cache = {}
+
+    for dielectric in dielectrics:
+        world_x, world_y, width, height, epsilon_r = dielectric
+
         # Convert world coordinates to screen coordinates
         screen_x = int(world_x * zoom_level + camera_offset_x)
         screen_y = int(world_y * zoom_level + camera_offset_y)
@@ -70,73 +148,21 @@ def draw_dielectrics(screen, zoom_level, camera_offset_x, camera_offset_y, diele
         screen_height = int(height * zoom_level)
 
         # Draw the dielectric rectangle with transparency
-        dielectric_surface = pygame.Surface((screen_width, screen_height), pygame.SRCALPHA)
-        dielectric_color = (0, 255, 255, 100) 
-        dielectric_surface.fill(dielectric_color)
+        dielectric_surface = get_translucent_surface(screen_width, screen_height, (0, 255, 255, 100), zoom_level)
         screen.blit(dielectric_surface, (screen_x, screen_y))
 
         rect = pygame.Rect(screen_x, screen_y, screen_width, screen_height)
-        pygame.draw.rect(screen, (0, 0, 0), rect, 2)  
-
-        # Calculate polarization direction based on electric field at the center
-        center_world_x = world_x + width / 2
-        center_world_y = world_y + height / 2
-        Ex, Ey = calculate_field_at_point(charges, center_world_x, center_world_y, epsilon_r)
-
-        # Determine dominant field direction
-        abs_Ex = abs(Ex)
-        abs_Ey = abs(Ey)
-
-        # Threshold to determine dominance (you can adjust this as needed)
-        threshold = 0.1 * max(abs_Ex, abs_Ey)
-        
-        # Initialize sides to None
-        top_side = bottom_side = left_side = right_side = None
-
-        # Decide which sides to place bound charges on based on field direction
-        if abs_Ey > threshold:
-            if Ey > 0:
-                top_side = "negative"
-                bottom_side = "positive"
-            else:
-                top_side = "positive"
-                bottom_side = "negative"
-
-        if abs_Ex > threshold:
-            if Ex > 0:
-                right_side = "positive"
-                left_side = "negative"
-            else:
-                right_side = "negative"
-                left_side = "positive"
-
-        # Function to place bound charges along a side
-        def place_bound_charges(side):
-            num_charges = max(5, (screen_width if side in ["top", "bottom"] else screen_height) // 30)
-            for i in range(num_charges):
-                if side == "top":
-                    x = screen_x + int(i * screen_width / num_charges)
-                    y = screen_y
-                    color = NEGATIVE_COLOR if top_side == "negative" else POSITIVE_COLOR
-                elif side == "bottom":
-                    x = screen_x + int(i * screen_width / num_charges)
-                    y = screen_y + screen_height
-                    color = POSITIVE_COLOR if bottom_side == "positive" else NEGATIVE_COLOR
-                elif side == "left":
-                    x = screen_x
-                    y = screen_y + int(i * screen_height / num_charges)
-                    color = NEGATIVE_COLOR if left_side == "negative" else POSITIVE_COLOR
-                elif side == "right":
-                    x = screen_x + screen_width
-                    y = screen_y + int(i * screen_height / num_charges)
-                    color = POSITIVE_COLOR if right_side == "positive" else NEGATIVE_COLOR
-                pygame.draw.circle(screen, color, (x, y), 5)  
-
-        if top_side:
-            place_bound_charges("top")
-        if bottom_side:
-            place_bound_charges("bottom")
-        if left_side:
-            place_bound_charges("left")
-        if right_side:
-            place_bound_charges("right")
\ No newline at end of file
+        pygame.draw.rect(screen, (0, 0, 0), rect, 2)
+
+        # Reuse the bound charge layout unless the charges or zoom changed
+        cache_key = (charges_key, zoom_level)
+        cached = previous_cache.get(dielectric)
+        if cached is None or cached[0] != cache_key:
+            layout = compute_bound_charge_layout(
+                charges, world_x, world_y, width, height, epsilon_r, screen_width, screen_height
+            )
+            cached = (cache_key, layout)
+        bound_charge_cache[dielectric] = cached
+
+        for (dx, dy, color) in cached[1]:
+            pygame.draw.circle(screen, color, (screen_x + dx, screen_y + dy), 5)
@@ -1,88 +1,292 @@
+import heapq
 import math
-import pygame
+import numpy as np
 from settings import (
     COULOMB_CONSTANT,
     NUM_FIELD_LINES,
     FIELD_LINE_STEP,
-    LINE_COLOR,
-    LINE_WIDTH,
     CHARGE_RADIUS,
+    FIELD_LINE_UNIT_CHARGE,
+    FIELD_LINE_MAX_STEPS,
+    FIELD_LINE_MAX_CROSSINGS,
+    FIELD_PRECISION,
 )
+from charge_sources import (
+    get_source_arrays,
+    has_sources,
+    source_field,
+    source_distances,
+    get_source,
+    get_outline,
+    get_outline_perimeter,
+    outline_point,
+    outline_position,
+)
+from shield import get_image_charges
+from geometry import build_region_index, query_region_index, first_crossings, region_permittivity
+from kernels import get_field_backend, kernel_coulomb_sum, kernel_trace_seeds
 
-def calculate_field(px, py, charges, dielectrics, shields, zoom_level, camera_offset_x, camera_offset_y):
+def get_relative_permittivity(world_x, world_y, dielectrics, shields):
     """
-    Calculate the electric field at a point (px, py), considering charges, dielectrics, and shields.
+    Return the relative permittivity at a world coordinate, considering dielectrics and shields.
     """
-    total_ex, total_ey = 0.0, 0.0
-
-    # Convert screen coordinates to world coordinates
-    world_px = (px - camera_offset_x) / zoom_level
-    world_py = (py - camera_offset_y) / zoom_level
-
-    # Determine the relative permittivity at the probe point
     epsilon_r = 1.0  # Default relative permittivity (vacuum)
 
     # Check dielectrics
     for dielectric in dielectrics:
         x1, y1, width, height, dielectric_epsilon = dielectric
-        if x1 <= world_px <= x1 + width and y1 <= world_py <= y1 + height:
+        if x1 <= world_x <= x1 + width and y1 <= world_y <= y1 + height:
             epsilon_r = dielectric_epsilon
             break
 
     # Check shields (conductors have infinite epsilon, but we simulate by setting epsilon_r high)
     for shield in shields:
         x1, y1, width, height = shield
-        if x1 <= world_px <= x1 + width and y1 <= world_py <= y1 + height:
+        if x1 <= world_x <= x1 + width and y1 <= world_y <= y1 + height:
             epsilon_r = 1e9  # Simulate conductor with very high epsilon
             break
 
-    # Calculate contributions from each charge
-    for charge in charges:
-        cx, cy, q = charge
-        dx = world_px - cx
-        dy = world_py - cy
-        r_squared = dx**2 + dy**2
-        if r_squared == 0:
-            continue  # Avoid division by zero
+    return epsilon_r
 
-        e_magnitude = COULOMB_CONSTANT * q / (r_squared * epsilon_r)
-        angle = math.atan2(dy, dx)
-        ex = e_magnitude * math.cos(angle)
-        ey = e_magnitude * math.sin(angle)
+# Charge positions and magnitudes as arrays, rebuilt only when the charge list changes
+charge_array_cache = {'key': None, 'arrays': None}
 
-        total_ex += ex
-        total_ey += ey
+def get_charge_arrays(charges):
+    """
+    Return (xs, ys, qs) NumPy arrays for the given charges, reusing the cached arrays if unchanged.
+    """
+    key = tuple(charges)
+    if key != charge_array_cache['key']:
+        if charges:
+            xs, ys, qs = np.array(charges, dtype=np.float64).T
+        else:
+            xs = ys = qs = np.zeros(0)
+        charge_array_cache['key'] = key
+        charge_array_cache['arrays'] = (np.ascontiguousarray(xs), np.ascontiguousarray(ys), np.ascontiguousarray(qs))
+    return charge_array_cache['arrays']
+
+def calculate_field_fast(world_x, world_y, charges, dielectrics, shields, line_charges=(), plate_charges=()):
+    """
+    Vectorized field and potential at a world coordinate, without per-charge details.
+    Returns Ex, Ey and the potential V.
+    """
+    xs, ys, qs = get_charge_arrays(charges)
+    epsilon_r = get_relative_permittivity(world_x, world_y, dielectrics, shields)
+    image_groups = get_image_charges(charges, shields)
+    if line_charges or plate_charges or image_groups:
+        point_x = np.array([world_x], dtype=np.float64)
+        point_y = np.array([world_y], dtype=np.float64)
+        ex, ey, potential = coulomb_sum(point_x, point_y, xs, ys, qs)
+        source_ex, source_ey, source_potential = source_field(
+            point_x, point_y, get_source_arrays(line_charges, plate_charges)
+        )
+        image_ex, image_ey, image_potential = image_charge_field(point_x, point_y, image_groups)
+        ex += image_ex
+        ey += image_ey
+        potential += image_potential
+        return (
+            float(ex[0] + source_ex[0]) / epsilon_r,
+            float(ey[0] + source_ey[0]) / epsilon_r,
+            float(potential[0] + source_potential[0]) / epsilon_r,
+        )
+    if get_field_backend() != 'numpy':
+        ex, ey, potential = kernel_coulomb_sum(
+            np.array([world_x], dtype=np.float64), np.array([world_y], dtype=np.float64), xs, ys, qs
+        )
+        return float(ex[0]) / epsilon_r, float(ey[0]) / epsilon_r, float(potential[0]) / epsilon_r
+
+    dx = world_x - xs
+    dy = world_y - ys
+    r_squared = dx * dx + dy * dy
+    r_squared[r_squared == 0] = np.inf  # Skip charges sitting exactly on the point
+    r = np.sqrt(r_squared)
+    kq = (COULOMB_CONSTANT / epsilon_r) * qs
+    e_over_r = kq / (r_squared * r)
+
+    Ex = float(np.dot(e_over_r, dx))
+    Ey = float(np.dot(e_over_r, dy))
+    V = float(np.sum(kq / r))
+    return Ex, Ey, V
+
+def get_relative_permittivity_batch(world_xs, world_ys, dielectrics, shields):
+    """
+    Vectorized get_relative_permittivity over arrays of world coordinates.
+    The first dielectric containing a point wins, and shields override dielectrics.
+    """
+    epsilon_r = np.ones(np.shape(world_xs))
+    assigned = np.zeros(np.shape(world_xs), dtype=bool)
+
+    for (x1, y1, width, height, dielectric_epsilon) in dielectrics:
+        inside = (x1 <= world_xs) & (world_xs <= x1 + width) & (y1 <= world_ys) & (world_ys <= y1 + height)
+        inside &= ~assigned
+        epsilon_r[inside] = dielectric_epsilon
+        assigned |= inside
 
-    return total_ex, total_ey
+    for (x1, y1, width, height) in shields:
+        inside = (x1 <= world_xs) & (world_xs <= x1 + width) & (y1 <= world_ys) & (world_ys <= y1 + height)
+        epsilon_r[inside] = 1e9  # Simulate conductor with very high epsilon
 
-def calculate_field_with_details(px, py, charges, dielectrics, shields, zoom_level, camera_offset_x, camera_offset_y):
+    return epsilon_r
+
+def image_charge_field(points_x, points_y, image_groups):
+    """
+    Vacuum field and potential of shield image charges (see shield.get_image_charges) at flat
+    float64 arrays of world coordinates. Each group only acts on the points on the real
+    charges' side of its plane; behind the plane the conductor screens them.
+    """
+    ex = np.zeros(points_x.size)
+    ey = np.zeros(points_x.size)
+    potential = np.zeros(points_x.size)
+    for (axis, position, side), xs, ys, qs in image_groups:
+        coordinates = points_x if axis == 0 else points_y
+        facing = np.nonzero(side * (coordinates - position) > 0)[0]
+        if facing.size == 0:
+            continue
+        image_ex, image_ey, image_potential = coulomb_sum(points_x[facing], points_y[facing], xs, ys, qs)
+        ex[facing] += image_ex
+        ey[facing] += image_ey
+        potential[facing] += image_potential
+    return ex, ey, potential
+
+# Upper bound on point-charge pairs evaluated at once by calculate_field_batch
+BATCH_PAIR_LIMIT = 1 << 20
+
+def coulomb_sum(points_x, points_y, xs, ys, qs, coulomb_constant=COULOMB_CONSTANT):
+    """
+    Vacuum field and potential of the charges (xs, ys, qs) at flat arrays of world coordinates.
+    Returns Ex, Ey and V arrays in the dtype of points_x (float64 for integer coordinates).
+    """
+    if not np.issubdtype(points_x.dtype, np.floating):
+        points_x = points_x.astype(np.float64)
+        points_y = points_y.astype(np.float64)
+    if get_field_backend() != 'numpy':
+        return kernel_coulomb_sum(points_x, points_y, xs, ys, qs, coulomb_constant)
+
+    ex = np.zeros(points_x.size, dtype=points_x.dtype)
+    ey = np.zeros(points_x.size, dtype=points_x.dtype)
+    potential = np.zeros(points_x.size, dtype=points_x.dtype)
+
+    # Split the points into blocks so the point x charge matrices stay bounded
+    block = max(1, BATCH_PAIR_LIMIT // max(1, xs.size))
+    for start in range(0, points_x.size, block):
+        stop = start + block
+        dx = points_x[start:stop, None] - xs[None, :]
+        dy = points_y[start:stop, None] - ys[None, :]
+        r_squared = dx * dx + dy * dy
+        r_squared[r_squared == 0] = np.inf  # Skip charges sitting exactly on a point
+        r = np.sqrt(r_squared)
+        kq_over_r = (coulomb_constant * qs) / r
+        e_over_r = kq_over_r / r_squared
+        ex[start:stop] = np.einsum('ij,ij->i', e_over_r, dx)
+        ey[start:stop] = np.einsum('ij,ij->i', e_over_r, dy)
+        potential[start:stop] = kq_over_r.sum(axis=1)
+
+    return ex, ey, potential
+
+def coulomb_sum_rescaled(points_x, points_y, xs, ys, qs, dtype):
+    """
+    coulomb_sum in a reduced precision dtype. Coordinates are shifted to the centre of the points
+    and charges and divided by their extent so they stay of order one, and the Coulomb constant is
+    applied after the sum, so neither the coordinates nor K / r^2 lose range or precision.
+    """
+    all_x = np.concatenate((points_x[[0, -1]], [points_x.min(), points_x.max()], xs))
+    all_y = np.concatenate((points_y[[0, -1]], [points_y.min(), points_y.max()], ys))
+    centre_x = 0.5 * (all_x.min() + all_x.max())
+    centre_y = 0.5 * (all_y.min() + all_y.max())
+    scale = max(all_x.max() - all_x.min(), all_y.max() - all_y.min(), 1.0)
+
+    ex, ey, potential = coulomb_sum(
+        ((points_x - centre_x) / scale).astype(dtype),
+        ((points_y - centre_y) / scale).astype(dtype),
+        ((xs - centre_x) / scale).astype(dtype),
+        ((ys - centre_y) / scale).astype(dtype),
+        qs.astype(dtype),
+        1.0,
+    )
+    ex *= dtype.type(COULOMB_CONSTANT / scale ** 2)
+    ey *= dtype.type(COULOMB_CONSTANT / scale ** 2)
+    potential *= dtype.type(COULOMB_CONSTANT / scale)
+    return ex, ey, potential
+
+def calculate_field_batch(world_xs, world_ys, charges, dielectrics, shields, precision='float64',
+                          line_charges=(), plate_charges=()):
+    """
+    Vectorized field and potential at many world coordinates at once.
+    Honours the same dielectric and shield permittivity lookup as calculate_field_fast.
+    precision is 'float64', or 'float32' for half the memory traffic at about 1e-6 relative error.
+    Line and plate charges (see charge_sources.py) and the image charges of shields acting as
+    grounded planes (see shield.get_image_charges) are added in float64.
+    Returns Ex, Ey and V arrays with the shape of world_xs.
+    """
+    world_xs = np.asarray(world_xs, dtype=np.float64)
+    world_ys = np.asarray(world_ys, dtype=np.float64)
+    shape = world_xs.shape
+    flat_xs = world_xs.ravel()
+    flat_ys = world_ys.ravel()
+    dtype = np.dtype(precision)
+    xs, ys, qs = get_charge_arrays(charges)
+    if flat_xs.size == 0:
+        ex = ey = potential = np.zeros(0, dtype=dtype)
+    elif dtype == np.float64:
+        ex, ey, potential = coulomb_sum(flat_xs, flat_ys, xs, ys, qs)
+    else:
+        ex, ey, potential = coulomb_sum_rescaled(flat_xs, flat_ys, xs, ys, qs, dtype)
+    if flat_xs.size and (line_charges or plate_charges):
+        source_ex, source_ey, source_potential = source_field(
+            flat_xs, flat_ys, get_source_arrays(line_charges, plate_charges)
+        )
+        ex += source_ex.astype(dtype)
+        ey += source_ey.astype(dtype)
+        potential += source_potential.astype(dtype)
+    image_groups = get_image_charges(charges, shields)
+    if flat_xs.size and image_groups:
+        image_ex, image_ey, image_potential = image_charge_field(flat_xs, flat_ys, image_groups)
+        ex += image_ex.astype(dtype)
+        ey += image_ey.astype(dtype)
+        potential += image_potential.astype(dtype)
+
+    epsilon_r = get_relative_permittivity_batch(flat_xs, flat_ys, dielectrics, shields).astype(dtype)
+    ex /= epsilon_r
+    ey /= epsilon_r
+    potential /= epsilon_r
+    return ex.reshape(shape), ey.reshape(shape), potential.reshape(shape)
+
+def calculate_field_grid(bounds, columns, rows, charges, dielectrics, shields, precision=FIELD_PRECISION,
+                         line_charges=(), plate_charges=()):
+    """
+    Field and potential on a rows x columns grid spanning the world rectangle
+    bounds (min_x, min_y, max_x, max_y), edges included.
+    Returns Ex, Ey and V arrays of shape (rows, columns) in the given precision.
+    """
+    min_x, min_y, max_x, max_y = bounds
+    grid_xs, grid_ys = np.meshgrid(np.linspace(min_x, max_x, columns), np.linspace(min_y, max_y, rows))
+    return calculate_field_batch(
+        grid_xs, grid_ys, charges, dielectrics, shields, precision, line_charges, plate_charges
+    )
+
+def get_scene_key(charges, dielectrics, shields, line_charges=(), plate_charges=()):
+    """
+    Return a hashable key that changes whenever the charges, dielectrics, shields or the line
+    and plate charges change.
+    """
+    return hash((tuple(charges), tuple(dielectrics), tuple(shields), tuple(line_charges), tuple(plate_charges)))
+
+def calculate_field_with_details(px, py, charges, dielectrics, shields, zoom_level, camera_offset_x, camera_offset_y,
+                                 line_charges=(), plate_charges=()):
     """
     Calculate the electric field at a point (px, py) and collect detailed calculation steps.
-    Returns total_ex, total_ey, and math_details containing contributions from each charge.
+    Returns total_ex, total_ey, and math_details containing contributions from each charge,
+    from each line or plate charge and from each shield's image charges.
     """
     total_ex, total_ey = 0.0, 0.0
-    math_details = {'charges': []}
+    math_details = {'charges': [], 'sources': [], 'images': []}
 
     # Convert screen coordinates to world coordinates
     world_px = (px - camera_offset_x) / zoom_level
     world_py = (py - camera_offset_y) / zoom_level
 
     # Determine the relative permittivity at the probe point
-    epsilon_r = 1.0  # Default relative permittivity (vacuum)
-
-    # Check dielectrics
-    for dielectric in dielectrics:
-        x1, y1, width, height, dielectric_epsilon = dielectric
-        if x1 <= world_px <= x1 + width and y1 <= world_py <= y1 + height:
-            epsilon_r = dielectric_epsilon
-            break
-
-    # Check shields (conductors have infinite epsilon, but we simulate by setting epsilon_r high)
-    for shield in shields:
-        x1, y1, width, height = shield
-        if x1 <= world_px <= x1 + width and y1 <= world_py <= y1 + height:
-            epsilon_r = 1e9  # Simulate conductor with very high epsilon
-            break
+    epsilon_r = get_relative_permittivity(world_px, world_py, dielectrics, shields)
 
     math_details['epsilon_r'] = epsilon_r
 
@@ -112,85 +316,388 @@ def calculate_field_with_details(px, py, charges, dielectrics, shields, zoom_lev
             'ey': ey,
         })
 
+    # Contributions from line and plate charges
+    if line_charges or plate_charges:
+        source_arrays = get_source_arrays(line_charges, plate_charges)
+        distances = source_distances(source_arrays, [world_px], [world_py])[0]
+        for index in range(source_arrays['qs'].size):
+            kind, _, q = get_source(source_arrays, index)
+            ex, ey, _ = source_field([world_px], [world_py], source_arrays, indices=[index])
+            ex = float(ex[0]) / epsilon_r
+            ey = float(ey[0]) / epsilon_r
+            total_ex += ex
+            total_ey += ey
+            math_details['sources'].append({
+                'kind': kind,
+                'q': float(q),
+                'distance': float(distances[index]),
+                'ex': ex,
+                'ey': ey,
+            })
+
+    # Contributions from the image charges of shields acting as grounded planes
+    for group in get_image_charges(charges, shields):
+        ex, ey, _ = image_charge_field(np.array([world_px]), np.array([world_py]), [group])
+        if ex[0] == 0 and ey[0] == 0:
+            continue  # The probe is behind this plane
+        ex = float(ex[0]) / epsilon_r
+        ey = float(ey[0]) / epsilon_r
+        total_ex += ex
+        total_ey += ey
+        math_details['images'].append({
+            'count': int(group[3].size),
+            'q': float(group[3].sum()),
+            'ex': ex,
+            'ey': ey,
+        })
+
     return total_ex, total_ey, math_details
 
-def draw_field_lines(screen, charges, dielectrics, shields, zoom_level, camera_offset_x, camera_offset_y, screen_info):
-    """
-    Draw electric field lines based on charges, dielectrics, and shields.
-    """
-    arrow_interval = 10  # Interval to place arrows along the line
-    arrow_size = 5       # Size of the arrowhead
-
-    def add_arrow(line_points, charge_magnitude):
-        """
-        Adds an arrowhead at the last segment of the field line.
-        """
-        if len(line_points) > 1:
-            arrow_end = line_points[-1]
-            arrow_start = line_points[-2]
-            dx = arrow_end[0] - arrow_start[0]
-            dy = arrow_end[1] - arrow_start[1]
-            angle = math.atan2(dy, dx)
-            if charge_magnitude < 0:
-                angle += math.pi
-
-            left_arrow = (
-                arrow_end[0] - arrow_size * math.cos(angle - math.pi / 6),
-                arrow_end[1] - arrow_size * math.sin(angle - math.pi / 6),
+def count_field_lines(charge_magnitude, seed_fraction=1.0):
+    """
+    Number of field lines carried by a charge, proportional to its magnitude.
+    """
+    return max(1, round(seed_fraction * NUM_FIELD_LINES * abs(charge_magnitude) / FIELD_LINE_UNIT_CHARGE))
+
+def fill_angle_gaps(arrival_angles, count):
+    """
+    Choose count seed angles around a charge, spread over the gaps left between the angles
+    at which other field lines already arrived.
+    """
+    if count <= 0:
+        return []
+    if not arrival_angles:
+        return [i * (2 * math.pi / count) for i in range(count)]
+
+    angles = sorted(angle % (2 * math.pi) for angle in arrival_angles)
+    gaps = [
+        (angles[(k + 1) % len(angles)] - angles[k]) % (2 * math.pi) or 2 * math.pi
+        for k in range(len(angles))
+    ]
+
+    # Hand out lines one at a time to the gap whose spacing would stay widest
+    assigned = [0] * len(gaps)
+    heap = [(-gap, k) for k, gap in enumerate(gaps)]
+    heapq.heapify(heap)
+    for _ in range(count):
+        _, k = heapq.heappop(heap)
+        assigned[k] += 1
+        heapq.heappush(heap, (-gaps[k] / (assigned[k] + 1), k))
+
+    seeds = []
+    for k, lines_in_gap in enumerate(assigned):
+        for n in range(lines_in_gap):
+            seeds.append(angles[k] + gaps[k] * (n + 1) / (lines_in_gap + 1))
+    return seeds
+
+def get_step_directions(ex, ey, direction, normal_axis, normal_scale):
+    """
+    Unit step directions from field components. Inside a dielectric the field component along
+    the normal of the boundary the line last crossed is scaled by normal_scale (1 / epsilon_r),
+    so the normal D and tangential E stay continuous across the boundary.
+    """
+    ex = np.where(normal_axis == 0, ex * normal_scale, ex)
+    ey = np.where(normal_axis == 1, ey * normal_scale, ey)
+    magnitude = np.hypot(ex, ey)
+    return direction * ex / magnitude, direction * ey / magnitude
+
+def iterate_trace_seeds(seed_xs, seed_ys, direction, charge_arrays, region_index, bounds, capture_sign,
+                        step_size=FIELD_LINE_STEP, max_steps=FIELD_LINE_MAX_STEPS, source_arrays=None,
+                        image_groups=()):
+    """
+    Generator that traces field lines from world-space seeds, all seeds stepping together.
+    It yields after every step so the work can be resumed later, and returns the result.
+    direction is 1 to follow the field and -1 to trace against it. region_index comes from
+    geometry.build_region_index. Each step is clipped against the shield and dielectric
+    rectangles: a line ends exactly where it enters a shield, and at a dielectric boundary the
+    rest of the step is refracted (see get_step_directions).
+    A line also stops when the field vanishes, after leaving bounds (min_x, min_y, max_x, max_y),
+    after max_steps steps, or once it comes within CHARGE_RADIUS (or one step, if larger) of a
+    charge whose sign is capture_sign.
+    source_arrays (see charge_sources.get_source_arrays) adds line and plate charges, which
+    capture lines within the same distance of their outline. image_groups (see
+    shield.get_image_charges) adds the image charges of shields acting as grounded planes.
+    Returns (paths, captured): a list of (n, 2) point arrays in FIELD_PRECISION and, per line,
+    the index of the capturing charge or -1; line and plate charges are numbered after the point
+    charges. Stepping itself is always done in float64.
+    With a loop backend (see kernels.py) every line is traced in one compiled call instead. The
+    loop kernels only know point charges, so scenes with line or plate charges or image charges
+    step with NumPy.
+    """
+    if get_field_backend() != 'numpy' and not has_sources(source_arrays) and not image_groups:
+        result = kernel_trace_seeds(
+            seed_xs, seed_ys, direction, charge_arrays, region_index, bounds, capture_sign,
+            step_size, max_steps, FIELD_LINE_MAX_CROSSINGS,
+        )
+        yield
+        return result
+
+    xs, ys, qs = charge_arrays
+    count = len(seed_xs)
+    x = np.array(seed_xs, dtype=np.float64)
+    y = np.array(seed_ys, dtype=np.float64)
+    # Points are recorded as (line, x, y) chunks, since crossings add extra points to some lines
+    history_line = [np.arange(count)]
+    history_x = [x.copy()]
+    history_y = [y.copy()]
+    active = np.ones(count, dtype=bool)
+    captured = np.full(count, -1, dtype=np.int64)
+    normal_axis = np.full(count, -1, dtype=np.int64)
+    normal_scale = np.ones(count)
+    capture_indices = np.nonzero(np.sign(qs) == capture_sign)[0]
+    with_sources = has_sources(source_arrays)
+    source_capture_indices = np.nonzero(np.sign(source_arrays['qs']) == capture_sign)[0] if with_sources else []
+    min_x, min_y, max_x, max_y = bounds
+    capture_radius = max(CHARGE_RADIUS, step_size)
+    rects = region_index['rects']
+
+    for _ in range(max_steps):
+        idx = np.nonzero(active)[0]
+        if idx.size == 0:
+            break
+
+        # Only the field direction matters here, so the permittivity lookup is skipped
+        ex, ey, _ = coulomb_sum(x[idx], y[idx], xs, ys, qs)
+        if with_sources:
+            source_ex, source_ey, _ = source_field(x[idx], y[idx], source_arrays)
+            ex += source_ex
+            ey += source_ey
+        if image_groups:
+            image_ex, image_ey, _ = image_charge_field(x[idx], y[idx], image_groups)
+            ex += image_ex
+            ey += image_ey
+        magnitude = np.hypot(ex, ey)
+        moving = (magnitude > 0) & np.isfinite(magnitude)
+        active[idx[~moving]] = False
+        idx, ex, ey = idx[moving], ex[moving], ey[moving]
+
+        start_x = x[idx]
+        start_y = y[idx]
+        remaining = np.full(idx.size, float(step_size))
+        step_x, step_y = get_step_directions(ex, ey, direction, normal_axis[idx], normal_scale[idx])
+        blocked = np.zeros(idx.size, dtype=bool)
+
+        # Clip the step at region boundaries, refracting at dielectrics and stopping at shields
+        pending = np.arange(idx.size) if len(rects) else np.zeros(0, dtype=np.int64)
+        for _ in range(FIELD_LINE_MAX_CROSSINGS):
+            if pending.size == 0:
+                break
+            end_x = start_x[pending] + remaining[pending] * step_x[pending]
+            end_y = start_y[pending] + remaining[pending] * step_y[pending]
+            candidates = query_region_index(region_index, start_x[pending], start_y[pending], end_x, end_y)
+            t, rect, axis = first_crossings(start_x[pending], start_y[pending], end_x, end_y, rects[candidates])
+            crossing = t <= 1
+            pending, t, rect, axis = pending[crossing], t[crossing], candidates[rect[crossing]], axis[crossing]
+            end_x, end_y = end_x[crossing], end_y[crossing]
+            if pending.size == 0:
+                break
+
+            cross_x = start_x[pending] + t * (end_x - start_x[pending])
+            cross_y = start_y[pending] + t * (end_y - start_y[pending])
+            history_line.append(idx[pending])
+            history_x.append(cross_x)
+            history_y.append(cross_y)
+            start_x[pending] = cross_x
+            start_y[pending] = cross_y
+            remaining[pending] *= 1 - t
+
+            shielded = region_index['is_shield'][rect]
+            blocked[pending[shielded]] = True
+            pending, axis = pending[~shielded], axis[~shielded]
+
+            # Permittivity just past the crossing decides how the rest of the step bends
+            probe = 1e-6 * step_size
+            epsilon_r = region_permittivity(
+                region_index,
+                start_x[pending] + probe * step_x[pending],
+                start_y[pending] + probe * step_y[pending],
             )
-            right_arrow = (
-                arrow_end[0] - arrow_size * math.cos(angle + math.pi / 6),
-                arrow_end[1] - arrow_size * math.sin(angle + math.pi / 6),
+            lines = idx[pending]
+            normal_axis[lines] = np.where(epsilon_r != 1, axis, -1)
+            normal_scale[lines] = 1 / epsilon_r
+            step_x[pending], step_y[pending] = get_step_directions(
+                ex[pending], ey[pending], direction, normal_axis[lines], normal_scale[lines]
             )
-            pygame.draw.polygon(screen, LINE_COLOR, [arrow_end, left_arrow, right_arrow])
-
-    for (cx, cy, charge_magnitude) in charges:
-        direction = 1 if charge_magnitude > 0 else -1
-
-        for i in range(NUM_FIELD_LINES):
-            angle = i * (2 * math.pi / NUM_FIELD_LINES)
-            x = cx * zoom_level + camera_offset_x + direction * CHARGE_RADIUS * math.cos(angle) * zoom_level
-            y = cy * zoom_level + camera_offset_y + direction * CHARGE_RADIUS * math.sin(angle) * zoom_level
-
-            line_points = [(x, y)]
-            steps = 0
-
-            for _ in range(100):  # Max steps to trace the line
-                ex, ey = calculate_field(x, y, charges, dielectrics, shields, zoom_level, camera_offset_x, camera_offset_y)
-                magnitude = math.sqrt(ex**2 + ey**2)
-                if magnitude == 0:
-                    break
-
-                step_size = FIELD_LINE_STEP * zoom_level / magnitude
-                x += direction * step_size * ex
-                y += direction * step_size * ey
-
-                # Check if the new point is inside any shield
-                inside_shield = False
-                for shield in shields:
-                    shield_x1, shield_y1, shield_width, shield_height = shield
-                    shield_screen_x = shield_x1 * zoom_level + camera_offset_x
-                    shield_screen_y = shield_y1 * zoom_level + camera_offset_y
-                    shield_screen_width = shield_width * zoom_level
-                    shield_screen_height = shield_height * zoom_level
-                    if shield_screen_x <= x <= shield_screen_x + shield_screen_width and \
-                       shield_screen_y <= y <= shield_screen_y + shield_screen_height:
-                        inside_shield = True
-                        break
-
-                if inside_shield:
-                    break  # Stop drawing the line if it enters a shield
-
-                line_points.append((x, y))
-
-                # Add arrowheads at intervals
-                if steps % arrow_interval == 0:
-                    add_arrow(line_points, charge_magnitude)
-
-                steps += 1
-                if x < 0 or x > screen_info.current_w or y < 0 or y > screen_info.current_h:
-                    break
-
-            # Draw the field line
-            if len(line_points) > 1:
-                pygame.draw.lines(screen, LINE_COLOR, False, line_points, LINE_WIDTH)
+
+        active[idx[blocked]] = False
+        keep = ~blocked
+        idx = idx[keep]
+        new_x = start_x[keep] + remaining[keep] * step_x[keep]
+        new_y = start_y[keep] + remaining[keep] * step_y[keep]
+
+        x[idx] = new_x
+        y[idx] = new_y
+        history_line.append(idx)
+        history_x.append(new_x)
+        history_y.append(new_y)
+
+        # Stop on capture by an opposite charge
+        if capture_indices.size:
+            dx = new_x[:, None] - xs[capture_indices][None, :]
+            dy = new_y[:, None] - ys[capture_indices][None, :]
+            distance_squared = dx * dx + dy * dy
+            nearest = distance_squared.argmin(axis=1)
+            hit = distance_squared[np.arange(idx.size), nearest] < capture_radius ** 2
+            captured[idx[hit]] = capture_indices[nearest[hit]]
+            active[idx[hit]] = False
+
+        # Line and plate charges capture by distance from their outline
+        if len(source_capture_indices):
+            distance = source_distances(source_arrays, new_x, new_y)[:, source_capture_indices]
+            nearest = distance.argmin(axis=1)
+            hit = (captured[idx] < 0) & (distance[np.arange(idx.size), nearest] < capture_radius)
+            captured[idx[hit]] = xs.size + source_capture_indices[nearest[hit]]
+            active[idx[hit]] = False
+
+        # Stop once the line has left the visible area
+        outside = (new_x < min_x) | (new_x > max_x) | (new_y < min_y) | (new_y > max_y)
+        active[idx[outside]] = False
+        yield
+
+    # Group the recorded points by line, keeping their order within each line
+    history_line = np.concatenate(history_line)
+    order = np.argsort(history_line, kind='stable')
+    points = np.column_stack((np.concatenate(history_x), np.concatenate(history_y)))[order].astype(FIELD_PRECISION)
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(history_line, minlength=count))))
+    paths = [points[offsets[i]:offsets[i + 1]] for i in range(count)]
+    return paths, captured
+
+def trace_seeds(seed_xs, seed_ys, direction, charge_arrays, region_index, bounds, capture_sign,
+                step_size=FIELD_LINE_STEP, max_steps=FIELD_LINE_MAX_STEPS, source_arrays=None, image_groups=()):
+    """
+    Trace field lines from world-space seeds to completion; see iterate_trace_seeds.
+    """
+    steps = iterate_trace_seeds(
+        seed_xs, seed_ys, direction, charge_arrays, region_index, bounds, capture_sign, step_size, max_steps,
+        source_arrays, image_groups,
+    )
+    while True:
+        try:
+            next(steps)
+        except StopIteration as finished:
+            return finished.value
+
+def get_lod_stepping(lod):
+    """
+    Step size and maximum step count for a level of detail; coarser steps keep the same reach.
+    """
+    step_size = FIELD_LINE_STEP * lod['step_multiplier']
+    max_steps = max(1, FIELD_LINE_MAX_STEPS // lod['step_multiplier'])
+    return step_size, max_steps
+
+def seed_around_charges(charge_arrays, indices, angle_lists):
+    """
+    World-space seed points on the CHARGE_RADIUS circle of each charge, at the given angles.
+    """
+    xs, ys, _ = charge_arrays
+    seed_xs, seed_ys = [], []
+    for index, angles in zip(indices, angle_lists):
+        for angle in angles:
+            seed_xs.append(xs[index] + CHARGE_RADIUS * math.cos(angle))
+            seed_ys.append(ys[index] + CHARGE_RADIUS * math.sin(angle))
+    return seed_xs, seed_ys
+
+def seed_around_sources(source_arrays, indices, angle_lists):
+    """
+    World-space seed points on the curve CHARGE_RADIUS outside each line or plate charge.
+    Angles stand for positions along that curve, a full turn being its whole length, so the
+    same gap filling as around point charges spreads the seeds evenly along it.
+    """
+    seed_xs, seed_ys = [], []
+    for index, angles in zip(indices, angle_lists):
+        outline = get_outline(source_arrays, index)
+        perimeter = get_outline_perimeter(outline, CHARGE_RADIUS)
+        for angle in angles:
+            seed_x, seed_y = outline_point(outline, perimeter * angle / (2 * math.pi), CHARGE_RADIUS)
+            seed_xs.append(seed_x)
+            seed_ys.append(seed_y)
+    return seed_xs, seed_ys
+
+def get_positive_seeds(charge_arrays, seed_fraction=1.0, source_arrays=None):
+    """
+    Evenly spaced seeds around every positive charge, proportional to its magnitude,
+    including positive line and plate charges.
+    """
+    qs = charge_arrays[2]
+    positive = np.nonzero(qs > 0)[0]
+    angle_lists = [fill_angle_gaps([], count_field_lines(qs[i], seed_fraction)) for i in positive]
+    seed_xs, seed_ys = seed_around_charges(charge_arrays, positive, angle_lists)
+    if has_sources(source_arrays):
+        source_qs = source_arrays['qs']
+        positive = np.nonzero(source_qs > 0)[0]
+        angle_lists = [fill_angle_gaps([], count_field_lines(source_qs[i], seed_fraction)) for i in positive]
+        source_xs, source_ys = seed_around_sources(source_arrays, positive, angle_lists)
+        seed_xs += source_xs
+        seed_ys += source_ys
+    return seed_xs, seed_ys
+
+def record_arrivals(paths, captured, charge_arrays, arrivals, source_arrays=None):
+    """
+    Add the arrival angle of every captured line to arrivals, keyed by capturing charge index.
+    Arrivals at line and plate charges are recorded as outline positions (see seed_around_sources).
+    """
+    xs, ys, _ = charge_arrays
+    for path, index in zip(paths, captured):
+        if index >= xs.size:
+            outline = get_outline(source_arrays, index - xs.size)
+            position = outline_position(outline, float(path[-1, 0]), float(path[-1, 1]), CHARGE_RADIUS)
+            arrivals.setdefault(index, []).append(2 * math.pi * position / get_outline_perimeter(outline, CHARGE_RADIUS))
+        elif index >= 0:
+            arrivals.setdefault(index, []).append(math.atan2(path[-1, 1] - ys[index], path[-1, 0] - xs[index]))
+
+def get_negative_seeds(charge_arrays, arrivals, seed_fraction=1.0, source_arrays=None):
+    """
+    Seeds for the flux of each negative charge that no positive line reached,
+    placed in the gaps between the arrival angles, including negative line and plate charges.
+    """
+    qs = charge_arrays[2]
+    negative = np.nonzero(qs < 0)[0]
+    angle_lists = [
+        fill_angle_gaps(arrivals.get(i, []), count_field_lines(qs[i], seed_fraction) - len(arrivals.get(i, [])))
+        for i in negative
+    ]
+    seed_xs, seed_ys = seed_around_charges(charge_arrays, negative, angle_lists)
+    if has_sources(source_arrays):
+        source_qs = source_arrays['qs']
+        negative = np.nonzero(source_qs < 0)[0]
+        angle_lists = []
+        for i in negative:
+            source_arrivals = arrivals.get(qs.size + i, [])
+            count = count_field_lines(source_qs[i], seed_fraction) - len(source_arrivals)
+            angle_lists.append(fill_angle_gaps(source_arrivals, count))
+        source_xs, source_ys = seed_around_sources(source_arrays, negative, angle_lists)
+        seed_xs += source_xs
+        seed_ys += source_ys
+    return seed_xs, seed_ys
+
+def trace_field_lines_in_bounds(charges, dielectrics, shields, bounds, step_size=FIELD_LINE_STEP,
+                                max_steps=FIELD_LINE_MAX_STEPS, seed_fraction=1.0, line_charges=(), plate_charges=()):
+    """
+    Trace electric field lines within the world rectangle bounds (min_x, min_y, max_x, max_y) with
+    an explicit step size, independent of the screen (e.g. for exports).
+    Each charge carries a number of lines proportional to its magnitude. Lines from positive
+    charges stop when they reach a negative charge, and negative charges only trace the lines
+    that no positive line arrived at.
+    Returns a list of (path, direction) world-space lines, where path is an (n, 2) array and
+    direction is 1 for lines traced along the field and -1 for lines traced against it.
+    """
+    charge_arrays = get_charge_arrays(charges)
+    source_arrays = get_source_arrays(line_charges, plate_charges)
+    region_index = build_region_index(dielectrics, shields)
+    image_groups = get_image_charges(charges, shields)
+
+    # Lines from positive charges, captured by negative charges
+    positive_paths, captured = trace_seeds(
+        *get_positive_seeds(charge_arrays, seed_fraction, source_arrays),
+        1, charge_arrays, region_index, bounds, -1, step_size, max_steps, source_arrays, image_groups
+    )
+
+    # Negative charges trace only the flux that no positive line reached
+    arrivals = {}
+    record_arrivals(positive_paths, captured, charge_arrays, arrivals, source_arrays)
+    negative_paths, _ = trace_seeds(
+        *get_negative_seeds(charge_arrays, arrivals, seed_fraction, source_arrays),
+        -1, charge_arrays, region_index, bounds, 1, step_size, max_steps, source_arrays, image_groups
+    )
+
+    return [(path, 1) for path in positive_paths] + [(path, -1) for path in negative_paths]
@@ -0,0 +1,456 @@
+import argparse
+import math
+import multiprocessing
+import os
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import pygame
+from matplotlib import colormaps
+from settings import (
+    CHARGE_RADIUS,
+    POSITIVE_COLOR,
+    NEGATIVE_COLOR,
+    LINE_COLOR,
+    LINE_WIDTH,
+    WHITE,
+    BLACK,
+    SHIELD_COLOR,
+    SHIELD_WIDTH,
+    FIELD_LINE_STEP,
+    FIELD_LINE_MAX_STEPS,
+    FIELD_LINE_ARROW_INTERVAL,
+    FIELD_PRECISION,
+    LINE_CHARGE_WIDTH,
+    PLATE_CHARGE_ALPHA,
+    TRACE_MARGIN,
+    EXPORT_TILE_SIZE,
+    EXPORT_WORKERS,
+    EXPORT_TASKS_PER_WORKER,
+    EXPORT_MARGIN,
+    EXPORT_LINE_CHUNK,
+    EXPORT_HEATMAP_PREPASS,
+    EXPORT_HEATMAP_BATCH,
+    EXPORT_PNG_COMPRESSION,
+)
+from electric_field import calculate_field_batch, trace_field_lines_in_bounds
+from field_cache import get_field_grid
+from dielectric import compute_bound_charge_layout
+from line_raster import (
+    ARROW_SIZE,
+    flatten_lines,
+    compute_arrowheads,
+    create_line_layer,
+    rasterize_segments,
+    rasterize_triangles,
+)
+from scene_file import load_scene
+from surface_pool import get_translucent_surface
+
+# Colormap of each heatmap quantity: log10 |E|, or V scaled to [-1, 1]
+HEATMAP_COLORMAPS = {'field': 'inferno', 'potential': 'coolwarm'}
+
+# Everything a tile worker needs, handed over once per worker by init_tile_worker
+tile_worker_state = {}
+
+def write_png_chunk(png_file, kind, data):
+    """
+    Write one length-prefixed, CRC-terminated PNG chunk.
+    """
+    png_file.write(struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data)))
+
+def open_png(path, width, height):
+    """
+    Start a streamed 8-bit RGB PNG. Rows are filtered, compressed and written as they are added,
+    so the image never has to be held in memory.
+    """
+    png_file = open(path, 'wb')
+    png_file.write(b'\x89PNG\r\n\x1a\n')
+    write_png_chunk(png_file, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+    return {
+        'file': png_file,
+        'compressor': zlib.compressobj(EXPORT_PNG_COMPRESSION),
+        'width': width,
+        'height': height,
+        'rows': 0,
+        'previous_row': np.zeros(width * 3, dtype=np.uint8),
+    }
+
+def write_png_rows(png, rows):
+    """
+    Append (n, width, 3) uint8 rows to a streamed PNG, using the Up filter (each byte minus the
+    byte above it), which suits smooth heatmaps and flat backgrounds.
+    """
+    flat = rows.reshape(len(rows), png['width'] * 3)
+    above = np.vstack((png['previous_row'], flat[:-1]))
+    filtered = np.empty((len(rows), flat.shape[1] + 1), dtype=np.uint8)
+    filtered[:, 0] = 2  # Filter type Up
+    filtered[:, 1:] = flat - above  # uint8 arithmetic wraps modulo 256 as PNG expects
+    data = png['compressor'].compress(filtered.tobytes())
+    if data:
+        write_png_chunk(png['file'], b'IDAT', data)
+    png['previous_row'] = flat[-1].copy()
+    png['rows'] += len(rows)
+
+def close_png(png):
+    """
+    Flush the compressor and finish the PNG file.
+    """
+    write_png_chunk(png['file'], b'IDAT', png['compressor'].flush())
+    write_png_chunk(png['file'], b'IEND', b'')
+    png['file'].close()
+    if png['rows'] != png['height']:
+        raise ValueError(f"PNG closed after {png['rows']} of {png['height']} rows")
+
+def get_scene_bounds(scene, margin=EXPORT_MARGIN):
+    """
+    World rectangle (min_x, min_y, max_x, max_y) around every object of the scene, grown by
+    margin of its size on each side. Small scenes get at least the reach of a field line.
+    """
+    charges, dielectrics, shields, line_charges, plate_charges = scene
+    xs = [x for (x, _, _) in charges] + [x for line in line_charges for x in (line[0], line[2])]
+    ys = [y for (_, y, _) in charges] + [y for line in line_charges for y in (line[1], line[3])]
+    for (x, y, width, height, *_) in list(dielectrics) + list(shields) + list(plate_charges):
+        xs += [x, x + width]
+        ys += [y, y + height]
+    if not xs:
+        raise ValueError("The scene is empty; pass explicit bounds to export it")
+    reach = FIELD_LINE_STEP * FIELD_LINE_MAX_STEPS
+    centre_x, centre_y = 0.5 * (min(xs) + max(xs)), 0.5 * (min(ys) + max(ys))
+    half_width = max(0.5 * (max(xs) - min(xs)) * (1 + 2 * margin), 0.5 * reach)
+    half_height = max(0.5 * (max(ys) - min(ys)) * (1 + 2 * margin), 0.5 * reach)
+    return (centre_x - half_width, centre_y - half_height, centre_x + half_width, centre_y + half_height)
+
+def get_export_layout(bounds, width, height=None):
+    """
+    Pixel size, zoom and offsets of an export. Without a height the aspect ratio of bounds is
+    kept; with both sizes the bounds are widened to the image's aspect ratio around their centre.
+    scale is the size of on-screen (zoom 1) pixels in export pixels, used for line widths and marks.
+    """
+    min_x, min_y, max_x, max_y = bounds
+    if height is None:
+        height = max(1, round(width * (max_y - min_y) / (max_x - min_x)))
+    zoom = min(width / (max_x - min_x), height / (max_y - min_y))
+    centre_x, centre_y = 0.5 * (min_x + max_x), 0.5 * (min_y + max_y)
+    return {
+        'width': width,
+        'height': height,
+        'zoom': zoom,
+        'scale': max(1.0, zoom),
+        'offset_x': 0.5 * width - centre_x * zoom,
+        'offset_y': 0.5 * height - centre_y * zoom,
+        'bounds': (
+            centre_x - 0.5 * width / zoom,
+            centre_y - 0.5 * height / zoom,
+            centre_x + 0.5 * width / zoom,
+            centre_y + 0.5 * height / zoom,
+        ),
+    }
+
+def prepare_field_lines(scene, layout):
+    """
+    Trace the field lines for the whole export once and convert them to pixel space, cut into
+    chunks of EXPORT_LINE_CHUNK segments with bounding boxes, so each tile only rasterizes the
+    chunks that touch it. Steps shrink with the export scale so lines stay smooth at any size,
+    while reaching as far and carrying arrowheads as often as on screen.
+    """
+    charges, dielectrics, shields, line_charges, plate_charges = scene
+    scale = layout['scale']
+    min_x, min_y, max_x, max_y = layout['bounds']
+    margin_x = (max_x - min_x) * TRACE_MARGIN
+    margin_y = (max_y - min_y) * TRACE_MARGIN
+    world_lines = trace_field_lines_in_bounds(
+        charges, dielectrics, shields,
+        (min_x - margin_x, min_y - margin_y, max_x + margin_x, max_y + margin_y),
+        FIELD_LINE_STEP / scale, math.ceil(FIELD_LINE_MAX_STEPS * scale),
+        line_charges=line_charges, plate_charges=plate_charges,
+    )
+    vertices, offsets, directions = flatten_lines(world_lines)
+    vertices = vertices.astype(np.float64) * layout['zoom'] + (layout['offset_x'], layout['offset_y'])
+    arrow_size = ARROW_SIZE * scale
+    triangles = compute_arrowheads(
+        vertices, offsets, directions, max(1, round(FIELD_LINE_ARROW_INTERVAL * scale)), arrow_size
+    )
+
+    # Chunks share their end vertex with the start of the next chunk of the same line
+    chunk_starts, chunk_stops = [], []
+    for start, stop in zip(offsets[:-1], offsets[1:]):
+        for chunk_start in range(start, max(start + 1, stop - 1), EXPORT_LINE_CHUNK):
+            chunk_starts.append(chunk_start)
+            chunk_stops.append(min(chunk_start + EXPORT_LINE_CHUNK + 1, stop))
+    chunk_starts = np.array(chunk_starts, dtype=np.int64)
+    chunk_stops = np.array(chunk_stops, dtype=np.int64)
+    boxes = np.array([
+        (*vertices[start:stop].min(axis=0), *vertices[start:stop].max(axis=0))
+        for start, stop in zip(chunk_starts, chunk_stops)
+    ]).reshape(-1, 4)
+    return {
+        'vertices': vertices,
+        'chunk_starts': chunk_starts,
+        'chunk_stops': chunk_stops,
+        'boxes': boxes,
+        'triangles': triangles,
+        'width': max(LINE_WIDTH, round(LINE_WIDTH * scale)),
+        'arrow_size': arrow_size,
+    }
+
+def get_heatmap_range(scene, layout, quantity):
+    """
+    Colour range of a heatmap quantity from a coarse EXPORT_HEATMAP_PREPASS grid over the
+    export, so every tile uses the same scale: the 2nd to 98th percentile of log10 |E|, or the
+    98th percentile of |V|.
+    """
+    charges, dielectrics, shields, line_charges, plate_charges = scene
+    columns = EXPORT_HEATMAP_PREPASS
+    rows = max(2, round(columns * layout['height'] / layout['width']))
+    ex, ey, potential = get_field_grid(
+        layout['bounds'], columns, rows, charges, dielectrics, shields, 'float64', line_charges, plate_charges
+    )
+    if quantity == 'field':
+        with np.errstate(divide='ignore'):
+            values = np.log10(np.hypot(ex, ey))
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return (0.0, 1.0)
+        low, high = np.percentile(values, [2, 98])
+        return (float(low), float(max(high, low + 1e-9)))
+    values = np.abs(potential[np.isfinite(potential)])
+    high = float(np.percentile(values, 98)) if values.size else 0.0
+    return (-high, high) if high > 0 else (-1.0, 1.0)
+
+def draw_heatmap_tile(surface, state, tile_x, tile_y):
+    """
+    Fill a tile with the colour-mapped field magnitude or potential at every pixel centre.
+    """
+    charges, dielectrics, shields, line_charges, plate_charges = state['scene']
+    layout = state['layout']
+    width, height = surface.get_size()
+    pixel_xs = (tile_x + np.arange(width) + 0.5 - layout['offset_x']) / layout['zoom']
+    pixel_ys = (tile_y + np.arange(height) + 0.5 - layout['offset_y']) / layout['zoom']
+    low, high = state['color_range']
+    colormap = colormaps[HEATMAP_COLORMAPS[state['heatmap']]]
+    pixels = pygame.surfarray.pixels3d(surface)
+    try:
+        # Strips of columns keep the field evaluation's temporaries small for large tiles
+        strip_width = max(1, EXPORT_HEATMAP_BATCH // height)
+        for strip_start in range(0, width, strip_width):
+            strip_xs = pixel_xs[strip_start:strip_start + strip_width]
+            world_xs, world_ys = np.meshgrid(strip_xs, pixel_ys, indexing='ij')  # Indexed [x, y] like surfarray
+            ex, ey, potential = calculate_field_batch(
+                world_xs, world_ys, charges, dielectrics, shields, FIELD_PRECISION, line_charges, plate_charges
+            )
+            if state['heatmap'] == 'field':
+                with np.errstate(divide='ignore'):
+                    values = np.log10(np.hypot(ex.astype(np.float64), ey.astype(np.float64)))
+            else:
+                values = potential.astype(np.float64)
+            values = np.nan_to_num(values, nan=high, posinf=high, neginf=low)
+            colors = colormap(np.clip((values - low) / (high - low), 0, 1), bytes=True)
+            pixels[strip_start:strip_start + len(strip_xs)] = colors[..., :3]
+    finally:
+        del pixels  # Unlock the surface
+
+def fill_translucent(surface, rect, color, zoom_level):
+    """
+    Blend a translucent fill into the part of rect that lies on the surface, so huge regions
+    never need a surface larger than the tile.
+    """
+    clipped = rect.clip(surface.get_rect())
+    if clipped.width and clipped.height:
+        surface.blit(get_translucent_surface(clipped.width, clipped.height, color, zoom_level), clipped.topleft)
+
+def world_rect(x, y, width, height, zoom_level, offset_x, offset_y):
+    """
+    Pixel rectangle of a world rectangle.
+    """
+    return pygame.Rect(
+        int(x * zoom_level + offset_x), int(y * zoom_level + offset_y), int(width * zoom_level), int(height * zoom_level)
+    )
+
+def draw_objects_tile(surface, state, offset_x, offset_y, layer):
+    """
+    Draw the scene objects of one layer onto a tile with the on-screen look: 'below' the field
+    lines (charges, line and plate charges, shields) or 'above' them (dielectrics and their
+    bound charges). Outline widths and marks grow with the export scale.
+    """
+    charges, dielectrics, shields, line_charges, plate_charges = state['scene']
+    zoom = state['layout']['zoom']
+    scale = state['layout']['scale']
+    outline = max(1, round(2 * scale))
+    if layer == 'below':
+        for (world_x, world_y, charge_magnitude) in charges:
+            color = POSITIVE_COLOR if charge_magnitude > 0 else NEGATIVE_COLOR
+            center = (int(world_x * zoom + offset_x), int(world_y * zoom + offset_y))
+            pygame.draw.circle(surface, color, center, max(1, int(CHARGE_RADIUS * zoom)))
+        for (x, y, width, height, q) in plate_charges:
+            color = POSITIVE_COLOR if q > 0 else NEGATIVE_COLOR
+            rect = world_rect(x, y, width, height, zoom, offset_x, offset_y)
+            fill_translucent(surface, rect, color + (PLATE_CHARGE_ALPHA,), zoom)
+            pygame.draw.rect(surface, color, rect, outline)
+        for (x1, y1, x2, y2, q) in line_charges:
+            color = POSITIVE_COLOR if q > 0 else NEGATIVE_COLOR
+            pygame.draw.line(
+                surface, color,
+                (x1 * zoom + offset_x, y1 * zoom + offset_y), (x2 * zoom + offset_x, y2 * zoom + offset_y),
+                max(1, int(LINE_CHARGE_WIDTH * zoom)),
+            )
+        for (x, y, width, height) in shields:
+            rect = world_rect(x, y, width, height, zoom, offset_x, offset_y)
+            pygame.draw.rect(surface, SHIELD_COLOR, rect, max(1, round(SHIELD_WIDTH * scale)))
+            fill_translucent(surface, rect, (50, 50, 50, 50), zoom)
+        return
+
+    for (x, y, width, height, epsilon_r) in dielectrics:
+        rect = world_rect(x, y, width, height, zoom, offset_x, offset_y)
+        fill_translucent(surface, rect, (0, 255, 255, 100), zoom)
+        pygame.draw.rect(surface, BLACK, rect, outline)
+        # Bound charges spaced as on screen at zoom 1, then scaled up
+        layout = compute_bound_charge_layout(charges, x, y, width, height, epsilon_r, int(width), int(height))
+        for (dx, dy, color) in layout:
+            center = (int(rect.x + dx * width * zoom / max(1, int(width))), int(rect.y + dy * height * zoom / max(1, int(height))))
+            pygame.draw.circle(surface, color, center, max(1, round(5 * scale)))
+
+def draw_field_lines_tile(surface, lines, tile_x, tile_y):
+    """
+    Rasterize the field line chunks and arrowheads that touch a tile.
+    """
+    width, height = surface.get_size()
+    pad = lines['width'] + lines['arrow_size']
+    boxes = lines['boxes']
+    touching = np.nonzero(
+        (boxes[:, 0] <= tile_x + width + pad) & (boxes[:, 2] >= tile_x - pad)
+        & (boxes[:, 1] <= tile_y + height + pad) & (boxes[:, 3] >= tile_y - pad)
+    )[0]
+    starts = lines['chunk_starts'][touching]
+    lengths = lines['chunk_stops'][touching] - starts
+    within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    vertices = lines['vertices'][np.repeat(starts, lengths) + within] - (tile_x, tile_y)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+    triangles = lines['triangles'] - (tile_x, tile_y)
+    if len(triangles):
+        lows = triangles.min(axis=1)
+        highs = triangles.max(axis=1)
+        triangles = triangles[(highs[:, 0] >= 0) & (lows[:, 0] < width) & (highs[:, 1] >= 0) & (lows[:, 1] < height)]
+
+    layer = create_line_layer((width, height), LINE_COLOR)
+    alpha = pygame.surfarray.pixels_alpha(layer['surface'])
+    try:
+        rasterize_segments(alpha, vertices, offsets, lines['width'])
+        rasterize_triangles(alpha, triangles)
+    finally:
+        del alpha  # Unlock the surface
+    surface.blit(layer['surface'], (0, 0))
+
+def init_tile_worker(state):
+    """
+    Worker initializer: keep the scene, layout and prepared field lines for every tile.
+    """
+    tile_worker_state.update(state)
+
+def render_tile(tile):
+    """
+    Worker: render one tile (column, row, x, y, width, height) on an off-screen surface.
+    Returns (column, row, pixels) with pixels an (height, width, 3) uint8 array.
+    """
+    state = tile_worker_state
+    column, row, tile_x, tile_y, width, height = tile
+    surface = pygame.Surface((width, height))
+    surface.fill(WHITE)
+    offset_x = state['layout']['offset_x'] - tile_x
+    offset_y = state['layout']['offset_y'] - tile_y
+    if state['heatmap']:
+        draw_heatmap_tile(surface, state, tile_x, tile_y)
+    draw_objects_tile(surface, state, offset_x, offset_y, 'below')
+    draw_field_lines_tile(surface, state['lines'], tile_x, tile_y)
+    draw_objects_tile(surface, state, offset_x, offset_y, 'above')
+    return column, row, np.ascontiguousarray(pygame.surfarray.pixels3d(surface).transpose(1, 0, 2))
+
+def export_image(scene, output_path, width, height=None, bounds=None, heatmap=None,
+                 tile_size=EXPORT_TILE_SIZE, workers=EXPORT_WORKERS):
+    """
+    Render a scene (charges, dielectrics, shields, line_charges, plate_charges) to a PNG of
+    width x height pixels covering the world rectangle bounds (default: the whole scene).
+    heatmap is None, 'field' (log |E|) or 'potential'. Tiles are rendered over a process pool
+    and each finished band of tiles is streamed to the PNG, so memory holds a bounded number
+    of tiles rather than the whole image. Returns the export layout.
+    """
+    layout = get_export_layout(bounds or get_scene_bounds(scene), width, height)
+    width, height = layout['width'], layout['height']
+    state = {
+        'scene': scene,
+        'layout': layout,
+        'lines': prepare_field_lines(scene, layout),
+        'heatmap': heatmap,
+        'color_range': get_heatmap_range(scene, layout, heatmap) if heatmap else None,
+    }
+    columns = math.ceil(width / tile_size)
+    rows = math.ceil(height / tile_size)
+    tiles = (
+        (column, row, column * tile_size, row * tile_size,
+         min(tile_size, width - column * tile_size), min(tile_size, height - row * tile_size))
+        for row in range(rows) for column in range(columns)
+    )
+    print(f"Exporting {width} x {height} pixels as {columns} x {rows} tiles to {output_path}")
+
+    png = open_png(output_path, width, height)
+    finished = {}  # Rendered tiles waiting for the rest of their band
+    progress = {'row': 0}
+    workers = workers or os.cpu_count() or 1
+    try:
+        # Spawned rather than forked workers: the field lines were just traced with numba's
+        # parallel kernels, whose thread pool does not survive a fork
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_tile_worker, initargs=(state,),
+        ) as pool:
+
+            def write_finished(futures):
+                # Wait for at least one tile, then stream every band that is complete
+                done, still_running = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    column, row, pixels = future.result()
+                    finished[(column, row)] = pixels
+                while all((column, progress['row']) in finished for column in range(columns)):
+                    band = [finished.pop((column, progress['row'])) for column in range(columns)]
+                    write_png_rows(png, np.concatenate(band, axis=1))
+                    progress['row'] += 1
+                    print(f"Export progress: {progress['row']}/{rows} tile rows")
+                    if progress['row'] == rows:
+                        break
+                return still_running
+
+            # Bound the tiles in flight plus those buffered for an unfinished band
+            in_flight = set()
+            for tile in tiles:
+                while len(in_flight) + len(finished) >= workers * EXPORT_TASKS_PER_WORKER + columns:
+                    in_flight = write_finished(in_flight)
+                in_flight.add(pool.submit(render_tile, tile))
+            while in_flight:
+                in_flight = write_finished(in_flight)
+    finally:
+        close_png(png)
+    print(f"Export written to {output_path}")
+    return layout
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=(
+        "Render a scene file to a high-resolution PNG in parallel off-screen tiles, streamed to "
+        "disk as they finish."
+    ))
+    parser.add_argument('scene', help="scene file (JSON, as saved with Ctrl+S)")
+    parser.add_argument('output', help="PNG file to write")
+    parser.add_argument('--width', type=int, default=7680, help="image width in pixels (default: 7680)")
+    parser.add_argument('--height', type=int, help="image height in pixels (default: from the bounds)")
+    parser.add_argument('--bounds', type=float, nargs=4, metavar=('MIN_X', 'MIN_Y', 'MAX_X', 'MAX_Y'),
+                        help="world rectangle to render (default: the whole scene)")
+    parser.add_argument('--heatmap', choices=sorted(HEATMAP_COLORMAPS), help="colour the background by |E| or V")
+    parser.add_argument('--tile-size', type=int, default=EXPORT_TILE_SIZE, help="tile edge in pixels")
+    parser.add_argument('--workers', type=int, default=EXPORT_WORKERS, help="worker processes (default: CPU count)")
+    arguments = parser.parse_args()
+    export_image(
+        load_scene(arguments.scene), arguments.output, arguments.width, arguments.height,
+        tuple(arguments.bounds) if arguments.bounds else None, arguments.heatmap,
+        arguments.tile_size, arguments.workers,
+    )
@@ -0,0 +1,195 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import numpy as np
+from settings import (
+    CHARGE_RADIUS,
+    NUM_FIELD_LINES,
+    FIELD_LINE_STEP,
+    FIELD_LINE_UNIT_CHARGE,
+    FIELD_LINE_MAX_STEPS,
+    FIELD_LINE_MAX_CROSSINGS,
+    FIELD_PRECISION,
+    SOURCE_QUADRATURE_ORDERS,
+    SOURCE_QUADRATURE_TOLERANCE,
+    STREAMLINE_SEPARATION,
+    STREAMLINE_TEST_RATIO,
+    STREAMLINE_MAX_STEPS,
+    STREAMLINE_CHARGE_SEEDS,
+    STREAMLINE_TILE_NODES,
+    IMAGE_CHARGES_ENABLED,
+    IMAGE_CHARGE_EDGE_RATIO,
+    ZOOM_STEP,
+    FIELD_CACHE_ENABLED,
+    FIELD_CACHE_DIR,
+    FIELD_CACHE_MAX_MB,
+    GRID_POOL_MIN_POINTS,
+)
+from electric_field import calculate_field_grid
+from grid_pool import evaluate_grid, get_worker_count
+
+# Bump whenever the stored arrays or the solver change meaning, so old entries are never read
+FIELD_CACHE_FORMAT_VERSION = 2
+
+def get_cache_key(kind, *content):
+    """
+    Content address of a cache entry: a SHA-256 of the format version, the entry kind and the
+    repr of everything the computation depends on.
+    """
+    digest = hashlib.sha256(repr((FIELD_CACHE_FORMAT_VERSION, kind) + content).encode())
+    return digest.hexdigest()
+
+def get_solver_settings():
+    """
+    Settings that change computed grids or traces, for inclusion in cache keys.
+    """
+    return (
+        CHARGE_RADIUS,
+        NUM_FIELD_LINES,
+        FIELD_LINE_STEP,
+        FIELD_LINE_UNIT_CHARGE,
+        FIELD_LINE_MAX_STEPS,
+        FIELD_LINE_MAX_CROSSINGS,
+        FIELD_PRECISION,
+        SOURCE_QUADRATURE_ORDERS,
+        SOURCE_QUADRATURE_TOLERANCE,
+        STREAMLINE_SEPARATION,
+        STREAMLINE_TEST_RATIO,
+        STREAMLINE_MAX_STEPS,
+        STREAMLINE_CHARGE_SEEDS,
+        STREAMLINE_TILE_NODES,
+        IMAGE_CHARGES_ENABLED,
+        IMAGE_CHARGE_EDGE_RATIO,
+    )
+
+def get_trace_cache_key(charges, dielectrics, shields, trace_bounds, zoom_level, lod, line_charges=(), plate_charges=(),
+                        layout='charges'):
+    """
+    Cache key of the field lines traced for a scene within trace_bounds at a level of detail
+    and in a field line layout.
+    """
+    return get_cache_key(
+        'field_lines',
+        tuple(charges), tuple(dielectrics), tuple(shields), tuple(line_charges), tuple(plate_charges),
+        tuple(float(bound) for bound in trace_bounds),
+        round(zoom_level / ZOOM_STEP),  # Zoom bucket
+        tuple(sorted(lod.items())),
+        layout,
+        get_solver_settings(),
+    )
+
+def get_entry_path(key):
+    """
+    Directory holding the arrays of a cache entry.
+    """
+    return os.path.join(FIELD_CACHE_DIR, key)
+
+def load_arrays(key):
+    """
+    Return the named arrays of a cache entry, memory-mapped read-only, or None on a miss.
+    A hit marks the entry as recently used.
+    """
+    if not FIELD_CACHE_ENABLED:
+        return None
+    path = get_entry_path(key)
+    try:
+        arrays = {
+            name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode='r')
+            for name in os.listdir(path) if name.endswith('.npy')
+        }
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    return arrays or None
+
+def store_arrays(key, arrays):
+    """
+    Write the named arrays as a cache entry, then evict the least recently used entries beyond
+    FIELD_CACHE_MAX_MB. The entry is written to a temporary directory and renamed into place,
+    so readers never see a partial entry.
+    """
+    if not FIELD_CACHE_ENABLED:
+        return
+    try:
+        os.makedirs(FIELD_CACHE_DIR, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=FIELD_CACHE_DIR, prefix='.staging-')
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, name + '.npy'), np.ascontiguousarray(array))
+        try:
+            os.rename(staging, get_entry_path(key))
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)  # Another writer stored the same entry first
+        evict_entries(FIELD_CACHE_MAX_MB * 1024 * 1024)
+    except OSError as error:
+        print(f"Field cache write failed: {error}")
+
+def evict_entries(max_bytes):
+    """
+    Delete the least recently used entries until the cache takes at most max_bytes.
+    """
+    entries = []
+    total = 0
+    for name in os.listdir(FIELD_CACHE_DIR):
+        path = os.path.join(FIELD_CACHE_DIR, name)
+        if name.startswith('.') or not os.path.isdir(path):
+            continue
+        size = sum(entry.stat().st_size for entry in os.scandir(path))
+        entries.append((os.stat(path).st_mtime, size, path))
+        total += size
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+def load_field_lines(key):
+    """
+    Cached world-space field lines as a list of (path, direction), or None on a miss.
+    The paths are views into the memory-mapped vertex array.
+    """
+    arrays = load_arrays(key)
+    if arrays is None:
+        return None
+    vertices, offsets, directions = arrays['vertices'], arrays['offsets'], arrays['directions']
+    return [
+        (vertices[offsets[i]:offsets[i + 1]], int(directions[i]))
+        for i in range(len(directions))
+    ]
+
+def store_field_lines(key, world_lines):
+    """
+    Store (path, direction) field lines as flat vertex, offset and direction arrays.
+    """
+    lengths = [len(path) for path, _ in world_lines]
+    store_arrays(key, {
+        'vertices': np.concatenate([path for path, _ in world_lines]) if world_lines else np.zeros((0, 2)),
+        'offsets': np.concatenate(([0], np.cumsum(lengths, dtype=np.int64))),
+        'directions': np.array([direction for _, direction in world_lines], dtype=np.int64),
+    })
+
+def get_field_grid(bounds, columns, rows, charges, dielectrics, shields, precision=FIELD_PRECISION,
+                   line_charges=(), plate_charges=(), use_pool=True):
+    """
+    calculate_field_grid, served from the disk cache when the same grid was computed before.
+    Large grids are computed over the grid worker pool when more than one CPU is available,
+    unless use_pool is False (e.g. in callers that already run one process per CPU).
+    Returns memory-mapped Ex, Ey and V arrays on a hit.
+    """
+    key = get_cache_key(
+        'field_grid',
+        tuple(charges), tuple(dielectrics), tuple(shields), tuple(line_charges), tuple(plate_charges),
+        tuple(float(bound) for bound in bounds), columns, rows, precision,
+        get_solver_settings(),
+    )
+    arrays = load_arrays(key)
+    if arrays is not None:
+        return arrays['Ex'], arrays['Ey'], arrays['V']
+    evaluate = calculate_field_grid
+    if use_pool and columns * rows >= GRID_POOL_MIN_POINTS and get_worker_count() > 1:
+        evaluate = evaluate_grid
+    ex, ey, potential = evaluate(
+        bounds, columns, rows, charges, dielectrics, shields, precision, line_charges, plate_charges
+    )
+    store_arrays(key, {'Ex': ex, 'Ey': ey, 'V': potential})
+    return ex, ey, potential
@@ -0,0 +1,138 @@
+import math
+import numpy as np
+from settings import (
+    REGION_INDEX_CELL_SIZE,
+    REGION_INDEX_MAX_CELLS,
+)
+
+CROSSING_EPSILON = 1e-9  # Crossings closer than this (in segment parameter) to the start are ignored
+
+def build_region_index(dielectrics, shields, cell_size=REGION_INDEX_CELL_SIZE):
+    """
+    Build a uniform-grid spatial index over the dielectric and shield rectangles.
+    Rectangles covering more than REGION_INDEX_MAX_CELLS cells are kept in a separate list and
+    are candidates for every query.
+    """
+    rects, epsilon_r, is_shield = [], [], []
+    for (x, y, width, height, dielectric_epsilon) in dielectrics:
+        rects.append((x, y, x + width, y + height))
+        epsilon_r.append(dielectric_epsilon)
+        is_shield.append(False)
+    for (x, y, width, height) in shields:
+        rects.append((x, y, x + width, y + height))
+        epsilon_r.append(1e9)  # Simulate conductor with very high epsilon
+        is_shield.append(True)
+
+    cells = {}
+    large = []
+    for rect_id, (x1, y1, x2, y2) in enumerate(rects):
+        cell_x1, cell_x2 = math.floor(x1 / cell_size), math.floor(x2 / cell_size)
+        cell_y1, cell_y2 = math.floor(y1 / cell_size), math.floor(y2 / cell_size)
+        if (cell_x2 - cell_x1 + 1) * (cell_y2 - cell_y1 + 1) > REGION_INDEX_MAX_CELLS:
+            large.append(rect_id)
+            continue
+        for cell_x in range(cell_x1, cell_x2 + 1):
+            for cell_y in range(cell_y1, cell_y2 + 1):
+                cells.setdefault((cell_x, cell_y), []).append(rect_id)
+
+    rects = np.array(rects, dtype=np.float64).reshape(-1, 4)
+    extent = (
+        (rects[:, 0].min(), rects[:, 1].min(), rects[:, 2].max(), rects[:, 3].max())
+        if len(rects) else None
+    )
+    return {
+        'rects': rects,
+        'extent': extent,  # Bounding box of all the rectangles
+        'epsilon_r': np.array(epsilon_r, dtype=np.float64),
+        'is_shield': np.array(is_shield, dtype=bool),
+        'cell_size': cell_size,
+        'cells': cells,
+        'large': large,
+    }
+
+def query_region_index(index, start_xs, start_ys, end_xs, end_ys):
+    """
+    Candidate rectangle ids for a batch of segments. Segments are expected to be shorter than a
+    cell, so the cells under their bounding-box corners cover them; otherwise every rectangle
+    is returned.
+    """
+    if len(index['rects']) == 0 or start_xs.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    low_xs, high_xs = np.minimum(start_xs, end_xs), np.maximum(start_xs, end_xs)
+    low_ys, high_ys = np.minimum(start_ys, end_ys), np.maximum(start_ys, end_ys)
+    extent_x1, extent_y1, extent_x2, extent_y2 = index['extent']
+    near = (high_xs >= extent_x1) & (low_xs <= extent_x2) & (high_ys >= extent_y1) & (low_ys <= extent_y2)
+    if not near.any():
+        return np.zeros(0, dtype=np.int64)
+
+    cell_size = index['cell_size']
+    low_xs, high_xs, low_ys, high_ys = low_xs[near], high_xs[near], low_ys[near], high_ys[near]
+    if max((high_xs - low_xs).max(), (high_ys - low_ys).max()) > cell_size:
+        return np.arange(len(index['rects']))
+    cell_x1 = np.floor(low_xs / cell_size).astype(np.int64).tolist()
+    cell_x2 = np.floor(high_xs / cell_size).astype(np.int64).tolist()
+    cell_y1 = np.floor(low_ys / cell_size).astype(np.int64).tolist()
+    cell_y2 = np.floor(high_ys / cell_size).astype(np.int64).tolist()
+    corners = set(zip(cell_x1, cell_y1))
+    corners.update(zip(cell_x1, cell_y2), zip(cell_x2, cell_y1), zip(cell_x2, cell_y2))
+
+    candidates = set(index['large'])
+    for key in corners:
+        candidates.update(index['cells'].get(key, ()))
+    return np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+
+def first_crossings(start_xs, start_ys, end_xs, end_ys, rects):
+    """
+    Vectorized Liang-Barsky test of every segment against every rectangle.
+    For each segment returns (t, rect, axis): the segment parameter in (0, 1] of its first
+    boundary crossing (entering or leaving a rectangle), the column of that rectangle in rects,
+    and the axis of the crossed side's normal (0 for a vertical side, 1 for a horizontal one).
+    t is infinite for segments that cross nothing.
+    """
+    count = start_xs.size
+    if len(rects) == 0 or count == 0:
+        return np.full(count, np.inf), np.zeros(count, dtype=np.int64), np.zeros(count, dtype=np.int64)
+
+    def slab(start, end, low, high):
+        delta = (end - start)[:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_low = (low[None, :] - start[:, None]) / delta
+            t_high = (high[None, :] - start[:, None]) / delta
+        t_in = np.minimum(t_low, t_high)
+        t_out = np.maximum(t_low, t_high)
+        # Segments parallel to the slab are inside it for all t, or never
+        parallel = delta == 0
+        inside = (low[None, :] <= start[:, None]) & (start[:, None] <= high[None, :])
+        t_in = np.where(parallel, np.where(inside, -np.inf, np.inf), t_in)
+        t_out = np.where(parallel, np.where(inside, np.inf, -np.inf), t_out)
+        return t_in, t_out
+
+    tx_in, tx_out = slab(start_xs, end_xs, rects[:, 0], rects[:, 2])
+    ty_in, ty_out = slab(start_ys, end_ys, rects[:, 1], rects[:, 3])
+    t_enter = np.maximum(tx_in, ty_in)
+    t_exit = np.minimum(tx_out, ty_out)
+    overlap = t_enter <= t_exit
+
+    entering = overlap & (t_enter > CROSSING_EPSILON) & (t_enter <= 1)
+    leaving = overlap & ~entering & (t_exit > CROSSING_EPSILON) & (t_exit <= 1)
+    t = np.where(entering, t_enter, np.where(leaving, t_exit, np.inf))
+    axis = np.where(entering, tx_in < ty_in, tx_out > ty_out).astype(np.int64)
+
+    rect = t.argmin(axis=1)
+    rows = np.arange(count)
+    return t[rows, rect], rect, axis[rows, rect]
+
+def region_permittivity(index, xs, ys):
+    """
+    Relative permittivity at world points from the indexed rectangles, with the same rules as
+    get_relative_permittivity: the first dielectric containing a point wins and shields override.
+    """
+    epsilon_r = np.ones(xs.shape)
+    assigned = np.zeros(xs.shape, dtype=bool)
+    for (x1, y1, x2, y2), rect_epsilon, shield in zip(index['rects'], index['epsilon_r'], index['is_shield']):
+        inside = (x1 <= xs) & (xs <= x2) & (y1 <= ys) & (ys <= y2)
+        if not shield:
+            inside &= ~assigned
+            assigned |= inside
+        epsilon_r[inside] = rect_epsilon
+    return epsilon_r
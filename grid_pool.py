@@ -0,0 +1,318 @@
+import argparse
+import math
+import multiprocessing
+import multiprocessing.util
+import os
+import queue
+import time
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+from settings import FIELD_PRECISION, GRID_POOL_WORKERS, GRID_POOL_TILE_ROWS, GRID_POOL_RESULT_TIMEOUT
+from electric_field import calculate_field_batch, calculate_field_grid, get_scene_key
+import kernels
+
+# Float64 header of a published scene: the entry count of each kind, then the grid to evaluate
+SCENE_HEADER = (
+    'charges', 'dielectrics', 'shields', 'line_charges', 'plate_charges',
+    'min_x', 'min_y', 'max_x', 'max_y', 'columns', 'rows', 'tile_rows', 'precision', 'output_version',
+)
+# Values per entry of each kind, in the order they follow the header
+SCENE_ENTRY_SIZES = {'charges': 3, 'dielectrics': 5, 'shields': 4, 'line_charges': 5, 'plate_charges': 5}
+PRECISIONS = ('float64', 'float32')
+
+# Parent side of the pool: worker processes, their queues and the shared blocks published last
+grid_pool = {
+    'workers': [],
+    'tasks': None,
+    'results': None,
+    'prefix': None,
+    'version': 0,
+    'key': None,
+    'scene_block': None,
+    'output_block': None,
+    'output_version': 0,
+    'output_layout': None,
+}
+
+def get_worker_count(workers=GRID_POOL_WORKERS):
+    """
+    Number of grid workers to run; None means one per CPU.
+    """
+    return workers or os.cpu_count() or 1
+
+def pack_scene(scene, bounds, columns, rows, precision, output_version):
+    """
+    Flatten a scene dict (see SCENE_ENTRY_SIZES) and the grid to evaluate into one float64 array.
+    """
+    header = {kind: len(scene[kind]) for kind in SCENE_ENTRY_SIZES}
+    header.update(zip(('min_x', 'min_y', 'max_x', 'max_y'), bounds))
+    header.update(
+        columns=columns, rows=rows, tile_rows=GRID_POOL_TILE_ROWS,
+        precision=PRECISIONS.index(precision), output_version=output_version,
+    )
+    parts = [np.array([header[name] for name in SCENE_HEADER], dtype=np.float64)]
+    for kind, size in SCENE_ENTRY_SIZES.items():
+        parts.append(np.array(scene[kind], dtype=np.float64).reshape(-1, size).ravel())
+    return np.concatenate(parts)
+
+def unpack_scene(values):
+    """
+    Inverse of pack_scene. Returns the scene dict (lists of tuples) and the header dict.
+    """
+    header = dict(zip(SCENE_HEADER, values[:len(SCENE_HEADER)].tolist()))
+    position = len(SCENE_HEADER)
+    scene = {}
+    for kind, size in SCENE_ENTRY_SIZES.items():
+        count = int(header[kind])
+        entries = values[position:position + count * size].reshape(count, size)
+        scene[kind] = [tuple(entry) for entry in entries.tolist()]
+        position += count * size
+    return scene, header
+
+def get_output_array(block, rows, columns, precision):
+    """
+    (3, rows, columns) view of Ex, Ey and V in a shared output block.
+    """
+    return np.ndarray((3, rows, columns), dtype=np.dtype(precision), buffer=block.buf)
+
+def release_block(block, unlink=False):
+    """
+    Close a shared memory block, and unlink it when this process created it.
+    """
+    if block is None:
+        return
+    block.close()
+    if unlink:
+        block.unlink()
+
+def start_grid_pool(workers=GRID_POOL_WORKERS):
+    """
+    Start the persistent grid workers. They stay alive across frames and are stopped at exit.
+    """
+    stop_grid_pool()
+    # Spawned rather than forked: numba's parallel thread pool in this process does not survive a fork
+    context = multiprocessing.get_context('spawn')
+    grid_pool['prefix'] = f"field_grid_{os.getpid()}_"
+    grid_pool['tasks'] = context.Queue()
+    grid_pool['results'] = context.Queue()
+    grid_pool['workers'] = [
+        context.Process(
+            target=run_grid_worker, args=(grid_pool['prefix'], grid_pool['tasks'], grid_pool['results']), daemon=True
+        )
+        for _ in range(get_worker_count(workers))
+    ]
+    for worker in grid_pool['workers']:
+        worker.start()
+    # Unlike atexit, multiprocessing finalizers also run when the pool was started inside a
+    # worker process (e.g. a sweep worker), which leaves through os._exit
+    multiprocessing.util.Finalize(None, stop_grid_pool, exitpriority=10)
+
+def stop_grid_pool():
+    """
+    Stop the grid workers and free the shared memory blocks.
+    """
+    for _ in grid_pool['workers']:
+        grid_pool['tasks'].put(None)
+    for worker in grid_pool['workers']:
+        worker.join(timeout=5)
+        if worker.is_alive():
+            worker.terminate()
+    release_block(grid_pool['scene_block'], unlink=True)
+    release_block(grid_pool['output_block'], unlink=True)
+    grid_pool.update(workers=[], tasks=None, results=None, key=None, scene_block=None, output_block=None, output_layout=None)
+
+def publish_grid(bounds, columns, rows, precision, scene):
+    """
+    Publish the scene and grid in shared memory under a new version when they changed since the
+    last call, allocating a new output block when the grid's shape or precision changed.
+    Returns the current version.
+    """
+    key = (get_scene_key(*scene.values()), tuple(float(bound) for bound in bounds), columns, rows, precision)
+    if key == grid_pool['key']:
+        return grid_pool['version']
+
+    output_layout = (rows, columns, precision)
+    if output_layout != grid_pool['output_layout']:
+        release_block(grid_pool['output_block'], unlink=True)
+        grid_pool['output_version'] += 1
+        grid_pool['output_block'] = shared_memory.SharedMemory(
+            name=f"{grid_pool['prefix']}o{grid_pool['output_version']}", create=True,
+            size=max(1, 3 * rows * columns * np.dtype(precision).itemsize),
+        )
+        grid_pool['output_layout'] = output_layout
+
+    packed = pack_scene(scene, bounds, columns, rows, precision, grid_pool['output_version'])
+    release_block(grid_pool['scene_block'], unlink=True)
+    grid_pool['version'] += 1
+    grid_pool['scene_block'] = shared_memory.SharedMemory(
+        name=f"{grid_pool['prefix']}s{grid_pool['version']}", create=True, size=packed.nbytes
+    )
+    np.ndarray(packed.shape, dtype=np.float64, buffer=grid_pool['scene_block'].buf)[:] = packed
+    grid_pool['key'] = key
+    return grid_pool['version']
+
+def wait_for_tiles(version, tile_count):
+    """
+    Collect the completion of tile_count tiles of a version, raising if a worker failed or died.
+    Results of abandoned versions are dropped. After a failure the other tiles of the version
+    may still be queued and run, so the next publish_grid allocates a new output block for them
+    not to overwrite.
+    """
+    remaining = tile_count
+    while remaining:
+        try:
+            result_version, tile, error = grid_pool['results'].get(timeout=GRID_POOL_RESULT_TIMEOUT)
+        except queue.Empty:
+            if not all(worker.is_alive() for worker in grid_pool['workers']):
+                stop_grid_pool()
+                raise RuntimeError("A grid worker exited unexpectedly")
+            continue
+        if result_version != version:
+            continue
+        if error is not None:
+            # Republish next time, in case the shared blocks are at fault, into a fresh output block
+            grid_pool['key'] = None
+            grid_pool['output_layout'] = None
+            raise RuntimeError(f"Grid tile {tile} failed in a worker:\n{error}")
+        remaining -= 1
+
+def evaluate_grid(bounds, columns, rows, charges, dielectrics, shields, precision=FIELD_PRECISION,
+                  line_charges=(), plate_charges=()):
+    """
+    calculate_field_grid split into tiles of GRID_POOL_TILE_ROWS rows over the persistent
+    worker pool. The scene is published once per change through shared memory, workers receive
+    only (version, tile) and write straight into a shared output buffer.
+    Returns Ex, Ey and V arrays of shape (rows, columns) in the given precision.
+    """
+    if not grid_pool['workers']:
+        start_grid_pool()
+    scene = {
+        'charges': charges, 'dielectrics': dielectrics, 'shields': shields,
+        'line_charges': line_charges, 'plate_charges': plate_charges,
+    }
+    version = publish_grid(bounds, columns, rows, precision, scene)
+    tile_count = math.ceil(rows / GRID_POOL_TILE_ROWS)
+    for tile in range(tile_count):
+        grid_pool['tasks'].put((version, tile))
+    wait_for_tiles(version, tile_count)
+    output = get_output_array(grid_pool['output_block'], rows, columns, precision)
+    ex, ey, potential = output.copy()  # The shared buffer is reused by the next call
+    del output
+    return ex, ey, potential
+
+def attach_version(worker, prefix, version):
+    """
+    Worker: read the scene of a version from shared memory, and attach its output block if it
+    changed.
+    """
+    scene_block = shared_memory.SharedMemory(name=f"{prefix}s{version}")
+    try:
+        scene, header = unpack_scene(np.ndarray((scene_block.size // 8,), dtype=np.float64, buffer=scene_block.buf))
+    finally:
+        scene_block.close()
+    if header['output_version'] != worker['output_version']:
+        worker['output'] = None
+        release_block(worker['output_block'])
+        worker['output_block'] = shared_memory.SharedMemory(name=f"{prefix}o{int(header['output_version'])}")
+        worker['output_version'] = header['output_version']
+    rows, columns = int(header['rows']), int(header['columns'])
+    precision = PRECISIONS[int(header['precision'])]
+    worker.update(
+        version=version,
+        scene=scene,
+        header=header,
+        precision=precision,
+        output=get_output_array(worker['output_block'], rows, columns, precision),
+    )
+
+def evaluate_tile(worker, tile):
+    """
+    Worker: evaluate one band of grid rows into the shared output.
+    """
+    header = worker['header']
+    rows, columns, tile_rows = int(header['rows']), int(header['columns']), int(header['tile_rows'])
+    start, stop = tile * tile_rows, min((tile + 1) * tile_rows, rows)
+    # The same nodes calculate_field_grid evaluates
+    grid_xs, grid_ys = np.meshgrid(
+        np.linspace(header['min_x'], header['max_x'], columns),
+        np.linspace(header['min_y'], header['max_y'], rows)[start:stop],
+    )
+    scene = worker['scene']
+    worker['output'][:, start:stop] = calculate_field_batch(
+        grid_xs, grid_ys, scene['charges'], scene['dielectrics'], scene['shields'], worker['precision'],
+        scene['line_charges'], scene['plate_charges'],
+    )
+
+def run_grid_worker(prefix, tasks, results):
+    """
+    Worker process: evaluate (version, tile) tasks until None arrives.
+    """
+    if kernels.numba is not None:
+        kernels.numba.set_num_threads(1)  # The pool provides the parallelism
+    worker = {'version': None, 'output_version': None, 'output_block': None, 'output': None}
+    try:
+        for version, tile in iter(tasks.get, None):
+            try:
+                if version != worker['version']:
+                    attach_version(worker, prefix, version)
+                evaluate_tile(worker, tile)
+                results.put((version, tile, None))
+            except Exception:
+                results.put((version, tile, traceback.format_exc()))
+    finally:
+        worker['output'] = None
+        release_block(worker['output_block'])
+
+def benchmark_grid_pool(columns, rows, charge_count, worker_counts, precision=FIELD_PRECISION, repeats=3):
+    """
+    Time a columns x rows grid over a random scene in-process and over pools of each size,
+    printing the best of repeats and the speedup. Returns {workers: seconds}, 1 being in-process.
+    """
+    rng = np.random.default_rng(0)
+    charges = [
+        (float(x), float(y), float(q))
+        for x, y, q in zip(rng.uniform(0, 1000, charge_count), rng.uniform(0, 600, charge_count), rng.choice([-1.0, 1.0], charge_count))
+    ]
+    dielectrics = [(100.0, 100.0, 200.0, 150.0, 4.0)]
+    shields = [(600.0, 300.0, 120.0, 80.0)]
+    bounds = (0.0, 0.0, 1000.0, 600.0)
+
+    def best_time(evaluate):
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = evaluate(bounds, columns, rows, charges, dielectrics, shields, precision)
+            times.append(time.perf_counter() - start)
+        return min(times), result
+
+    print(f"{columns} x {rows} grid, {charge_count} charges, {precision}, {kernels.get_field_backend()} backend")
+    best_time(calculate_field_grid)  # Warm up any JIT compilation
+    single_time, reference = best_time(calculate_field_grid)
+    print(f"  single process: {single_time * 1000:.0f} ms")
+    timings = {1: single_time}
+    for workers in worker_counts:
+        start_grid_pool(workers)
+        best_time(evaluate_grid)  # Worker start-up and the first publication are not timed
+        pool_time, result = best_time(evaluate_grid)
+        stop_grid_pool()
+        difference = max(
+            float(np.nanmax(np.abs(pooled.astype(np.float64) - single)) / np.nanmax(np.abs(single)))
+            for pooled, single in zip(result, reference)
+        )
+        print(
+            f"  {workers} worker(s): {pool_time * 1000:.0f} ms, "
+            f"speedup {single_time / pool_time:.2f}x, max difference {difference:.1e} of the largest value"
+        )
+        timings[workers] = pool_time
+    return timings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the shared-memory grid pool against the single-process grid.")
+    parser.add_argument('--size', type=int, nargs=2, default=(3840, 2160), metavar=('COLUMNS', 'ROWS'))
+    parser.add_argument('--charges', type=int, default=50, help="random charges in the scene")
+    parser.add_argument('--workers', type=int, nargs='+', default=[get_worker_count()], help="pool sizes to time")
+    parser.add_argument('--precision', choices=PRECISIONS, default=FIELD_PRECISION)
+    parser.add_argument('--repeats', type=int, default=3)
+    arguments = parser.parse_args()
+    benchmark_grid_pool(*arguments.size, arguments.charges, arguments.workers, arguments.precision, arguments.repeats)
@@ -0,0 +1,39 @@
+import pygame
+
+# Functions the main loop reads input and time through. replay.py swaps these out to record
+# a session or to play one back with a deterministic clock.
+input_source = {}
+
+def reset_input_source():
+    """
+    Read input and time live from pygame.
+    """
+    input_source.update(
+        get_events=pygame.event.get,
+        get_mouse_pos=pygame.mouse.get_pos,
+        get_mods=pygame.key.get_mods,
+        get_ticks=pygame.time.get_ticks,
+    )
+
+def set_input_source(**functions):
+    """
+    Replace some of get_events, get_mouse_pos, get_mods and get_ticks.
+    """
+    input_source.update(functions)
+
+def get_events():
+    """
+    Events since the last call; the main loop calls this exactly once per frame.
+    """
+    return input_source['get_events']()
+
+def get_mouse_pos():
+    return input_source['get_mouse_pos']()
+
+def get_mods():
+    return input_source['get_mods']()
+
+def get_ticks():
+    return input_source['get_ticks']()
+
+reset_input_source()
@@ -0,0 +1,267 @@
+import math
+import os
+import numpy as np
+from settings import (
+    COULOMB_CONSTANT,
+    CHARGE_RADIUS,
+    FIELD_BACKEND,
+    FIELD_PRECISION,
+)
+
+try:
+    import numba
+except ImportError:  # The JIT backend is optional; the NumPy code paths are used without it
+    numba = None
+
+prange = numba.prange if numba is not None else range
+
+# Selected backend: 'numba' (compiled loop kernels), 'python' (the same loops, interpreted) or 'numpy'
+backend = {'name': None, 'coulomb_sum': None, 'trace': None}
+compiled_kernels = {}
+
+def coulomb_sum_loops(points_x, points_y, xs, ys, qs, coulomb_constant):
+    """
+    Loop version of electric_field.coulomb_sum, parallel over the points.
+    Sums are accumulated in float64 and stored in the dtype of points_x.
+    """
+    count = points_x.size
+    ex = np.zeros(count, dtype=points_x.dtype)
+    ey = np.zeros(count, dtype=points_x.dtype)
+    potential = np.zeros(count, dtype=points_x.dtype)
+    for i in prange(count):
+        sum_x = 0.0
+        sum_y = 0.0
+        sum_v = 0.0
+        for j in range(xs.size):
+            dx = points_x[i] - xs[j]
+            dy = points_y[i] - ys[j]
+            r_squared = dx * dx + dy * dy
+            if r_squared == 0:
+                continue  # Skip charges sitting exactly on a point
+            r = math.sqrt(r_squared)
+            kq_over_r = coulomb_constant * qs[j] / r
+            e_over_r = kq_over_r / r_squared
+            sum_x += e_over_r * dx
+            sum_y += e_over_r * dy
+            sum_v += kq_over_r
+        ex[i] = sum_x
+        ey[i] = sum_y
+        potential[i] = sum_v
+    return ex, ey, potential
+
+def trace_seeds_loops(points, seed_xs, seed_ys, direction, xs, ys, qs, rects, rect_epsilon, rect_shield, bounds,
+                      capture_sign, capture_radius, step_size, max_steps, max_crossings):
+    """
+    Loop version of electric_field.iterate_trace_seeds, tracing each seed to completion in
+    parallel. Every step is clipped against all the rectangles directly, which is cheaper in
+    compiled code than an index lookup for the handful of regions a scene has.
+    Points are written to the (count, 1 + max_steps * (1 + max_crossings), 2) buffer points,
+    in its dtype; stepping itself is always float64.
+    Returns (lengths, captured), where line i is points[i, :lengths[i]].
+    """
+    count = seed_xs.size
+    lengths = np.zeros(count, dtype=np.int64)
+    captured = np.full(count, -1, dtype=np.int64)
+    min_x, min_y, max_x, max_y = bounds[0], bounds[1], bounds[2], bounds[3]
+
+    for s in prange(count):
+        x = seed_xs[s]
+        y = seed_ys[s]
+        points[s, 0, 0] = x
+        points[s, 0, 1] = y
+        n = 1
+        normal_axis = -1
+        normal_scale = 1.0
+
+        for step in range(max_steps):
+            # Vacuum field direction; the magnitude does not matter here
+            ex = 0.0
+            ey = 0.0
+            for j in range(xs.size):
+                dx = x - xs[j]
+                dy = y - ys[j]
+                r_squared = dx * dx + dy * dy
+                if r_squared == 0:
+                    continue
+                e_over_r = qs[j] / (r_squared * math.sqrt(r_squared))
+                ex += e_over_r * dx
+                ey += e_over_r * dy
+            magnitude = math.hypot(ex, ey)
+            if not (magnitude > 0 and math.isfinite(magnitude)):
+                break
+
+            # Same boundary conditions as electric_field.get_step_directions
+            scaled_x = ex * normal_scale if normal_axis == 0 else ex
+            scaled_y = ey * normal_scale if normal_axis == 1 else ey
+            scaled = math.hypot(scaled_x, scaled_y)
+            step_x = direction * scaled_x / scaled
+            step_y = direction * scaled_y / scaled
+            remaining = step_size
+            blocked = False
+
+            for crossing in range(max_crossings):
+                end_x = x + remaining * step_x
+                end_y = y + remaining * step_y
+                best_t = math.inf
+                best_rect = -1
+                best_axis = 0
+                for r in range(rects.shape[0]):
+                    x1, y1, x2, y2 = rects[r, 0], rects[r, 1], rects[r, 2], rects[r, 3]
+                    if max(x, end_x) < x1 or min(x, end_x) > x2 or max(y, end_y) < y1 or min(y, end_y) > y2:
+                        continue
+                    # Liang-Barsky, as in geometry.first_crossings
+                    delta_x = end_x - x
+                    delta_y = end_y - y
+                    if delta_x == 0:
+                        tx_in, tx_out = (-math.inf, math.inf) if x1 <= x <= x2 else (math.inf, -math.inf)
+                    else:
+                        tx_in = min((x1 - x) / delta_x, (x2 - x) / delta_x)
+                        tx_out = max((x1 - x) / delta_x, (x2 - x) / delta_x)
+                    if delta_y == 0:
+                        ty_in, ty_out = (-math.inf, math.inf) if y1 <= y <= y2 else (math.inf, -math.inf)
+                    else:
+                        ty_in = min((y1 - y) / delta_y, (y2 - y) / delta_y)
+                        ty_out = max((y1 - y) / delta_y, (y2 - y) / delta_y)
+                    t_enter = max(tx_in, ty_in)
+                    t_exit = min(tx_out, ty_out)
+                    if t_enter > t_exit:
+                        continue
+                    if 1e-9 < t_enter <= 1:
+                        t, axis = t_enter, (1 if tx_in < ty_in else 0)
+                    elif 1e-9 < t_exit <= 1:
+                        t, axis = t_exit, (1 if tx_out > ty_out else 0)
+                    else:
+                        continue
+                    if t < best_t:
+                        best_t, best_rect, best_axis = t, r, axis
+                if best_rect < 0:
+                    break
+
+                x = x + best_t * (end_x - x)
+                y = y + best_t * (end_y - y)
+                points[s, n, 0] = x
+                points[s, n, 1] = y
+                n += 1
+                remaining *= 1 - best_t
+                if rect_shield[best_rect]:
+                    blocked = True
+                    break
+
+                # Permittivity just past the crossing, as in geometry.region_permittivity
+                probe_x = x + 1e-6 * step_size * step_x
+                probe_y = y + 1e-6 * step_size * step_y
+                epsilon_r = 1.0
+                in_dielectric = False
+                for r in range(rects.shape[0]):
+                    if rects[r, 0] <= probe_x <= rects[r, 2] and rects[r, 1] <= probe_y <= rects[r, 3]:
+                        if rect_shield[r]:
+                            epsilon_r = rect_epsilon[r]
+                        elif not in_dielectric:
+                            epsilon_r = rect_epsilon[r]
+                            in_dielectric = True
+                normal_axis = best_axis if epsilon_r != 1 else -1
+                normal_scale = 1 / epsilon_r
+                scaled_x = ex * normal_scale if normal_axis == 0 else ex
+                scaled_y = ey * normal_scale if normal_axis == 1 else ey
+                scaled = math.hypot(scaled_x, scaled_y)
+                step_x = direction * scaled_x / scaled
+                step_y = direction * scaled_y / scaled
+
+            if blocked:
+                break
+            x = x + remaining * step_x
+            y = y + remaining * step_y
+            points[s, n, 0] = x
+            points[s, n, 1] = y
+            n += 1
+
+            # Stop on capture by the nearest charge of capture_sign
+            nearest = -1
+            nearest_squared = math.inf
+            for j in range(xs.size):
+                if np.sign(qs[j]) == capture_sign:
+                    distance_squared = (x - xs[j]) ** 2 + (y - ys[j]) ** 2
+                    if distance_squared < nearest_squared:
+                        nearest, nearest_squared = j, distance_squared
+            if nearest >= 0 and nearest_squared < capture_radius ** 2:
+                captured[s] = nearest
+                break
+
+            if x < min_x or x > max_x or y < min_y or y > max_y:
+                break
+        lengths[s] = n
+
+    return lengths, captured
+
+def compile_kernels():
+    """
+    JIT-compile the loop kernels once. Compiled code is cached on disk between runs.
+    """
+    if not compiled_kernels:
+        compiled_kernels['coulomb_sum'] = numba.njit(parallel=True, cache=True)(coulomb_sum_loops)
+        compiled_kernels['trace'] = numba.njit(parallel=True, cache=True)(trace_seeds_loops)
+    return compiled_kernels
+
+def set_field_backend(name):
+    """
+    Select the field and tracing backend: 'numba', 'python', 'numpy', or 'auto' for numba
+    when it is installed and NumPy otherwise.
+    """
+    if name == 'auto':
+        name = 'numba' if numba is not None else 'numpy'
+    if name == 'numba':
+        if numba is None:
+            raise ImportError("The numba field backend was requested but numba is not installed")
+        kernels = compile_kernels()
+        backend.update(name=name, coulomb_sum=kernels['coulomb_sum'], trace=kernels['trace'])
+    elif name == 'python':
+        backend.update(name=name, coulomb_sum=coulomb_sum_loops, trace=trace_seeds_loops)
+    elif name == 'numpy':
+        backend.update(name=name, coulomb_sum=None, trace=None)
+    else:
+        raise ValueError(f"Unknown field backend: {name}")
+
+def get_field_backend():
+    """
+    Name of the active backend.
+    """
+    return backend['name']
+
+def kernel_coulomb_sum(points_x, points_y, xs, ys, qs, coulomb_constant=COULOMB_CONSTANT):
+    """
+    electric_field.coulomb_sum on the active loop backend.
+    """
+    return backend['coulomb_sum'](
+        np.ascontiguousarray(points_x),
+        np.ascontiguousarray(points_y),
+        xs, ys, qs, coulomb_constant,
+    )
+
+def kernel_trace_seeds(seed_xs, seed_ys, direction, charge_arrays, region_index, bounds, capture_sign,
+                       step_size, max_steps, max_crossings, dtype=FIELD_PRECISION):
+    """
+    Trace seeds to completion on the active loop backend.
+    Returns (paths, captured) like electric_field.iterate_trace_seeds, with paths in dtype.
+    """
+    xs, ys, qs = charge_arrays
+    points = np.zeros((len(seed_xs), 1 + max_steps * (1 + max_crossings), 2), dtype=dtype)
+    lengths, captured = backend['trace'](
+        points,
+        np.array(seed_xs, dtype=np.float64),
+        np.array(seed_ys, dtype=np.float64),
+        float(direction),
+        xs, ys, qs,
+        region_index['rects'],
+        region_index['epsilon_r'],
+        region_index['is_shield'],
+        np.array(bounds, dtype=np.float64),
+        float(capture_sign),
+        float(max(CHARGE_RADIUS, step_size)),
+        float(step_size),
+        int(max_steps),
+        int(max_crossings),
+    )
+    paths = [points[i, :lengths[i]].copy() for i in range(len(lengths))]
+    return paths, captured
+
+set_field_backend(os.environ.get('FIELD_BACKEND', FIELD_BACKEND))
@@ -0,0 +1,112 @@
+from collections import OrderedDict
+import numpy as np
+from settings import (
+    CHARGE_RADIUS,
+    LINE_PROBE_SAMPLES,
+    LINE_PROBE_PILOT_SAMPLES,
+    LINE_PROBE_ADAPTIVITY,
+    LINE_PROBE_CACHE_SIZE,
+)
+from electric_field import calculate_field_batch, get_charge_arrays, get_scene_key
+
+# Line probe results keyed by (path, scene key), most recently used last
+line_probe_cache = OrderedDict()
+
+def interpolate_path(path_points, cumulative_length, arc_positions):
+    """
+    Return the x and y coordinates at the given arc-length positions along a polyline.
+    """
+    xs = np.interp(arc_positions, cumulative_length, path_points[:, 0])
+    ys = np.interp(arc_positions, cumulative_length, path_points[:, 1])
+    return xs, ys
+
+def nearest_charge_distance(xs, ys, charges):
+    """
+    Distance from each point to the closest charge (infinite when there are no charges).
+    """
+    charge_xs, charge_ys, _ = get_charge_arrays(charges)
+    if charge_xs.size == 0:
+        return np.full(xs.shape, np.inf)
+    distance = np.full(xs.shape, np.inf)
+    block = max(1, (1 << 20) // charge_xs.size)
+    for start in range(0, xs.size, block):
+        stop = start + block
+        dx = xs[start:stop, None] - charge_xs[None, :]
+        dy = ys[start:stop, None] - charge_ys[None, :]
+        distance[start:stop] = np.sqrt((dx * dx + dy * dy).min(axis=1))
+    return distance
+
+def sample_path(path, charges, num_samples=LINE_PROBE_SAMPLES):
+    """
+    Place num_samples points along a world-space polyline, concentrating them near charges.
+    Returns (xs, ys, arc_positions), or None for a path of zero length.
+    """
+    path_points = np.asarray(path, dtype=np.float64)
+    segment_lengths = np.hypot(*np.diff(path_points, axis=0).T)
+    cumulative_length = np.concatenate(([0.0], np.cumsum(segment_lengths)))
+    total_length = cumulative_length[-1]
+    if total_length == 0:
+        return None
+
+    # Sampling density from a uniform pilot pass: 1 far from charges, growing as 1/distance nearby
+    pilot_positions = np.linspace(0.0, total_length, LINE_PROBE_PILOT_SAMPLES)
+    pilot_xs, pilot_ys = interpolate_path(path_points, cumulative_length, pilot_positions)
+    distance = np.maximum(nearest_charge_distance(pilot_xs, pilot_ys, charges), 0.1 * CHARGE_RADIUS)
+    density = 1.0 + LINE_PROBE_ADAPTIVITY * CHARGE_RADIUS / distance
+
+    # Invert the cumulative density so each sample covers an equal share of it
+    cumulative_density = np.concatenate((
+        [0.0],
+        np.cumsum(0.5 * (density[1:] + density[:-1]) * np.diff(pilot_positions)),
+    ))
+    targets = np.linspace(0.0, cumulative_density[-1], num_samples)
+    arc_positions = np.interp(targets, cumulative_density, pilot_positions)
+
+    # Keep the polyline corners so the integration follows the drawn path exactly
+    arc_positions = np.unique(np.concatenate((arc_positions, cumulative_length)))
+    xs, ys = interpolate_path(path_points, cumulative_length, arc_positions)
+    return xs, ys, arc_positions
+
+def evaluate_line_probe(path, charges, dielectrics, shields, line_charges=(), plate_charges=()):
+    """
+    Integrate the field along a world-space polyline.
+    Returns a dict with the line integral of E.dl, the potential difference V(end) - V(start),
+    the flux of E through the path (normal n = tangent rotated by -90 degrees, i.e. (dy, -dx)),
+    and the |E| profile against arc length. Results are cached until the scene changes.
+    """
+    key = (tuple(map(tuple, path)), get_scene_key(charges, dielectrics, shields, line_charges, plate_charges))
+    cached = line_probe_cache.get(key)
+    if cached is not None:
+        line_probe_cache.move_to_end(key)
+        return cached
+
+    samples = sample_path(path, charges)
+    if samples is None:
+        return None
+    xs, ys, arc_positions = samples
+    ex, ey, _ = calculate_field_batch(
+        xs, ys, charges, dielectrics, shields, line_charges=line_charges, plate_charges=plate_charges
+    )
+
+    # Trapezoidal rule over each sample interval
+    dl_x = np.diff(xs)
+    dl_y = np.diff(ys)
+    mid_ex = 0.5 * (ex[1:] + ex[:-1])
+    mid_ey = 0.5 * (ey[1:] + ey[:-1])
+    line_integral = float(np.sum(mid_ex * dl_x + mid_ey * dl_y))
+    flux = float(np.sum(mid_ex * dl_y - mid_ey * dl_x))
+
+    result = {
+        'line_integral': line_integral,
+        'potential_difference': -line_integral,
+        'flux': flux,
+        'length': float(arc_positions[-1]),
+        'arc_positions': arc_positions,
+        'E_magnitude': np.hypot(ex, ey),
+        'num_samples': int(xs.size),
+    }
+
+    line_probe_cache[key] = result
+    while len(line_probe_cache) > LINE_PROBE_CACHE_SIZE:
+        line_probe_cache.popitem(last=False)
+    return result
@@ -0,0 +1,134 @@
+import math
+import numpy as np
+import pygame
+
+ARROW_SIZE = 5  # Size of the arrowhead
+TRIANGLE_SAMPLES = 8  # Samples along each triangle edge when filling arrowheads
+
+def flatten_lines(world_lines):
+    """
+    Pack (path, direction) lines into flat arrays: vertices (M, 2), offsets (K + 1,) with line k
+    occupying vertices[offsets[k]:offsets[k + 1]], and directions (K,).
+    """
+    if not world_lines:
+        return np.zeros((0, 2)), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    lengths = np.array([len(path) for path, _ in world_lines], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    vertices = np.concatenate([path for path, _ in world_lines])
+    directions = np.array([direction for _, direction in world_lines], dtype=np.int64)
+    return vertices, offsets, directions
+
+def compute_arrowheads(vertices, offsets, directions, interval, arrow_size=ARROW_SIZE):
+    """
+    Arrowhead triangles (A, 3, 2) for every line at once: one at vertex 1, 1 + interval, ...
+    of each line, pointing along the segment that ends there (reversed for direction -1).
+    """
+    lengths = np.diff(offsets)
+    local = np.arange(len(vertices)) - np.repeat(offsets[:-1], lengths)
+    tips = np.nonzero(local % interval == 1)[0]
+    if tips.size == 0:
+        return np.zeros((0, 3, 2))
+    ends = vertices[tips]
+    segments = ends - vertices[tips - 1]
+    angles = np.arctan2(segments[:, 1], segments[:, 0])
+    angles += np.where(np.repeat(directions, lengths)[tips] < 0, math.pi, 0.0)
+
+    left = ends - arrow_size * np.column_stack((np.cos(angles - math.pi / 6), np.sin(angles - math.pi / 6)))
+    right = ends - arrow_size * np.column_stack((np.cos(angles + math.pi / 6), np.sin(angles + math.pi / 6)))
+    return np.stack((ends, left, right), axis=1)
+
+def plot_points(alpha, xs, ys):
+    """
+    Set the alpha of every pixel hit by the (float) points, ignoring points off the surface.
+    alpha is indexed [x, y] as returned by pygame.surfarray.
+    """
+    px = np.floor(xs).astype(np.int64)
+    py = np.floor(ys).astype(np.int64)
+    inside = (px >= 0) & (px < alpha.shape[0]) & (py >= 0) & (py < alpha.shape[1])
+    alpha[px[inside], py[inside]] = 255
+
+def rasterize_segments(alpha, vertices, offsets, width=1):
+    """
+    Rasterize every segment of every line in one vectorized pass by sampling each segment
+    at one-pixel spacing. Wider lines are drawn as offset copies.
+    """
+    if len(vertices) < 2:
+        return
+    # Segments join consecutive vertices except across line boundaries
+    starts = np.ones(len(vertices) - 1, dtype=bool)
+    starts[offsets[1:-1] - 1] = False
+    starts = np.nonzero(starts)[0]
+    if starts.size == 0:
+        return
+    p0 = vertices[starts]
+    delta = vertices[starts + 1] - p0
+    samples = np.ceil(np.abs(delta).max(axis=1)).astype(np.int64) + 1
+
+    segment = np.repeat(np.arange(starts.size), samples)
+    within = np.arange(samples.sum()) - np.repeat(np.cumsum(samples) - samples, samples)
+    t = within / np.maximum(samples - 1, 1)[segment]
+    xs = p0[segment, 0] + t * delta[segment, 0]
+    ys = p0[segment, 1] + t * delta[segment, 1]
+
+    half = (width - 1) // 2
+    for shift_x in range(-half, width - half):
+        for shift_y in range(-half, width - half):
+            plot_points(alpha, xs + shift_x, ys + shift_y)
+
+def rasterize_triangles(alpha, triangles):
+    """
+    Fill every triangle at once by sampling a barycentric grid inside each of them.
+    """
+    if len(triangles) == 0:
+        return
+    a, b = np.meshgrid(np.linspace(0, 1, TRIANGLE_SAMPLES), np.linspace(0, 1, TRIANGLE_SAMPLES))
+    keep = a + b <= 1
+    a = a[keep]
+    b = b[keep]
+    tip = triangles[:, 0, None, :]
+    left = triangles[:, 1, None, :] - tip
+    right = triangles[:, 2, None, :] - tip
+    points = tip + a[None, :, None] * left + b[None, :, None] * right
+    plot_points(alpha, points[..., 0].ravel(), points[..., 1].ravel())
+
+def create_line_layer(size, color):
+    """
+    Create an empty line layer: a transparent SRCALPHA surface whose alpha channel is the line mask.
+    """
+    surface = pygame.Surface(size, pygame.SRCALPHA)
+    surface.fill((*color, 0))
+    return {'surface': surface, 'color': color, 'count': 0, 'camera': None}
+
+def draw_lines_on_layer(layer, world_lines, zoom_level, camera_offset_x, camera_offset_y, arrow_interval, width):
+    """
+    Rasterize world-space lines (and their arrowheads if arrow_interval is set) onto a layer
+    as a single batch.
+    """
+    vertices, offsets, directions = flatten_lines(world_lines)
+    if len(vertices) == 0:
+        return
+    vertices = vertices * zoom_level + (camera_offset_x, camera_offset_y)
+    alpha = pygame.surfarray.pixels_alpha(layer['surface'])
+    try:
+        rasterize_segments(alpha, vertices, offsets, width)
+        if arrow_interval:
+            rasterize_triangles(alpha, compute_arrowheads(vertices, offsets, directions, arrow_interval))
+    finally:
+        del alpha  # Unlock the surface
+
+def update_line_layer(layer, world_lines, zoom_level, camera_offset_x, camera_offset_y, arrow_interval, width):
+    """
+    Bring a layer up to date with a growing list of world-space lines. Only lines added since
+    the last update are rasterized, unless the camera changed, which clears the layer first.
+    """
+    camera = (zoom_level, camera_offset_x, camera_offset_y)
+    if layer['camera'] != camera:
+        layer['surface'].fill((*layer['color'], 0))
+        layer['camera'] = camera
+        layer['count'] = 0
+    if layer['count'] < len(world_lines):
+        draw_lines_on_layer(
+            layer, world_lines[layer['count']:], zoom_level, camera_offset_x, camera_offset_y, arrow_interval, width
+        )
+        layer['count'] = len(world_lines)
+    return layer['surface']
@@ -1,6 +1,7 @@
 import math
 import pygame
 import sys
+import time
 import ui 
 from settings import (
     WIDTH,
@@ -10,7 +11,6 @@ from settings import (
     CHARGE_RADIUS,
     POSITIVE_COLOR,
     NEGATIVE_COLOR,
-    COULOMB_CONSTANT,
     INITIAL_ZOOM_LEVEL,
     ZOOM_STEP,
     MIN_ZOOM_LEVEL,
@@ -22,53 +22,349 @@ from settings import (
     LINE_WIDTH,
     WHITE,
     BLACK,
+    HOVER_REST_MS,
+    LINE_PROBE_MIN_POINT_SPACING,
+    SIM_OVERLAY_INTERVAL,
+    FIELD_LINE_LOD_LEVELS,
+    FIELD_LINE_LAYOUT,
+    FRAME_BUDGET_MS,
+    LOD_IDLE_MS,
+    LOD_REFINE_INTERVAL_MS,
+    TRACE_BUDGET_MS,
+    TRACE_MARGIN,
+    TRACE_REPRIORITIZE_DISTANCE,
+    SCENE_FILE,
+    PROFILE_HOTKEY_FRAMES,
+    DEFAULT_DIELECTRIC_EPSILON_R,
+    LINE_CHARGE_WIDTH,
+    PLATE_CHARGE_ALPHA,
+)
+from electric_field import (
+    calculate_field_with_details,
+    calculate_field_fast,
+    get_scene_key,
+)
+from dielectric import add_dielectric, draw_dielectrics, find_dielectric
+from shield import add_shield, draw_shields, find_shield
+from charge_sources import add_line_charge, add_plate_charge, find_charge_sources
+from surface_pool import get_translucent_surface
+from line_probe import evaluate_line_probe
+from field_cache import get_trace_cache_key
+from scene_file import load_scene, save_scene
+from profiling import start_from_environment, end_profiled_frame, toggle_profile, toggle_memory_trace, stop_all
+from input_source import get_events, get_mouse_pos, get_mods, get_ticks
+from simulation import step_simulation, reset_simulation
+from scene_journal import (
+    create_journal,
+    reset_journal,
+    add_entities,
+    remove_entities,
+    record_camera,
+    undo,
+    redo,
+    get_changes_since,
+    describe_operation,
+)
+from tracing_job import (
+    bounds_contain,
+    create_tracing_job,
+    patch_tracing_job,
+    reprioritize_job,
+    advance_job,
+    get_job_layer,
 )
-from electric_field import calculate_field_with_details, draw_field_lines
-from dielectric import add_dielectric, draw_dielectrics, remove_dielectric
-from shield import add_shield, remove_shield, draw_shields
-
-# Initialize Pygame
-pygame.init()
-screen_info = pygame.display.Info()
-WIDTH = screen_info.current_w - TOOLBOX_WIDTH
-HEIGHT = screen_info.current_h
 
-# Set windowed fullscreen mode (borderless window)
-screen = pygame.display.set_mode((screen_info.current_w, screen_info.current_h))
-pygame.display.set_caption("Electric Field Simulator")
+# Display, opened by init_display
+screen = None
+screen_info = None
 
 # Zoom and camera variables
 zoom_level = INITIAL_ZOOM_LEVEL
-camera_offset_x, camera_offset_y = WIDTH // 2, HEIGHT // 2
+camera_offset_x, camera_offset_y = WIDTH // 2, HEIGHT // 2  # Centred on the window by init_display
 charges = []
 dielectrics = []  # List to store dielectric regions
 shields = []       # List to store shield regions
+line_charges = []   # Uniformly charged segments (x1, y1, x2, y2, q)
+plate_charges = []  # Uniformly charged rectangles (x, y, width, height, q)
+# Undoable record of every edit of the lists above, see scene_journal.py
+scene_journal = create_journal({
+    'charges': charges,
+    'dielectrics': dielectrics,
+    'shields': shields,
+    'line_charges': line_charges,
+    'plate_charges': plate_charges,
+})
+pan_start_camera = None  # Camera (zoom_level, camera_offset_x, camera_offset_y) when the current pan began
 is_dragging = False
 drag_start_pos = (0, 0)
-start_drag_pos = None  # For placing dielectrics or shields
+start_drag_pos = None  # For placing dielectrics, shields, line charges or plate charges
 current_tool = "add_positive"  # Default tool
+scene_path = SCENE_FILE  # Scene file that Ctrl+S saves to
 
 # Variables for field probe
 probe_point = None  # Stores the position where the user probed the field
 field_at_probe = None  # Stores the electric field at the probe point
 math_details = None  # Stores detailed calculations
 
+# Variables for the live hover probe
+hover_point = None  # Cursor position of the last hover readout
+hover_readout = None  # Fast-path field values at hover_point
+last_motion_time = 0  # pygame ticks of the last mouse motion
+hover_rest_pending = False  # True until the full breakdown is built for hover_point
+
+# Variables for the line probe
+line_probe_path = []  # World-space polyline being probed
+line_probe_drawing = False  # True while the path is being dragged out
+line_probe_straight = False  # Shift held at the start: probe a straight segment
+
+# Variables for the dynamic simulation
+simulating = False  # True while charges move under their mutual Coulomb forces
+frame_count = 0
+overlay_charges = charges  # Charges the field lines and overlays were last built from
+
+# Resumable field line tracing job, advanced for TRACE_BUDGET_MS every frame
+tracing_job = None
+traced_version = 0  # scene_journal version the tracing job reflects
+field_line_layout = FIELD_LINE_LAYOUT  # 'charges' or 'even', switched with the L key
+
+# Field line level of detail: index into FIELD_LINE_LOD_LEVELS, coarsest first
+lod_level = len(FIELD_LINE_LOD_LEVELS) - 1
+last_interaction_time = -LOD_IDLE_MS  # pygame ticks of the last pan or zoom
+last_lod_change_time = 0
+last_frame_ms = 0.0  # Duration of the previous frame
+
 # Initialize scroll_offset in ui module
 ui.scroll_offset = 0
 
-def draw_grid():
+# Cached layers composited at the start of every frame, back to front.
+# Each entry holds a build function, a cache key function and a position function.
+layers = []
+
+def register_layer(name, build, cache_key, position=lambda: (0, 0)):
+    """
+    Register a cached layer. build() returns a Surface, cache_key() returns a value that
+    changes whenever the surface must be rebuilt, and position() returns the blit offset.
+    """
+    layers.append({
+        'name': name,
+        'build': build,
+        'cache_key': cache_key,
+        'position': position,
+        'surface': None,
+        'key': None,
+    })
+
+def draw_layers():
+    """
+    Blit every registered layer, rebuilding a layer's surface only when its cache key changes.
+    """
+    for layer in layers:
+        key = layer['cache_key']()
+        if layer['surface'] is None or key != layer['key']:
+            layer['surface'] = layer['build']()
+            layer['key'] = key
+        screen.blit(layer['surface'], layer['position']())
+
+def get_scaled_grid_size():
+    """
+    Returns the on-screen grid spacing for the current zoom level.
+    """
+    return max(1, int(GRID_SIZE * zoom_level))  # Prevent division by zero
+
+def build_grid_surface():
     """
-    Draws a grid based on the current zoom level and camera offset.
+    Builds an opaque grid pattern one cell larger than the screen, so panning is just a blit offset.
     """
-    scaled_grid_size = int(GRID_SIZE * zoom_level)
-    if scaled_grid_size == 0:
-        scaled_grid_size = 1  # Prevent division by zero
+    scaled_grid_size = get_scaled_grid_size()
+    width = screen_info.current_w + scaled_grid_size
+    height = screen_info.current_h + scaled_grid_size
+    surface = pygame.Surface((width, height))
+    surface.fill(WHITE)
+    for x in range(0, width, scaled_grid_size):
+        pygame.draw.line(surface, (220, 220, 220), (x, 0), (x, height))
+    for y in range(0, height, scaled_grid_size):
+        pygame.draw.line(surface, (220, 220, 220), (0, y), (width, y))
+    return surface.convert()
+
+def get_grid_position():
+    """
+    Returns the blit offset of the cached grid for the current camera offset.
+    """
+    scaled_grid_size = get_scaled_grid_size()
     start_x = int(-camera_offset_x % scaled_grid_size)
     start_y = int(-camera_offset_y % scaled_grid_size)
-    for x in range(start_x, screen_info.current_w, scaled_grid_size):
-        pygame.draw.line(screen, (220, 220, 220), (x, 0), (x, screen_info.current_h))
-    for y in range(start_y, screen_info.current_h, scaled_grid_size):
-        pygame.draw.line(screen, (220, 220, 220), (0, y), (screen_info.current_w, y))
+    return (start_x - scaled_grid_size, start_y - scaled_grid_size)
+
+register_layer('grid', build_grid_surface, get_scaled_grid_size, get_grid_position)
+register_layer('toolbox', lambda: ui.build_toolbox_surface(screen_info.current_h), lambda: screen_info.current_h)
+
+def init_display(size=None):
+    """
+    Initializes Pygame and opens the window, covering the whole desktop unless size is given.
+    A fixed size lets headless runs (SDL dummy driver) use a reproducible resolution.
+    """
+    global screen, screen_info, WIDTH, HEIGHT, camera_offset_x, camera_offset_y
+    pygame.init()
+    if size is None:
+        desktop_info = pygame.display.Info()
+        size = (desktop_info.current_w, desktop_info.current_h)
+
+    # Set windowed fullscreen mode (borderless window)
+    screen = pygame.display.set_mode(size)
+    pygame.display.set_caption("Electric Field Simulator")
+    screen_info = pygame.display.Info()
+    WIDTH = screen_info.current_w - TOOLBOX_WIDTH
+    HEIGHT = screen_info.current_h
+    camera_offset_x, camera_offset_y = WIDTH // 2, HEIGHT // 2
+
+def screen_to_world(x, y):
+    """
+    Converts screen coordinates to world coordinates.
+    """
+    return (x - camera_offset_x) / zoom_level, (y - camera_offset_y) / zoom_level
+
+def world_to_screen(world_x, world_y):
+    """
+    Converts world coordinates to screen coordinates.
+    """
+    return world_x * zoom_level + camera_offset_x, world_y * zoom_level + camera_offset_y
+
+def mark_interaction():
+    """
+    Records a pan or zoom and drops field lines to the coarsest level of detail.
+    """
+    global last_interaction_time, lod_level, last_lod_change_time
+    last_interaction_time = get_ticks()
+    if lod_level != 0:
+        lod_level = 0
+        last_lod_change_time = last_interaction_time
+
+def update_field_line_lod():
+    """
+    While the scene is changing (input in progress or simulating), coarsens the field lines
+    whenever a frame exceeds FRAME_BUDGET_MS. Once input has been idle for LOD_IDLE_MS,
+    refines one level every LOD_REFINE_INTERVAL_MS back to full quality.
+    """
+    global lod_level, last_lod_change_time
+    now = get_ticks()
+    busy = simulating or now - last_interaction_time < LOD_IDLE_MS
+    if busy:
+        if last_frame_ms > FRAME_BUDGET_MS and lod_level > 0:
+            lod_level -= 1
+            last_lod_change_time = now
+    elif lod_level < len(FIELD_LINE_LOD_LEVELS) - 1 and now - last_lod_change_time >= LOD_REFINE_INTERVAL_MS:
+        lod_level += 1
+        last_lod_change_time = now
+
+def get_view_bounds():
+    """
+    Returns the visible world rectangle as (min_x, min_y, max_x, max_y).
+    """
+    min_x, min_y = screen_to_world(0, 0)
+    max_x, max_y = screen_to_world(screen_info.current_w, screen_info.current_h)
+    return (min_x, min_y, max_x, max_y)
+
+def draw_field_line_overlay():
+    """
+    Advances the field line tracing job by TRACE_BUDGET_MS and draws the lines finished so far.
+    Scene or level of detail changes drop the job; panning re-prioritises the queued seeds
+    for the new view and only restarts once the view leaves the traced area.
+    """
+    global tracing_job, traced_version
+    key = (
+        get_scene_key(overlay_charges, dielectrics, shields, line_charges, plate_charges),
+        zoom_level, lod_level, field_line_layout,
+    )
+    view_bounds = get_view_bounds()
+    cursor = screen_to_world(*get_mouse_pos())
+    # Dielectric and shield edits only retrace the lines passing through them
+    if (
+        tracing_job is not None
+        and tracing_job['key'] != key
+        and tracing_job['key'][1:] == key[1:]
+        and bounds_contain(tracing_job['bounds'], view_bounds)
+    ):
+        changes = get_changes_since(scene_journal, traced_version)
+        if changes is not None and patch_tracing_job(
+            tracing_job, key, overlay_charges, dielectrics, shields,
+            [change['bounds'] for change in changes if change['bounds'] is not None],
+            line_charges, plate_charges, get_overlay_cache_key(tracing_job['bounds']),
+        ):
+            traced_version = scene_journal['version']
+    if tracing_job is None or tracing_job['key'] != key or not bounds_contain(tracing_job['bounds'], view_bounds):
+        margin_x = (view_bounds[2] - view_bounds[0]) * TRACE_MARGIN
+        margin_y = (view_bounds[3] - view_bounds[1]) * TRACE_MARGIN
+        trace_bounds = (
+            view_bounds[0] - margin_x,
+            view_bounds[1] - margin_y,
+            view_bounds[2] + margin_x,
+            view_bounds[3] + margin_y,
+        )
+        tracing_job = create_tracing_job(
+            key, overlay_charges, dielectrics, shields, trace_bounds, view_bounds, cursor,
+            FIELD_LINE_LOD_LEVELS[lod_level], get_overlay_cache_key(trace_bounds),
+            line_charges, plate_charges, field_line_layout, zoom_level,
+        )
+        traced_version = scene_journal['version']
+    elif not tracing_job['done'] and (
+        view_bounds != tracing_job['view_bounds']
+        or math.dist(cursor, tracing_job['cursor']) * zoom_level >= TRACE_REPRIORITIZE_DISTANCE
+    ):
+        reprioritize_job(tracing_job, view_bounds, cursor)
+
+    advance_job(tracing_job, TRACE_BUDGET_MS)
+    screen.blit(get_job_layer(tracing_job, screen.get_size(), zoom_level, camera_offset_x, camera_offset_y), (0, 0))
+
+def get_overlay_cache_key(trace_bounds):
+    """
+    Disk cache key for the field lines traced within trace_bounds, or None while simulating or
+    below full quality: only settled, full quality traces are worth keeping on disk.
+    """
+    if simulating or lod_level != len(FIELD_LINE_LOD_LEVELS) - 1:
+        return None
+    return get_trace_cache_key(
+        overlay_charges, dielectrics, shields, trace_bounds, zoom_level, FIELD_LINE_LOD_LEVELS[lod_level],
+        line_charges, plate_charges, field_line_layout,
+    )
+
+def open_scene(path):
+    """
+    Replaces the scene with the contents of a scene file, which later saves write back to.
+    """
+    global scene_path
+    charges[:], dielectrics[:], shields[:], line_charges[:], plate_charges[:] = load_scene(path)
+    reset_journal(scene_journal)
+    scene_path = path
+    print(
+        f"Scene loaded from {path}: {len(charges)} charges, {len(line_charges)} line charges, "
+        f"{len(plate_charges)} plate charges, {len(dielectrics)} dielectrics, {len(shields)} shields"
+    )
+
+def save_current_scene():
+    """
+    Saves the scene to the file it was opened from, or SCENE_FILE.
+    """
+    save_scene(scene_path, charges, dielectrics, shields, line_charges, plate_charges)
+    print(f"Scene saved to {scene_path}")
+
+def toggle_simulation():
+    """
+    Starts or stops the dynamic simulation. Charges always start from rest.
+    """
+    global simulating, overlay_charges
+    simulating = not simulating
+    if simulating:
+        reset_simulation()
+    overlay_charges = charges
+    print(f"Simulation {'started' if simulating else 'stopped'}")
+
+def toggle_field_line_layout():
+    """
+    Switches field lines between seeding per charge and evenly spaced streamlines.
+    """
+    global field_line_layout
+    field_line_layout = 'even' if field_line_layout == 'charges' else 'charges'
+    print(f"Field line layout: {field_line_layout}")
 
 def draw_charges():
     """
@@ -81,6 +377,40 @@ def draw_charges():
         radius = max(1, int(CHARGE_RADIUS * zoom_level))  # Scale radius
         pygame.draw.circle(screen, color, (screen_x, screen_y), radius)
 
+def draw_charge_sources():
+    """
+    Draws the plate charges as translucent rectangles and the line charges as thick lines.
+    """
+    for (world_x, world_y, width, height, q) in plate_charges:
+        color = POSITIVE_COLOR if q > 0 else NEGATIVE_COLOR
+        screen_x = int(world_x * zoom_level + camera_offset_x)
+        screen_y = int(world_y * zoom_level + camera_offset_y)
+        screen_width = int(width * zoom_level)
+        screen_height = int(height * zoom_level)
+        plate_surface = get_translucent_surface(screen_width, screen_height, color + (PLATE_CHARGE_ALPHA,), zoom_level)
+        screen.blit(plate_surface, (screen_x, screen_y))
+        pygame.draw.rect(screen, color, (screen_x, screen_y, screen_width, screen_height), 2)
+    line_width = max(1, int(LINE_CHARGE_WIDTH * zoom_level))
+    for (x1, y1, x2, y2, q) in line_charges:
+        color = POSITIVE_COLOR if q > 0 else NEGATIVE_COLOR
+        pygame.draw.line(screen, color, world_to_screen(x1, y1), world_to_screen(x2, y2), line_width)
+
+def draw_charge_source_preview(end_pos):
+    """
+    Draws the line or plate charge being dragged out; holding Shift makes it negative.
+    """
+    color = NEGATIVE_COLOR if get_mods() & pygame.KMOD_SHIFT else POSITIVE_COLOR
+    if current_tool == "add_line_charge":
+        pygame.draw.line(screen, color, start_drag_pos, end_pos, max(1, int(LINE_CHARGE_WIDTH * zoom_level)))
+    else:
+        rect = pygame.Rect(
+            min(start_drag_pos[0], end_pos[0]),
+            min(start_drag_pos[1], end_pos[1]),
+            abs(end_pos[0] - start_drag_pos[0]),
+            abs(end_pos[1] - start_drag_pos[1]),
+        )
+        pygame.draw.rect(screen, color, rect, 2)
+
 def add_charge(x, y, charge_type):
     """
     Adds a charge of specified type at the given screen coordinates.
@@ -88,101 +418,276 @@ def add_charge(x, y, charge_type):
     world_x = (x - camera_offset_x) / zoom_level
     world_y = (y - camera_offset_y) / zoom_level
     charge_magnitude = 1 if charge_type == "positive" else -1
-    charges.append((world_x, world_y, charge_magnitude))
+    add_entities(scene_journal, 'charges', [(world_x, world_y, charge_magnitude)])
     print(f"Charge added: ({world_x:.2f}, {world_y:.2f}), type: {charge_type}")
 
 def remove_charge(x, y):
     """
     Removes a charge near the specified screen coordinates.
     """
-    global charges
     world_x = (x - camera_offset_x) / zoom_level
     world_y = (y - camera_offset_y) / zoom_level
-    new_charges = []
-    for (cx, cy, q) in charges:
-        distance = math.hypot(cx - world_x, cy - world_y)
-        if distance > (CHARGE_RADIUS * 2) / zoom_level:
-            new_charges.append((cx, cy, q))
-    charges = new_charges
+    near = [
+        index for index, (cx, cy, q) in enumerate(charges)
+        if math.hypot(cx - world_x, cy - world_y) <= (CHARGE_RADIUS * 2) / zoom_level
+    ]
+    remove_entities(scene_journal, 'charges', near)
     print(f"Charge removed near: ({world_x:.2f}, {world_y:.2f})")
 
+def erase_at(x, y):
+    """
+    Removes the charges and the line and plate charges near the specified screen coordinates.
+    """
+    remove_charge(x, y)
+    line_indices, plate_indices = find_charge_sources(
+        x, y, zoom_level, camera_offset_x, camera_offset_y, line_charges, plate_charges
+    )
+    remove_entities(scene_journal, 'line_charges', line_indices)
+    remove_entities(scene_journal, 'plate_charges', plate_indices)
+    if line_indices or plate_indices:
+        print(f"{len(line_indices) + len(plate_indices)} line/plate charge(s) removed.")
+
+def remove_region(x, y, collection, find):
+    """
+    Removes the first dielectric or shield (collection 'dielectrics' or 'shields', located with
+    find) containing the specified screen coordinates. Returns True if one was removed.
+    """
+    world_x, world_y = screen_to_world(x, y)
+    index = find(world_x, world_y, scene_journal['scene'][collection])
+    if index is None:
+        return False
+    removed = remove_entities(scene_journal, collection, [index])[0]
+    print(f"{collection[:-1].capitalize()} removed at ({removed[0]}, {removed[1]})")
+    return True
+
+def get_camera():
+    """
+    Returns the camera as (zoom_level, camera_offset_x, camera_offset_y).
+    """
+    return (zoom_level, camera_offset_x, camera_offset_y)
+
+def end_pan():
+    """
+    Records the pan that just ended as one undoable camera change.
+    """
+    global pan_start_camera
+    if pan_start_camera is not None:
+        record_camera(scene_journal, pan_start_camera, get_camera())
+        pan_start_camera = None
+
+def undo_scene_edit():
+    """
+    Reverts the last scene edit or camera change.
+    """
+    global zoom_level, camera_offset_x, camera_offset_y
+    operation = undo(scene_journal)
+    if operation is None:
+        print("Nothing to undo")
+        return
+    if operation['kind'] == 'camera':
+        zoom_level, camera_offset_x, camera_offset_y = operation['camera'][0]
+        mark_interaction()
+    print(f"Undo: {describe_operation(operation)}")
+
+def redo_scene_edit():
+    """
+    Applies the last undone scene edit or camera change again.
+    """
+    global zoom_level, camera_offset_x, camera_offset_y
+    operation = redo(scene_journal)
+    if operation is None:
+        print("Nothing to redo")
+        return
+    if operation['kind'] == 'camera':
+        zoom_level, camera_offset_x, camera_offset_y = operation['camera'][1]
+        mark_interaction()
+    print(f"Redo: {describe_operation(operation)}")
+
 def scale_zoom(previous_zoom, new_zoom):
     """
     Adjust the camera offsets to maintain the same view when zooming in or out.
     """
     global camera_offset_x, camera_offset_y
+    before = (previous_zoom, camera_offset_x, camera_offset_y)
     scale_factor = new_zoom / previous_zoom
-    mouse_x, mouse_y = pygame.mouse.get_pos()
+    mouse_x, mouse_y = get_mouse_pos()
 
     # Adjust camera offsets to zoom relative to mouse position
     camera_offset_x = mouse_x - (mouse_x - camera_offset_x) * scale_factor
     camera_offset_y = mouse_y - (mouse_y - camera_offset_y) * scale_factor
+    record_camera(scene_journal, before, get_camera())
+    mark_interaction()
     print(
         f"Camera offset after zoom: ({camera_offset_x}, {camera_offset_y}), Zoom level: {new_zoom:.2f}"
     )
 
+def probe_field(x, y):
+    """
+    Calculate the field with the full per-charge breakdown at screen coordinates and show it in the sidebar.
+    """
+    global probe_point, field_at_probe, math_details
+    probe_point = (x, y)
+    ex, ey, math_details = calculate_field_with_details(
+        x,
+        y,
+        charges,
+        dielectrics,
+        shields,
+        zoom_level,
+        camera_offset_x,
+        camera_offset_y,
+        line_charges,
+        plate_charges,
+    )
+    field_magnitude = math.hypot(ex, ey)
+    field_at_probe = {
+        'Ex': ex,
+        'Ey': ey,
+        'E_magnitude': field_magnitude
+    }
+    # Reset scroll_offset in ui.py
+    ui.scroll_offset = 0
+    print(f"Probed field at ({x}, {y}): Ex={ex}, Ey={ey}, |E|={field_magnitude}")
+
+def update_hover_readout(x, y):
+    """
+    Update the live readout at the cursor using the vectorized fast path (no per-charge details).
+    """
+    global hover_point, hover_readout
+    world_x = (x - camera_offset_x) / zoom_level
+    world_y = (y - camera_offset_y) / zoom_level
+    ex, ey, potential = calculate_field_fast(world_x, world_y, charges, dielectrics, shields, line_charges, plate_charges)
+    hover_point = (x, y)
+    hover_readout = {
+        'Ex': ex,
+        'Ey': ey,
+        'E_magnitude': math.hypot(ex, ey),
+        'theta': math.degrees(math.atan2(ey, ex)),
+        'V': potential,
+    }
+
+def draw_line_probe():
+    """
+    Draws the line probe path and its results. The evaluation is cached, so this only
+    recomputes after the path is finished or the scene changes.
+    """
+    screen_points = [world_to_screen(wx, wy) for (wx, wy) in line_probe_path]
+    result = None
+    if not line_probe_drawing and len(line_probe_path) > 1:
+        result = evaluate_line_probe(line_probe_path, charges, dielectrics, shields, line_charges, plate_charges)
+    ui.draw_line_probe(screen, screen_points, result)
+
+def is_over_probe_sidebar(x, y):
+    """
+    Returns True if the probe information sidebar is shown and (x, y) lies on it.
+    """
+    if not (probe_point and field_at_probe and math_details):
+        return False
+    return screen.get_width() - TOOLBOX_WIDTH <= x <= screen.get_width() and 0 <= y <= screen.get_height()
+
 def main():
     global zoom_level, camera_offset_x, camera_offset_y, is_dragging, drag_start_pos
     global start_drag_pos, current_tool, probe_point, field_at_probe, math_details
+    global hover_point, hover_readout, last_motion_time, hover_rest_pending
+    global line_probe_path, line_probe_drawing, line_probe_straight
+    global frame_count, overlay_charges, last_frame_ms, pan_start_camera
 
+    if screen is None:
+        init_display()
+    start_from_environment()  # PROFILE_FRAMES / TRACEMALLOC_FRAMES captures
     running = True
 
     while running:
-        screen.fill(WHITE)  # Clear screen with white background
-        ui.draw_toolbox(screen)  # Draw toolbox from ui module
-        draw_grid()
+        frame_start = time.perf_counter()
+
+        # Move the charges, refreshing the overlays only every SIM_OVERLAY_INTERVAL frames
+        if simulating:
+            charges[:] = step_simulation(
+                charges, dielectrics, shields, line_charges=line_charges, plate_charges=plate_charges
+            )
+            if frame_count % SIM_OVERLAY_INTERVAL == 0:
+                overlay_charges = list(charges)
+        else:
+            overlay_charges = charges
+        frame_count += 1
+
+        draw_layers()  # Cached grid (also clears the screen) and toolbox
         draw_charges()
+        draw_charge_sources()
         draw_shields(
             screen, zoom_level, camera_offset_x, camera_offset_y, shields
         )  # Draw shields
-        draw_field_lines(
-            screen,
-            charges,
-            dielectrics,
-            shields,      # Pass shields separately
-            zoom_level,
-            camera_offset_x,
-            camera_offset_y,
-            screen_info
-        )
+        update_field_line_lod()
+        draw_field_line_overlay()
         draw_dielectrics(
-            screen, zoom_level, camera_offset_x, camera_offset_y, dielectrics, charges
-        ) 
+            screen, zoom_level, camera_offset_x, camera_offset_y, dielectrics, overlay_charges
+        )
 
         # Draw dielectric preview if in progress
         if current_tool == "add_dielectric" and start_drag_pos:
-            end_drag_pos = pygame.mouse.get_pos()
+            end_drag_pos = get_mouse_pos()
             ui.draw_dielectric_preview(screen, start_drag_pos, end_drag_pos)
 
+        # Draw the line or plate charge being dragged out
+        if current_tool in ("add_line_charge", "add_plate_charge") and start_drag_pos:
+            draw_charge_source_preview(get_mouse_pos())
+
         # Draw shield preview if in progress
         if current_tool == "add_shield" and start_drag_pos:
-            end_drag_pos = pygame.mouse.get_pos()
+            end_drag_pos = get_mouse_pos()
             # Optionally, implement a preview for shields similar to dielectrics
 
+        # Build the full breakdown once the cursor has rested on a hover point
+        if (
+            current_tool == "probe_field"
+            and hover_rest_pending
+            and get_ticks() - last_motion_time >= HOVER_REST_MS
+        ):
+            probe_field(*hover_point)
+            hover_rest_pending = False
+
         # Draw the probe point and field info if available
         if probe_point and field_at_probe and math_details:
             ui.draw_probe_info_sidebar(screen, probe_point, field_at_probe, math_details)
 
-        for event in pygame.event.get():
+        # Draw the line probe path and results
+        if current_tool == "probe_line" and line_probe_path:
+            draw_line_probe()
+
+        # Draw the live hover readout next to the cursor
+        if current_tool == "probe_field" and hover_point and hover_readout:
+            ui.draw_hover_readout(screen, hover_point, hover_readout, zoom_level)
+
+        for event in get_events():
             if event.type == pygame.QUIT:
                 running = False
 
             elif event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_x, mouse_y = pygame.mouse.get_pos()
+                mouse_x, mouse_y = get_mouse_pos()
                 if event.button == 1:  # Left mouse button clicked
                     if mouse_x < TOOLBOX_WIDTH:
                         # Clicked inside toolbox
                         previous_tool = current_tool
                         selected_tool = ui.handle_toolbox_click(mouse_x, mouse_y)
-                        if selected_tool:
+                        if selected_tool == "simulate":
+                            # Simulate is a toggle, not a tool; keep the previous tool selected
+                            toggle_simulation()
+                        elif selected_tool:
                             current_tool = selected_tool
                             # Clear probe point if switching from probe tool
                             if previous_tool == "probe_field" and current_tool != "probe_field":
                                 probe_point = None
                                 field_at_probe = None
                                 math_details = None
+                                hover_point = None
+                                hover_readout = None
+                                hover_rest_pending = False
                                 # Reset scroll_offset in ui.py
                                 ui.scroll_offset = 0
+                            # Clear the probe path if switching from the line probe
+                            if previous_tool == "probe_line" and current_tool != "probe_line":
+                                line_probe_path = []
+                                line_probe_drawing = False
                             if current_tool == "zoom_in":
                                 previous_zoom = zoom_level
                                 zoom_level = min(zoom_level + ZOOM_STEP, MAX_ZOOM_LEVEL)
@@ -194,6 +699,7 @@ def main():
                             elif current_tool == "pan":
                                 is_dragging = True
                                 drag_start_pos = (mouse_x, mouse_y)
+                                pan_start_camera = get_camera()
                     else:
                         # Clicked outside toolbox
                         tool = current_tool
@@ -202,50 +708,33 @@ def main():
                         elif tool == "add_negative":
                             add_charge(mouse_x, mouse_y, "negative")
                         elif tool == "erase":
-                            remove_charge(mouse_x, mouse_y)
+                            erase_at(mouse_x, mouse_y)
+                        elif tool in ("add_line_charge", "add_plate_charge"):
+                            start_drag_pos = (mouse_x, mouse_y)  # Start the line or plate
                         elif tool == "pan":
                             is_dragging = True
                             drag_start_pos = (mouse_x, mouse_y)
+                            pan_start_camera = get_camera()
                         elif tool == "add_dielectric":
                             start_drag_pos = (mouse_x, mouse_y)  # Start rectangle for dielectric
                         elif tool == "remove_dielectric":
-                            # Call remove_dielectric function
-                            removed = remove_dielectric(
-                                mouse_x, mouse_y, zoom_level, camera_offset_x, camera_offset_y, dielectrics
-                            )
-                            if removed:
-                                print("Dielectric removed.")
+                            if not remove_region(mouse_x, mouse_y, 'dielectrics', find_dielectric):
+                                print("No dielectric found at the clicked position.")
                         elif tool == "probe_field":
                             # Set the probe point and calculate the field with details
-                            probe_point = (mouse_x, mouse_y)
-                            ex, ey, math_details = calculate_field_with_details(
-                                mouse_x,
-                                mouse_y,
-                                charges,
-                                dielectrics,
-                                shields,  # Pass shields as an argument
-                                zoom_level,
-                                camera_offset_x,
-                                camera_offset_y
-                            )
-                            field_magnitude = math.hypot(ex, ey)
-                            field_at_probe = {
-                                'Ex': ex,
-                                'Ey': ey,
-                                'E_magnitude': field_magnitude
-                            }
-                            # Reset scroll_offset in ui.py
-                            ui.scroll_offset = 0
-                            print(f"Probed field at ({mouse_x}, {mouse_y}): Ex={ex}, Ey={ey}, |E|={field_magnitude}")
+                            probe_field(mouse_x, mouse_y)
+                            hover_rest_pending = False
+                        elif tool == "probe_line":
+                            # Start a new probe path; Shift restricts it to a straight segment
+                            line_probe_path = [screen_to_world(mouse_x, mouse_y)]
+                            line_probe_drawing = True
+                            line_probe_straight = bool(get_mods() & pygame.KMOD_SHIFT)
                         elif tool == "add_shield":
                             # Start drawing a shield rectangle
                             start_drag_pos = (mouse_x, mouse_y)
                         elif tool == "remove_shield":
-                            removed = remove_shield(
-                                mouse_x, mouse_y, zoom_level, camera_offset_x, camera_offset_y, shields
-                            )
-                            if removed:
-                                print("Shield removed.")
+                            if not remove_region(mouse_x, mouse_y, 'shields', find_shield):
+                                print("No shield found at the clicked position.")
                 elif event.button == 3:  # Right mouse button for adding shields (Optional)
                     if current_tool == "add_shield":
                         # Optionally, handle right-click differently
@@ -255,48 +744,103 @@ def main():
                 if event.button == 1:  # Left mouse button released
                     if is_dragging and current_tool == "pan":
                         is_dragging = False
+                        end_pan()
                     elif current_tool == "add_dielectric" and start_drag_pos:
-                        end_drag_pos = pygame.mouse.get_pos()
+                        end_drag_pos = get_mouse_pos()
+                        added = []
                         add_dielectric(
                             *start_drag_pos,
                             *end_drag_pos,
-                            epsilon_r=10.0,  # Adjust as needed
+                            epsilon_r=DEFAULT_DIELECTRIC_EPSILON_R,
                             zoom_level=zoom_level,
                             camera_offset_x=camera_offset_x,
                             camera_offset_y=camera_offset_y,
-                            dielectrics=dielectrics,
+                            dielectrics=added,
                         )
+                        add_entities(scene_journal, 'dielectrics', added)
                         print(f"Dielectric drawn from {start_drag_pos} to {end_drag_pos}")
                         start_drag_pos = None
                     elif current_tool == "add_shield" and start_drag_pos:
-                        end_drag_pos = pygame.mouse.get_pos()
+                        end_drag_pos = get_mouse_pos()
+                        added = []
                         add_shield(
                             *start_drag_pos,
                             *end_drag_pos,
                             zoom_level=zoom_level,
                             camera_offset_x=camera_offset_x,
                             camera_offset_y=camera_offset_y,
-                            shields=shields,
+                            shields=added,
                         )
+                        add_entities(scene_journal, 'shields', added)
                         print(f"Shield drawn from {start_drag_pos} to {end_drag_pos}")
                         start_drag_pos = None
+                    elif current_tool in ("add_line_charge", "add_plate_charge") and start_drag_pos:
+                        end_drag_pos = get_mouse_pos()
+                        sign = -1 if get_mods() & pygame.KMOD_SHIFT else 1
+                        add_source = add_line_charge if current_tool == "add_line_charge" else add_plate_charge
+                        added = []
+                        add_source(*start_drag_pos, *end_drag_pos, sign, zoom_level, camera_offset_x, camera_offset_y, added)
+                        add_entities(
+                            scene_journal, 'line_charges' if current_tool == "add_line_charge" else 'plate_charges', added
+                        )
+                        start_drag_pos = None
+                    elif current_tool == "probe_line" and line_probe_drawing:
+                        end_point = screen_to_world(*get_mouse_pos())
+                        if line_probe_straight:
+                            line_probe_path = [line_probe_path[0], end_point]
+                        elif end_point != line_probe_path[-1]:
+                            line_probe_path.append(end_point)
+                        line_probe_drawing = False
 
             elif event.type == pygame.MOUSEMOTION:
+                if current_tool == "probe_field":
+                    mouse_x, mouse_y = event.pos
+                    if mouse_x >= TOOLBOX_WIDTH and not is_over_probe_sidebar(mouse_x, mouse_y):
+                        update_hover_readout(mouse_x, mouse_y)
+                        last_motion_time = get_ticks()
+                        hover_rest_pending = True
+                if current_tool == "probe_line" and line_probe_drawing and event.buttons[0]:
+                    mouse_x, mouse_y = event.pos
+                    if line_probe_straight:
+                        line_probe_path = [line_probe_path[0], screen_to_world(mouse_x, mouse_y)]
+                    else:
+                        last_x, last_y = world_to_screen(*line_probe_path[-1])
+                        if math.hypot(mouse_x - last_x, mouse_y - last_y) >= LINE_PROBE_MIN_POINT_SPACING:
+                            line_probe_path.append(screen_to_world(mouse_x, mouse_y))
                 if is_dragging:
                     if event.buttons[0]:  # Left mouse button is pressed
-                        mouse_x, mouse_y = pygame.mouse.get_pos()
+                        mouse_x, mouse_y = get_mouse_pos()
                         dx = mouse_x - drag_start_pos[0]
                         dy = mouse_y - drag_start_pos[1]
                         if current_tool == "pan":
                             # Update camera offsets based on drag
                             camera_offset_x += dx
                             camera_offset_y += dy
+                            mark_interaction()
                         drag_start_pos = (mouse_x, mouse_y)
                     else:
                         is_dragging = False  # Left mouse button not pressed anymore
+                        end_pan()
 
             elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_PLUS or event.key == pygame.K_EQUALS:
+                if event.key == pygame.K_SPACE:
+                    toggle_simulation()
+                elif event.key == pygame.K_s and event.mod & pygame.KMOD_CTRL:
+                    save_current_scene()
+                elif event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL:
+                    if event.mod & pygame.KMOD_SHIFT:
+                        redo_scene_edit()
+                    else:
+                        undo_scene_edit()
+                elif event.key == pygame.K_y and event.mod & pygame.KMOD_CTRL:
+                    redo_scene_edit()
+                elif event.key == pygame.K_l:
+                    toggle_field_line_layout()
+                elif event.key == pygame.K_F9:
+                    toggle_profile(PROFILE_HOTKEY_FRAMES)
+                elif event.key == pygame.K_F10:
+                    toggle_memory_trace()
+                elif event.key == pygame.K_PLUS or event.key == pygame.K_EQUALS:
                     previous_zoom = zoom_level
                     zoom_level = min(zoom_level + ZOOM_STEP, MAX_ZOOM_LEVEL)
                     scale_zoom(previous_zoom, zoom_level)
@@ -309,7 +853,7 @@ def main():
 
             elif event.type == pygame.MOUSEWHEEL:
                 # Handle mouse wheel scrolling when probe field is active and mouse is over sidebar
-                mouse_x, mouse_y = pygame.mouse.get_pos()
+                mouse_x, mouse_y = get_mouse_pos()
                 if probe_point and field_at_probe and math_details:
                     # Check if mouse is over the sidebar
                     sidebar_width = TOOLBOX_WIDTH
@@ -323,68 +867,15 @@ def main():
                     pass
 
         pygame.display.flip()
+        last_frame_ms = (time.perf_counter() - frame_start) * 1000
+        end_profiled_frame()
 
-def calculate_field_with_details(px, py, charges, dielectrics, shields, zoom_level, camera_offset_x, camera_offset_y):
-    """
-    Calculate the electric field at a point (px, py) and collect detailed calculation steps.
-    """
-    total_ex, total_ey = 0.0, 0.0
-    math_details = {'charges': []}
-
-    # Convert screen coordinates to world coordinates
-    world_px = (px - camera_offset_x) / zoom_level
-    world_py = (py - camera_offset_y) / zoom_level
-
-    # Check if the point is inside any dielectric region
-    epsilon_r = 1.0  # Default relative permittivity (vacuum)
-    for dielectric in dielectrics:
-        x1, y1, width, height, dielectric_epsilon = dielectric
-        x2 = x1 + width
-        y2 = y1 + height
-        if x1 <= world_px <= x2 and y1 <= world_py <= y2:
-            epsilon_r = dielectric_epsilon
-            break
-
-    # Check if the point is inside any shield region
-    for shield in shields:
-        x1, y1, width, height = shield
-        x2 = x1 + width
-        y2 = y1 + height
-        if x1 <= world_px <= x2 and y1 <= world_py <= y2:
-            epsilon_r = 1e9  # Simulate conductor with very high epsilon
-            break
-
-    math_details['epsilon_r'] = epsilon_r
-
-    # Calculate contributions from each charge
-    for (cx, cy, q) in charges:
-        dx = world_px - cx
-        dy = world_py - cy
-        r_squared = dx**2 + dy**2
-        if r_squared == 0:
-            continue  # Avoid division by zero
-
-        e_magnitude = COULOMB_CONSTANT * q / (r_squared * epsilon_r)
-        angle = math.atan2(dy, dx)
-        ex = e_magnitude * math.cos(angle)
-        ey = e_magnitude * math.sin(angle)
-
-        total_ex += ex
-        total_ey += ey
-
-        # Store details for this charge
-        math_details['charges'].append({
-            'q': q,
-            'r_squared': r_squared,
-            'angle': angle,
-            'ex': ex,
-            'ey': ey,
-        })
-
-    return total_ex, total_ey, math_details
+    stop_all()
 
 if __name__ == "__main__":
     try:
+        if len(sys.argv) > 1:
+            open_scene(sys.argv[1])
         main()
     except Exception as e:
         print(f"An error occurred: {e}")
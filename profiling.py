@@ -0,0 +1,168 @@
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from settings import (
+    PROFILE_DIR,
+    PROFILE_TOP_N,
+    PROFILE_TRACEBACK_DEPTH,
+)
+
+# Active captures: a cProfile profiler with the frames it has left, and a tracemalloc baseline.
+# The owners are 'call' for captures started by profile_call, which stops them itself, else None.
+profiling_state = {
+    'profiler': None,
+    'profile_label': None,
+    'profile_frames_left': None,
+    'profile_owner': None,
+    'memory_before': None,
+    'memory_label': None,
+    'memory_frames_left': None,
+    'memory_owner': None,
+}
+
+def get_dump_path(label, extension):
+    """
+    Timestamped file in PROFILE_DIR for a capture.
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return os.path.join(PROFILE_DIR, f"{stamp}-{label}.{extension}")
+
+def start_profile(label='frames', frames=None, owner=None):
+    """
+    Start cProfile. With frames set, end_profiled_frame stops it after that many frames.
+    owner marks who stops it (see profiling_state).
+    """
+    if profiling_state['profiler'] is not None:
+        return
+    profiler = cProfile.Profile()
+    profiling_state.update(profiler=profiler, profile_label=label, profile_frames_left=frames, profile_owner=owner)
+    print(f"Profiling {label}" + (f" for {frames} frames" if frames else ""))
+    profiler.enable()
+
+def stop_profile():
+    """
+    Stop cProfile, dump the stats to a .prof file and print the top PROFILE_TOP_N functions.
+    Returns the dump path.
+    """
+    profiler = profiling_state['profiler']
+    if profiler is None:
+        return None
+    profiler.disable()
+    path = get_dump_path(profiling_state['profile_label'], 'prof')
+    profiler.dump_stats(path)
+    profiling_state.update(profiler=None, profile_label=None, profile_frames_left=None, profile_owner=None)
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(PROFILE_TOP_N)
+    print(summary.getvalue())
+    print(f"Profile written to {path}")
+    return path
+
+def toggle_profile(frames=None):
+    """
+    Hotkey action: start profiling, or stop and dump if already profiling.
+    """
+    if profiling_state['profiler'] is None:
+        start_profile('hotkey', frames)
+    else:
+        stop_profile()
+
+def start_memory_trace(label='operation', frames=None, owner=None):
+    """
+    Start tracemalloc and take the baseline snapshot. With frames set, end_profiled_frame takes
+    the second snapshot after that many frames. owner marks who stops it (see profiling_state).
+    """
+    if profiling_state['memory_before'] is not None:
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(PROFILE_TRACEBACK_DEPTH)
+    profiling_state.update(
+        memory_before=tracemalloc.take_snapshot(), memory_label=label, memory_frames_left=frames,
+        memory_owner=owner,
+    )
+    print(f"Tracing allocations for {label}" + (f" over {frames} frames" if frames else ""))
+
+def stop_memory_trace():
+    """
+    Take the second snapshot, dump both snapshots and print the PROFILE_TOP_N largest
+    allocation differences by source line. Returns the dump path of the second snapshot.
+    """
+    before = profiling_state['memory_before']
+    if before is None:
+        return None
+    after = tracemalloc.take_snapshot()
+    label = profiling_state['memory_label']
+    tracemalloc.stop()
+    profiling_state.update(memory_before=None, memory_label=None, memory_frames_left=None, memory_owner=None)
+
+    before.dump(get_dump_path(f"{label}-before", 'tracemalloc'))
+    path = get_dump_path(f"{label}-after", 'tracemalloc')
+    after.dump(path)
+    print(f"Top {PROFILE_TOP_N} allocation changes for {label}:")
+    for difference in after.compare_to(before, 'lineno')[:PROFILE_TOP_N]:
+        print(f"  {difference}")
+    print(f"Snapshots written next to {path}")
+    return path
+
+def toggle_memory_trace():
+    """
+    Hotkey action: take the before snapshot, or the after snapshot if one is pending.
+    """
+    if profiling_state['memory_before'] is None:
+        start_memory_trace('hotkey')
+    else:
+        stop_memory_trace()
+
+def start_from_environment():
+    """
+    Start captures requested by the PROFILE_FRAMES and TRACEMALLOC_FRAMES environment
+    variables, each a number of frames to capture from the start.
+    """
+    if os.environ.get('PROFILE_FRAMES'):
+        start_profile('startup', int(os.environ['PROFILE_FRAMES']))
+    if os.environ.get('TRACEMALLOC_FRAMES'):
+        start_memory_trace('startup', int(os.environ['TRACEMALLOC_FRAMES']))
+
+def end_profiled_frame():
+    """
+    Count down frame-limited captures, called at the end of every frame.
+    """
+    if profiling_state['profile_frames_left'] is not None:
+        profiling_state['profile_frames_left'] -= 1
+        if profiling_state['profile_frames_left'] <= 0:
+            stop_profile()
+    if profiling_state['memory_frames_left'] is not None:
+        profiling_state['memory_frames_left'] -= 1
+        if profiling_state['memory_frames_left'] <= 0:
+            stop_memory_trace()
+
+def stop_all():
+    """
+    Finish any capture still running, e.g. when the main loop exits. Captures started by
+    profile_call are left for it to stop, since they cover more than the main loop.
+    """
+    if profiling_state['profile_owner'] != 'call':
+        stop_profile()
+    if profiling_state['memory_owner'] != 'call':
+        stop_memory_trace()
+
+def profile_call(label, function, *args, profile=True, trace_memory=False, **kwargs):
+    """
+    Run function(*args, **kwargs) under cProfile and/or tracemalloc and return its result,
+    for offline captures from headless and benchmark entry points.
+    """
+    if profile:
+        start_profile(label, owner='call')
+    if trace_memory:
+        start_memory_trace(label, owner='call')
+    try:
+        return function(*args, **kwargs)
+    finally:
+        if trace_memory:
+            stop_memory_trace()
+        if profile:
+            stop_profile()
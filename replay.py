@@ -0,0 +1,217 @@
+import argparse
+import csv
+import json
+import os
+import time
+import numpy as np
+import pygame
+from settings import FRAME_BUDGET_MS
+from input_source import set_input_source, reset_input_source
+from profiling import profile_call
+from scene_journal import reset_journal
+
+RECORDING_FORMAT_VERSION = 1
+RECORDED_EVENT_TYPES = {
+    pygame.QUIT,
+    pygame.MOUSEBUTTONDOWN,
+    pygame.MOUSEBUTTONUP,
+    pygame.MOUSEMOTION,
+    pygame.MOUSEWHEEL,
+    pygame.KEYDOWN,
+    pygame.KEYUP,
+}
+
+def encode_event(event):
+    """
+    JSON-friendly form of an event, keeping only plain attribute values.
+    """
+    attributes = {
+        name: value for name, value in event.dict.items()
+        if isinstance(value, (int, float, str, bool, tuple))
+    }
+    return {'type': event.type, 'attributes': attributes}
+
+def decode_event(data):
+    """
+    Rebuild a pygame event from encode_event output.
+    """
+    attributes = {
+        name: tuple(value) if isinstance(value, list) else value
+        for name, value in data['attributes'].items()
+    }
+    return pygame.event.Event(data['type'], attributes)
+
+def get_scene_state(main_module):
+    """
+    The parts of the editor state a replay has to start from.
+    """
+    return {
+        'charges': list(main_module.charges),
+        'dielectrics': list(main_module.dielectrics),
+        'shields': list(main_module.shields),
+        'line_charges': list(main_module.line_charges),
+        'plate_charges': list(main_module.plate_charges),
+        'zoom_level': main_module.zoom_level,
+        'camera_offset': (main_module.camera_offset_x, main_module.camera_offset_y),
+        'current_tool': main_module.current_tool,
+        'field_line_layout': main_module.field_line_layout,
+    }
+
+def restore_scene_state(main_module, state):
+    """
+    Put the editor back into a state saved by get_scene_state.
+    """
+    main_module.charges[:] = [tuple(charge) for charge in state['charges']]
+    main_module.dielectrics[:] = [tuple(dielectric) for dielectric in state['dielectrics']]
+    main_module.shields[:] = [tuple(shield) for shield in state['shields']]
+    main_module.line_charges[:] = [tuple(line) for line in state.get('line_charges', [])]
+    main_module.plate_charges[:] = [tuple(plate) for plate in state.get('plate_charges', [])]
+    main_module.zoom_level = state['zoom_level']
+    main_module.camera_offset_x, main_module.camera_offset_y = state['camera_offset']
+    main_module.current_tool = state['current_tool']
+    main_module.field_line_layout = state.get('field_line_layout', main_module.FIELD_LINE_LAYOUT)
+    reset_journal(main_module.scene_journal)
+
+def record_session(path, scene_path=None):
+    """
+    Run the simulator live and write every frame's input to path when it exits.
+    """
+    import main
+    main.init_display()
+    if scene_path:
+        main.open_scene(scene_path)
+    recording = {
+        'version': RECORDING_FORMAT_VERSION,
+        'size': main.screen.get_size(),
+        'scene': get_scene_state(main),
+        'frames': [],
+    }
+
+    def get_recorded_events():
+        events = pygame.event.get()
+        recording['frames'].append({
+            'ticks': pygame.time.get_ticks(),
+            'mouse': pygame.mouse.get_pos(),
+            'mods': pygame.key.get_mods(),
+            'events': [encode_event(event) for event in events if event.type in RECORDED_EVENT_TYPES],
+        })
+        return events
+
+    set_input_source(get_events=get_recorded_events)
+    try:
+        main.main()
+    finally:
+        reset_input_source()
+        with open(path, 'w') as recording_file:
+            json.dump(recording, recording_file)
+        print(f"Recorded {len(recording['frames'])} frames to {path}")
+
+def replay_session(path, report_path=None):
+    """
+    Play a recording back headlessly and return the per-frame timings as a list of dicts.
+    The clock, cursor and modifiers follow the recording; the main loop ends after the last frame.
+    """
+    with open(path) as recording_file:
+        recording = json.load(recording_file)
+    if recording.get('version') != RECORDING_FORMAT_VERSION:
+        raise ValueError(f"Unsupported recording format in {path}")
+
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import main
+    main.init_display(tuple(recording['size']))
+    restore_scene_state(main, recording['scene'])
+
+    frames = recording['frames']
+    state = {'frame': -1, 'last_call': None}  # Frame whose input was handed out last
+    timings = []
+
+    def current_frame():
+        if not frames:
+            return {'ticks': 0, 'mouse': (0, 0), 'mods': 0, 'events': []}
+        return frames[min(max(state['frame'], 0), len(frames) - 1)]
+
+    def get_replayed_events():
+        # The main loop asks for events once per frame, so the time between calls is one frame
+        now = time.perf_counter()
+        if state['last_call'] is not None:
+            timings.append({
+                'frame': state['frame'] + 1,
+                'ticks': current_frame()['ticks'],
+                'events': len(current_frame()['events']),
+                'lod_level': main.lod_level,
+                'frame_ms': (now - state['last_call']) * 1000,
+            })
+        state['last_call'] = now
+        pygame.event.pump()
+        state['frame'] += 1
+        if state['frame'] >= len(frames):
+            return [pygame.event.Event(pygame.QUIT)]
+        return [decode_event(event) for event in frames[state['frame']]['events']]
+
+    set_input_source(
+        get_events=get_replayed_events,
+        get_mouse_pos=lambda: tuple(current_frame()['mouse']),
+        get_mods=lambda: current_frame()['mods'],
+        get_ticks=lambda: current_frame()['ticks'],
+    )
+    try:
+        main.main()
+    finally:
+        reset_input_source()
+
+    if report_path:
+        write_report(report_path, timings)
+    print_summary(timings)
+    return timings
+
+def write_report(path, timings):
+    """
+    Write per-frame timings as CSV.
+    """
+    with open(path, 'w', newline='') as report_file:
+        writer = csv.DictWriter(report_file, fieldnames=['frame', 'ticks', 'events', 'lod_level', 'frame_ms'])
+        writer.writeheader()
+        writer.writerows(timings)
+    print(f"Frame report written to {path}")
+
+def print_summary(timings):
+    """
+    Print frame time statistics for a replay.
+    """
+    if not timings:
+        print("No frames replayed")
+        return
+    frame_ms = np.array([timing['frame_ms'] for timing in timings])
+    print(
+        f"{len(frame_ms)} frames in {frame_ms.sum() / 1000:.2f} s: "
+        f"mean {frame_ms.mean():.1f} ms, median {np.median(frame_ms):.1f} ms, "
+        f"p95 {np.percentile(frame_ms, 95):.1f} ms, p99 {np.percentile(frame_ms, 99):.1f} ms, "
+        f"max {frame_ms.max():.1f} ms, {int((frame_ms > FRAME_BUDGET_MS).sum())} over {FRAME_BUDGET_MS} ms"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=(
+        "Record a simulator session, or replay one headlessly (SDL dummy driver, recorded "
+        "resolution) with a per-frame timing report. Time-budgeted work such as field line "
+        "tracing still adapts to the machine's speed, as it would live."
+    ))
+    commands = parser.add_subparsers(dest='command', required=True)
+    record_parser = commands.add_parser('record', help="run the simulator and record its input")
+    record_parser.add_argument('session')
+    record_parser.add_argument('scene', nargs='?', help="scene file to start from")
+    play_parser = commands.add_parser('play', help="replay a recording headlessly and time every frame")
+    play_parser.add_argument('session')
+    play_parser.add_argument('--report', help="CSV file for the per-frame timings")
+    play_parser.add_argument('--profile', action='store_true', help="run the replay under cProfile")
+    play_parser.add_argument('--tracemalloc', action='store_true', help="snapshot allocations around the replay")
+    arguments = parser.parse_args()
+
+    if arguments.command == 'record':
+        record_session(arguments.session, arguments.scene)
+    elif arguments.profile or arguments.tracemalloc:
+        profile_call(
+            'replay', replay_session, arguments.session, arguments.report,
+            profile=arguments.profile, trace_memory=arguments.tracemalloc,
+        )
+    else:
+        replay_session(arguments.session, arguments.report)
@@ -0,0 +1,30 @@
+import json
+
+def save_scene(path, charges, dielectrics, shields, line_charges=(), plate_charges=()):
+    """
+    Write the charges, dielectrics, shields and line and plate charges to a JSON scene file.
+    """
+    scene = {
+        'charges': charges,
+        'dielectrics': dielectrics,
+        'shields': shields,
+        'line_charges': list(line_charges),
+        'plate_charges': list(plate_charges),
+    }
+    with open(path, 'w') as scene_file:
+        json.dump(scene, scene_file, indent=1)
+
+def load_scene(path):
+    """
+    Read a JSON scene file. Returns (charges, dielectrics, shields, line_charges, plate_charges)
+    as lists of tuples.
+    """
+    with open(path) as scene_file:
+        scene = json.load(scene_file)
+    return (
+        [tuple(charge) for charge in scene.get('charges', [])],
+        [tuple(dielectric) for dielectric in scene.get('dielectrics', [])],
+        [tuple(shield) for shield in scene.get('shields', [])],
+        [tuple(line) for line in scene.get('line_charges', [])],
+        [tuple(plate) for plate in scene.get('plate_charges', [])],
+    )
@@ -0,0 +1,229 @@
+from settings import CHARGE_RADIUS, JOURNAL_UNDO_LIMIT, JOURNAL_LOG_SIZE
+
+# Scene collections the journal tracks, in the order of scene_file.load_scene
+COLLECTIONS = ('charges', 'dielectrics', 'shields', 'line_charges', 'plate_charges')
+
+def create_journal(scene):
+    """
+    Edit journal over a scene, a dict mapping every name in COLLECTIONS to the list it edits in
+    place. Every entity gets an ID that survives edits of the others, kept in a list parallel to
+    its collection. Edits are recorded as deltas on the undo stack, and every applied delta
+    (including undos and redos) is appended to a log that caches read with get_changes_since.
+    """
+    journal = {
+        'scene': scene,
+        'ids': {},
+        'next_id': 0,
+        'undo': [],
+        'redo': [],
+        'log': [],
+        'log_start': 0,  # Oldest version get_changes_since can answer from
+        'version': 0,    # Bumped by every applied delta
+    }
+    reset_journal(journal)
+    return journal
+
+def reset_journal(journal):
+    """
+    Start over after the scene lists were replaced wholesale (e.g. a scene file was opened):
+    every entity gets a new ID, the history is cleared, and caches asking for the changes since
+    an earlier version are told to start from scratch.
+    """
+    for collection in COLLECTIONS:
+        journal['ids'][collection] = [new_entity_id(journal) for _ in journal['scene'][collection]]
+    journal['undo'].clear()
+    journal['redo'].clear()
+    journal['log'].clear()
+    journal['version'] += 1
+    journal['log_start'] = journal['version']
+
+def new_entity_id(journal):
+    """
+    Next unused entity ID.
+    """
+    journal['next_id'] += 1
+    return journal['next_id']
+
+def get_entity_ids(journal, collection):
+    """
+    IDs of a scene collection's entities, in list order. Entities appended to or dropped from
+    the end of the list without going through the journal (e.g. by scripts) gain or lose IDs.
+    """
+    items = journal['scene'][collection]
+    ids = journal['ids'][collection]
+    if len(ids) > len(items):
+        del ids[len(items):]
+    while len(ids) < len(items):
+        ids.append(new_entity_id(journal))
+    return ids
+
+def get_entity_bounds(collection, item):
+    """
+    World bounding box (min_x, min_y, max_x, max_y) of one scene entity.
+    """
+    if collection == 'charges':
+        x, y, _ = item
+        return (x - CHARGE_RADIUS, y - CHARGE_RADIUS, x + CHARGE_RADIUS, y + CHARGE_RADIUS)
+    if collection == 'line_charges':
+        x1, y1, x2, y2, _ = item
+        return (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+    x, y, width, height = item[:4]  # Dielectrics, shields and plate charges
+    return (x, y, x + width, y + height)
+
+def get_operation_bounds(operation):
+    """
+    Union of the bounding boxes of the entities an operation touches.
+    """
+    boxes = [get_entity_bounds(operation['collection'], item) for (_, _, item) in operation['entities']]
+    return (
+        min(box[0] for box in boxes),
+        min(box[1] for box in boxes),
+        max(box[2] for box in boxes),
+        max(box[3] for box in boxes),
+    )
+
+def add_entities(journal, collection, items):
+    """
+    Append items to a scene collection as one undoable operation. Returns their IDs.
+    """
+    items = list(items)
+    if not items:
+        return []
+    start = len(get_entity_ids(journal, collection))
+    operation = {
+        'kind': 'add',
+        'collection': collection,
+        'entities': [(new_entity_id(journal), start + offset, item) for offset, item in enumerate(items)],
+    }
+    operation['bounds'] = get_operation_bounds(operation)
+    push_operation(journal, operation)
+    return [entity_id for (entity_id, _, _) in operation['entities']]
+
+def remove_entities(journal, collection, indices):
+    """
+    Remove the entities at the given indices of a scene collection as one undoable operation.
+    Returns the removed items.
+    """
+    items = journal['scene'][collection]
+    ids = get_entity_ids(journal, collection)
+    indices = sorted(set(indices))
+    if not indices:
+        return []
+    operation = {
+        'kind': 'remove',
+        'collection': collection,
+        'entities': [(ids[index], index, items[index]) for index in indices],
+    }
+    operation['bounds'] = get_operation_bounds(operation)
+    push_operation(journal, operation)
+    return [item for (_, _, item) in operation['entities']]
+
+def record_camera(journal, before, after):
+    """
+    Record a camera change that was already applied, with before and after as
+    (zoom_level, camera_offset_x, camera_offset_y). Camera operations touch no entities.
+    """
+    if before == after:
+        return
+    journal['undo'].append({'kind': 'camera', 'collection': 'camera', 'entities': [], 'bounds': None,
+                            'camera': (before, after)})
+    del journal['undo'][:-JOURNAL_UNDO_LIMIT]
+    journal['redo'].clear()
+    log_change(journal, 'camera', 'camera', [], None)
+
+def push_operation(journal, operation):
+    """
+    Apply a new operation, make it the one the next undo reverts, and drop the redo stack.
+    """
+    apply_operation(journal, operation['kind'], operation)
+    journal['undo'].append(operation)
+    del journal['undo'][:-JOURNAL_UNDO_LIMIT]
+    journal['redo'].clear()
+
+def apply_operation(journal, kind, operation):
+    """
+    Apply an operation's delta as kind ('add' or 'remove'; undos apply the opposite kind).
+    Entities are added back at their recorded indices and removed by ID, so deltas stay valid
+    while the entities themselves move (e.g. charges during a simulation).
+    """
+    collection = operation['collection']
+    items = journal['scene'][collection]
+    ids = get_entity_ids(journal, collection)
+    if kind == 'add':
+        for (entity_id, index, item) in operation['entities']:
+            index = min(index, len(items))
+            items.insert(index, item)
+            ids.insert(index, entity_id)
+    else:
+        removed = {entity_id for (entity_id, _, _) in operation['entities']}
+        for index in reversed([index for index, entity_id in enumerate(ids) if entity_id in removed]):
+            del items[index]
+            del ids[index]
+    log_change(journal, kind, collection, [entity_id for (entity_id, _, _) in operation['entities']],
+               operation['bounds'])
+
+def log_change(journal, kind, collection, ids, bounds):
+    """
+    Append an applied delta to the change log, keeping the last JOURNAL_LOG_SIZE entries.
+    """
+    journal['version'] += 1
+    journal['log'].append({
+        'version': journal['version'],
+        'kind': kind,
+        'collection': collection,
+        'ids': ids,
+        'bounds': bounds,
+    })
+    if len(journal['log']) > JOURNAL_LOG_SIZE:
+        del journal['log'][:-JOURNAL_LOG_SIZE]
+        journal['log_start'] = journal['log'][0]['version'] - 1
+
+def undo(journal):
+    """
+    Revert the last operation. Returns it, or None if there is nothing to undo.
+    Camera operations are only recorded here; the caller moves the camera back to
+    operation['camera'][0].
+    """
+    if not journal['undo']:
+        return None
+    operation = journal['undo'].pop()
+    if operation['kind'] == 'camera':
+        log_change(journal, 'camera', 'camera', [], None)
+    else:
+        apply_operation(journal, 'remove' if operation['kind'] == 'add' else 'add', operation)
+    journal['redo'].append(operation)
+    return operation
+
+def redo(journal):
+    """
+    Apply the last undone operation again. Returns it, or None if there is nothing to redo.
+    The caller moves the camera to operation['camera'][1] for camera operations.
+    """
+    if not journal['redo']:
+        return None
+    operation = journal['redo'].pop()
+    if operation['kind'] == 'camera':
+        log_change(journal, 'camera', 'camera', [], None)
+    else:
+        apply_operation(journal, operation['kind'], operation)
+    journal['undo'].append(operation)
+    return operation
+
+def get_changes_since(journal, version):
+    """
+    Log entries applied after version, oldest first, each with its kind ('add', 'remove' or
+    'camera'), collection, entity IDs and world bounding box (None for camera changes).
+    Returns None if the log no longer reaches back that far, in which case anything may have
+    changed.
+    """
+    if version < journal['log_start']:
+        return None
+    return [change for change in journal['log'] if change['version'] > version]
+
+def describe_operation(operation):
+    """
+    Short description of an operation for console messages.
+    """
+    if operation['kind'] == 'camera':
+        return "camera change"
+    return f"{operation['kind']} {operation['collection'].replace('_', ' ')} ({len(operation['entities'])})"
@@ -1,3 +1,5 @@
+import os
+
 # Screen settings
 WIDTH = 800  
 HEIGHT = 600 
@@ -26,6 +28,95 @@ MIN_ZOOM_LEVEL = 0.5
 MAX_ZOOM_LEVEL = 3.0
 BASE_PAN_SPEED = 2
 FIELD_LINE_STEP = 5
+FIELD_LINE_UNIT_CHARGE = 1.0  # Charge magnitude that carries NUM_FIELD_LINES field lines
+FIELD_LINE_MAX_STEPS = 100
+FIELD_LINE_ARROW_INTERVAL = 10  # Steps between arrowheads along a field line
+FIELD_LINE_MAX_CROSSINGS = 4    # Region boundaries a field line may cross within a single step
+# Field line placement: 'charges' seeds NUM_FIELD_LINES per unit charge, 'even' places evenly
+# spaced streamlines over the view (streamlines.py). The L key switches between them.
+FIELD_LINE_LAYOUT = 'charges'
+STREAMLINE_SEPARATION = 24        # Screen distance between neighbouring evenly spaced lines
+STREAMLINE_TEST_RATIO = 0.5       # Lines end this fraction of the separation away from other lines
+STREAMLINE_STEPS_PER_FRAME = 100  # Integration steps traced per frame in the 'even' layout (about 5 ms)
+STREAMLINE_MAX_STEPS = 1000       # Steps per line in each direction
+STREAMLINE_CHARGE_SEEDS = 8       # Seeds tried around each charge before the rest of the view
+STREAMLINE_TILE_NODES = 32        # Nodes per side of the lazily sampled field direction tiles
+
+# Backend for the Coulomb sum and field line tracing: 'auto' (numba if installed, else NumPy),
+# 'numba', 'numpy' or 'python' (the numba loops, interpreted). The FIELD_BACKEND environment
+# variable overrides this.
+FIELD_BACKEND = 'auto'
+# Storage precision of field grids and traced field line points: 'float64' or 'float32'.
+# Probe readouts and line probes are always computed in float64.
+FIELD_PRECISION = 'float32'
+
+# On-disk cache of computed field grids and traced field lines
+FIELD_CACHE_ENABLED = True
+FIELD_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'electric_field_simulator')
+FIELD_CACHE_MAX_MB = 256  # Least recently used entries are evicted beyond this size
+
+# Profiling captures (F9: cProfile, F10: tracemalloc before/after snapshots)
+PROFILE_DIR = 'profiles'        # Where timestamped .prof and .tracemalloc dumps are written
+PROFILE_TOP_N = 25              # Entries in the printed summaries
+PROFILE_HOTKEY_FRAMES = 120     # Frames captured after pressing F9
+PROFILE_TRACEBACK_DEPTH = 10    # Frames kept per tracemalloc allocation
+
+# Parameter sweeps (sweep.py)
+DEFAULT_DIELECTRIC_EPSILON_R = 10.0  # Relative permittivity of dielectrics drawn in the editor
+SWEEP_WORKERS = None                 # Worker processes; None uses every CPU
+SWEEP_TASKS_PER_WORKER = 4           # Variants queued per worker ahead of the results
+
+# Persistent worker pool for large field grids (grid_pool.py)
+GRID_POOL_WORKERS = None         # Worker processes; None uses every CPU. One worker keeps grids in-process
+GRID_POOL_TILE_ROWS = 64         # Grid rows per tile handed to a worker
+GRID_POOL_MIN_POINTS = 1 << 18   # Smaller grids are always computed in-process
+GRID_POOL_RESULT_TIMEOUT = 1.0   # Seconds between checks that the workers are still alive
+
+SCENE_FILE = 'scene.json'  # Where Ctrl+S saves a scene that was not opened from a file
+
+# Scene edit journal (scene_journal.py): Ctrl+Z undoes, Ctrl+Y or Ctrl+Shift+Z redoes
+JOURNAL_UNDO_LIMIT = 200   # Operations kept for undo
+JOURNAL_LOG_SIZE = 256     # Applied changes kept for caches catching up on edits
+
+# High-resolution export (export.py)
+EXPORT_TILE_SIZE = 1024          # Tiles are rendered as square off-screen surfaces of this many pixels
+EXPORT_WORKERS = None            # Worker processes rendering tiles; None uses every CPU
+EXPORT_TASKS_PER_WORKER = 2      # Tiles queued per worker ahead of the writer
+EXPORT_MARGIN = 0.25             # Default bounds: the scene's extent grown by this fraction per side
+EXPORT_LINE_CHUNK = 64           # Vertices per field line chunk when sorting lines into tiles
+EXPORT_HEATMAP_PREPASS = 256     # Columns of the coarse grid that fixes the heatmap colour range
+EXPORT_HEATMAP_BATCH = 65536     # Heatmap pixels evaluated together within a tile
+EXPORT_PNG_COMPRESSION = 6       # zlib level of the streamed PNG
+
+# Line and plate charges (uniformly charged segments and rectangles)
+LINE_CHARGE_DENSITY = 0.01       # Charge per world unit of length given to drawn line charges
+PLATE_CHARGE_DENSITY = 1e-4      # Charge per square world unit given to drawn plate charges
+LINE_CHARGE_WIDTH = 4            # Screen width of drawn line charges
+PLATE_CHARGE_ALPHA = 90          # Fill opacity of drawn plate charges
+# Far from a source its closed form is replaced by Gauss-Legendre point charges, using the
+# lowest of these orders (per axis) whose error estimate stays below the tolerance
+SOURCE_QUADRATURE_ORDERS = (1, 2, 4)
+SOURCE_QUADRATURE_TOLERANCE = 1e-6
+
+# Spatial index over shield and dielectric rectangles (world units)
+REGION_INDEX_CELL_SIZE = 64     # Should exceed the coarsest field line step
+REGION_INDEX_MAX_CELLS = 1024   # Larger rectangles are tested against every segment instead
+
+# Field line level of detail, coarsest first. The last level is full quality.
+FIELD_LINE_LOD_LEVELS = [
+    {'seed_fraction': 0.25, 'step_multiplier': 4, 'arrows': False},
+    {'seed_fraction': 0.5, 'step_multiplier': 2, 'arrows': False},
+    {'seed_fraction': 1.0, 'step_multiplier': 1, 'arrows': True},
+]
+FRAME_BUDGET_MS = 33          # Frame time allowed while the scene is changing
+LOD_IDLE_MS = 250             # Input idle time before field lines are refined
+LOD_REFINE_INTERVAL_MS = 100  # Time between refinement steps once idle
+
+# Time-sliced field line tracing
+TRACE_BUDGET_MS = 4                # Tracing time spent per frame
+TRACE_BATCH_SIZE = 16              # Seeds traced together in one lockstep batch
+TRACE_MARGIN = 0.25                # Lines are traced this fraction of the view beyond each edge
+TRACE_REPRIORITIZE_DISTANCE = 30   # Cursor movement (screen pixels) that re-sorts queued seeds
 
 # Sidebar Settings
 SIDEBAR_BACKGROUND_COLOR = (230, 230, 230) 
@@ -58,8 +149,39 @@ BLACK = (0, 0, 0)
 SHIELD_COLOR = (0, 0, 0)  
 SHIELD_WIDTH = 3        
 SHIELD_EPSILON_R = 1.0    
+# Grounded-plane image charges (shield.get_image_charges): a shield edge counts as a plane for a
+# charge whose foot point on the edge lies at least this many charge distances from both ends
+IMAGE_CHARGES_ENABLED = True
+IMAGE_CHARGE_EDGE_RATIO = 5.0
 
 # Conductor settings
 CONDUCTOR_COLOR = (128, 128, 128)  
 INDUCED_CHARGE_RADIUS = 5         
-INDUCED_CHARGE_COLOR = (0, 255, 0) 
\ No newline at end of file
+INDUCED_CHARGE_COLOR = (0, 255, 0) 
+
+# Hover probe settings
+HOVER_REST_MS = 300                       # Cursor rest time before the full breakdown is built
+HOVER_READOUT_FONT_SIZE = 20
+HOVER_READOUT_BACKGROUND = (255, 255, 255, 210)
+HOVER_READOUT_OFFSET = 15                 # Distance of the readout box from the cursor
+
+# Line probe settings
+LINE_PROBE_SAMPLES = 4096                 # Samples along the probe path
+LINE_PROBE_PILOT_SAMPLES = 1024           # Uniform pre-pass used to place samples near charges
+LINE_PROBE_ADAPTIVITY = 4.0               # How strongly samples concentrate near charges
+LINE_PROBE_CACHE_SIZE = 16                # Number of probed paths kept in the cache
+LINE_PROBE_MIN_POINT_SPACING = 5          # Screen distance between recorded polyline points
+LINE_PROBE_COLOR = (255, 140, 0)
+LINE_PROBE_WIDTH = 2
+LINE_PROBE_PANEL_WIDTH = 360
+LINE_PROBE_PANEL_HEIGHT = 190
+LINE_PROBE_PLOT_COLOR = (200, 0, 200)
+
+# Dynamic (N-body) simulation settings
+SIM_CHARGE_MASS = 1e4                     # Mass given to every simulated charge
+SIM_SOFTENING = CHARGE_RADIUS             # Softening length for the Coulomb force
+SIM_TIME_STEP = 1 / 60                    # Simulated time per frame
+SIM_SUBSTEPS = 4                          # Velocity-Verlet substeps per frame
+SIM_DIRECT_MAX_CHARGES = 512              # Above this count the tree approximation is used
+SIM_TREE_LEAF_SIZE = 16                   # Target charges per finest tree cell
+SIM_OVERLAY_INTERVAL = 10                 # Frames between field line / overlay updates while simulating
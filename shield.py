@@ -1,5 +1,6 @@
 import pygame
 import math
+import numpy as np
 from settings import (
     SHIELD_COLOR,
     SHIELD_WIDTH,
@@ -7,7 +8,13 @@ from settings import (
     COULOMB_CONSTANT,
     POSITIVE_COLOR,
     NEGATIVE_COLOR,
+    IMAGE_CHARGES_ENABLED,
+    IMAGE_CHARGE_EDGE_RATIO,
 )
+from surface_pool import get_translucent_surface
+
+# Image charge groups, rebuilt only when the charges or shields change
+image_charge_cache = {'key': None, 'groups': []}
 
 def add_shield(start_x, start_y, end_x, end_y, zoom_level, camera_offset_x, camera_offset_y, shields):
     """
@@ -29,19 +36,14 @@ def add_shield(start_x, start_y, end_x, end_y, zoom_level, camera_offset_x, came
     shields.append((rect_x, rect_y, rect_width, rect_height))
     print(f"Shield added at ({rect_x:.2f}, {rect_y:.2f}) with size {rect_width:.2f} x {rect_height:.2f}")
 
-def remove_shield(x, y, zoom_level, camera_offset_x, camera_offset_y, shields):
+def find_shield(world_x, world_y, shields):
     """
-    Remove the shield near the clicked position.
+    Index of the first shield containing a world coordinate, or None.
     """
-    world_x = (x - camera_offset_x) / zoom_level
-    world_y = (y - camera_offset_y) / zoom_level
-
     for idx, (rect_x, rect_y, width, height) in enumerate(shields):
         if rect_x <= world_x <= rect_x + width and rect_y <= world_y <= rect_y + height:
-            del shields[idx]
-            print(f"Shield removed at ({rect_x}, {rect_y})")
-            return
-    print("No shield found at the clicked position.")
+            return idx
+    return None
 
 def draw_shields(screen, zoom_level, camera_offset_x, camera_offset_y, shields):
     """
@@ -57,6 +59,68 @@ def draw_shields(screen, zoom_level, camera_offset_x, camera_offset_y, shields):
         shield_rect = pygame.Rect(screen_x, screen_y, screen_width, screen_height)
         pygame.draw.rect(screen, SHIELD_COLOR, shield_rect, SHIELD_WIDTH)
 
-        shield_surface = pygame.Surface((screen_width, screen_height), pygame.SRCALPHA)
-        shield_surface.fill((50, 50, 50, 50))  
+        shield_surface = get_translucent_surface(screen_width, screen_height, (50, 50, 50, 50), zoom_level)
         screen.blit(shield_surface, (screen_x, screen_y))
+
+def get_facing_edge(charge_x, charge_y, shield):
+    """
+    The edge of a shield a charge outside it faces squarely, as (plane, distance, margin):
+    plane is (axis, position, side), the edge's line x = position (axis 0) or y = position
+    (axis 1) with the charge on side (+1 or -1) of it; margin is the distance from the charge's
+    foot point to the nearer end of the edge. None if the charge is inside or off the edge ends.
+    """
+    x1, y1, width, height = shield
+    x2, y2 = x1 + width, y1 + height
+    if y1 <= charge_y <= y2:
+        margin = min(charge_y - y1, y2 - charge_y)
+        if charge_x < x1:
+            return (0, x1, -1), x1 - charge_x, margin
+        if charge_x > x2:
+            return (0, x2, 1), charge_x - x2, margin
+    if x1 <= charge_x <= x2:
+        margin = min(charge_x - x1, x2 - charge_x)
+        if charge_y < y1:
+            return (1, y1, -1), y1 - charge_y, margin
+        if charge_y > y2:
+            return (1, y2, 1), charge_y - y2, margin
+    return None
+
+def get_image_charges(charges, shields, edge_ratio=IMAGE_CHARGE_EDGE_RATIO):
+    """
+    Method-of-images charges for shields that act as a grounded plane on a charge: the charge
+    faces one of the shield's edges, and the edge reaches at least edge_ratio times the charge's
+    distance past its foot point in both directions (a half-plane is the limiting case). The
+    image, -q mirrored across the edge, then makes the edge an equipotential of a grounded plane.
+    Charges facing more than one such edge would need an infinite image series and keep the
+    general treatment (no image), as do charges no edge qualifies for.
+    Returns groups (plane, xs, ys, qs) of images per edge, where plane = (axis, position, side)
+    (see get_facing_edge); images only act on points on the charge's side of their edge.
+    """
+    if not IMAGE_CHARGES_ENABLED or not shields:
+        return []
+    key = (tuple(charges), tuple(shields), edge_ratio)
+    if key == image_charge_cache['key']:
+        return image_charge_cache['groups']
+
+    groups = {}
+    for (charge_x, charge_y, q) in charges:
+        planes = []
+        for shield in shields:
+            facing = get_facing_edge(charge_x, charge_y, shield)
+            if facing is not None and facing[1] > 0 and facing[2] >= edge_ratio * facing[1]:
+                planes.append(facing[0])
+        if len(planes) != 1:
+            continue
+        axis, position, side = planes[0]
+        if axis == 0:
+            image = (2 * position - charge_x, charge_y, -q)
+        else:
+            image = (charge_x, 2 * position - charge_y, -q)
+        groups.setdefault(planes[0], []).append(image)
+
+    image_charge_cache['key'] = key
+    image_charge_cache['groups'] = [
+        (plane, *(np.ascontiguousarray(column) for column in np.array(images, dtype=np.float64).T))
+        for plane, images in groups.items()
+    ]
+    return image_charge_cache['groups']
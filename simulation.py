@@ -0,0 +1,202 @@
+import math
+import numpy as np
+from settings import (
+    COULOMB_CONSTANT,
+    SIM_CHARGE_MASS,
+    SIM_SOFTENING,
+    SIM_TIME_STEP,
+    SIM_SUBSTEPS,
+    SIM_DIRECT_MAX_CHARGES,
+    SIM_TREE_LEAF_SIZE,
+)
+from electric_field import get_relative_permittivity_batch
+from charge_sources import get_source_arrays, has_sources, source_field
+
+# Dynamic state of the simulated charges; positions and charges mirror main.charges
+sim_state = {
+    'positions': np.zeros((0, 2)),
+    'velocities': np.zeros((0, 2)),
+    'masses': np.zeros(0),
+    'charges': np.zeros(0),
+    'accelerations': None,  # Accelerations at the current positions, reused by the next step
+    'last_output': (),  # Charge list returned by the last step, used to detect edits
+}
+
+def direct_field(positions, charges, softening=SIM_SOFTENING):
+    """
+    Softened Coulomb field at every charge from all the others, as one vectorized pairwise kernel.
+    The self term vanishes because its separation vector is zero.
+    """
+    dx = positions[:, 0, None] - positions[None, :, 0]
+    dy = positions[:, 1, None] - positions[None, :, 1]
+    r_squared = dx * dx + dy * dy + softening * softening
+    factor = charges[None, :] / (r_squared * np.sqrt(r_squared))
+    field = np.empty_like(positions)
+    field[:, 0] = np.einsum('ij,ij->i', factor, dx)
+    field[:, 1] = np.einsum('ij,ij->i', factor, dy)
+    return COULOMB_CONSTANT * field
+
+def tree_field(positions, charges, softening=SIM_SOFTENING, leaf_size=SIM_TREE_LEAF_SIZE):
+    """
+    Softened Coulomb field at every charge using a level-by-level quadtree approximation.
+    At each level a charge interacts with the per-sign monopoles of the cells that are children
+    of its parent's neighbours but not adjacent to its own cell; at the finest level the adjacent
+    cells are summed directly. Each level is vectorized over all charges.
+    """
+    n = len(charges)
+    xs = positions[:, 0]
+    ys = positions[:, 1]
+    soft_squared = softening * softening
+
+    min_x, min_y = xs.min(), ys.min()
+    size = max(xs.max() - min_x, ys.max() - min_y, softening) * (1 + 1e-9)
+    u = (xs - min_x) / size
+    v = (ys - min_y) / size
+    depth = min(10, max(2, math.ceil(math.log(max(n / leaf_size, 1.0), 4))))
+
+    ex = np.zeros(n)
+    ey = np.zeros(n)
+
+    def accumulate(indices, source_x, source_y, source_q):
+        dx = xs[indices] - source_x
+        dy = ys[indices] - source_y
+        r_squared = dx * dx + dy * dy + soft_squared
+        factor = source_q / (r_squared * np.sqrt(r_squared))
+        ex[:] += np.bincount(indices, factor * dx, minlength=n)
+        ey[:] += np.bincount(indices, factor * dy, minlength=n)
+
+    for level in range(2, depth + 1):
+        cells = 1 << level
+        ix = np.minimum((u * cells).astype(np.int64), cells - 1)
+        iy = np.minimum((v * cells).astype(np.int64), cells - 1)
+        cell = ix * cells + iy
+
+        # Each cell is summarised by two monopoles, one per sign, at the centres of its positive and
+        # negative charges; this keeps the cell's dipole moment, which dominates for neutral cells
+        cell_monopoles = []
+        for sign_mask in (charges > 0, charges < 0):
+            sign_q = np.where(sign_mask, charges, 0.0)
+            cell_q = np.bincount(cell, sign_q, minlength=cells * cells)
+            weight = np.where(cell_q != 0, cell_q, 1.0)
+            cell_x = np.bincount(cell, sign_q * xs, minlength=cells * cells) / weight
+            cell_y = np.bincount(cell, sign_q * ys, minlength=cells * cells) / weight
+            cell_monopoles.append((cell_x, cell_y, cell_q))
+
+        # Interaction list: the 6x6 block of children of the parent's neighbours, minus adjacent cells
+        base_x = (ix // 2) * 2 - 2
+        base_y = (iy // 2) * 2 - 2
+        for offset_x in range(6):
+            target_x = base_x + offset_x
+            valid_x = (target_x >= 0) & (target_x < cells)
+            far_x = np.abs(target_x - ix) > 1
+            for offset_y in range(6):
+                target_y = base_y + offset_y
+                mask = valid_x & (target_y >= 0) & (target_y < cells) & (far_x | (np.abs(target_y - iy) > 1))
+                indices = np.nonzero(mask)[0]
+                if indices.size == 0:
+                    continue
+                target = target_x[indices] * cells + target_y[indices]
+                for (cell_x, cell_y, cell_q) in cell_monopoles:
+                    accumulate(indices, cell_x[target], cell_y[target], cell_q[target])
+
+    # Near field: direct sums with every charge in the 3x3 neighbourhood at the finest level
+    cells = 1 << depth
+    ix = np.minimum((u * cells).astype(np.int64), cells - 1)
+    iy = np.minimum((v * cells).astype(np.int64), cells - 1)
+    cell = ix * cells + iy
+    order = np.argsort(cell, kind='stable')
+    counts = np.bincount(cell, minlength=cells * cells)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    for offset_x in (-1, 0, 1):
+        for offset_y in (-1, 0, 1):
+            neighbour_x = ix + offset_x
+            neighbour_y = iy + offset_y
+            valid = (neighbour_x >= 0) & (neighbour_x < cells) & (neighbour_y >= 0) & (neighbour_y < cells)
+            indices = np.nonzero(valid)[0]
+            neighbour = neighbour_x[indices] * cells + neighbour_y[indices]
+            neighbour_counts = counts[neighbour]
+            total = int(neighbour_counts.sum())
+            if total == 0:
+                continue
+            # Expand (charge, neighbour cell) into one row per (charge, source charge) pair
+            targets = np.repeat(indices, neighbour_counts)
+            within = np.arange(total) - np.repeat(np.cumsum(neighbour_counts) - neighbour_counts, neighbour_counts)
+            sources = order[np.repeat(starts[neighbour], neighbour_counts) + within]
+            accumulate(targets, xs[sources], ys[sources], charges[sources])
+
+    return COULOMB_CONSTANT * np.column_stack((ex, ey))
+
+def compute_accelerations(positions, charges, masses, dielectrics, shields, source_arrays=None):
+    """
+    Acceleration of every charge, using the pairwise kernel for small N and the tree for large N.
+    Line and plate charges in source_arrays stay fixed and add their field.
+    The field is scaled by the relative permittivity at each charge, as in calculate_field_fast.
+    """
+    if len(charges) == 0:
+        return np.zeros((0, 2))
+    if len(charges) <= SIM_DIRECT_MAX_CHARGES:
+        field = direct_field(positions, charges)
+    else:
+        field = tree_field(positions, charges)
+    if has_sources(source_arrays):
+        source_ex, source_ey, _ = source_field(positions[:, 0], positions[:, 1], source_arrays)
+        field = field + np.column_stack((source_ex, source_ey))
+    epsilon_r = get_relative_permittivity_batch(positions[:, 0], positions[:, 1], dielectrics, shields)
+    return field * (charges / (epsilon_r * masses))[:, None]
+
+def sync_simulation(charges):
+    """
+    Bring the simulation state in line with the charge list after edits.
+    Charges appended since the last step start at rest; any other edit restarts everything at rest.
+    """
+    if tuple(charges) == sim_state['last_output']:
+        return
+    count = len(sim_state['last_output'])
+    data = np.array(charges, dtype=np.float64).reshape(-1, 3)
+    if len(charges) >= count and tuple(charges[:count]) == sim_state['last_output']:
+        velocities = np.vstack((sim_state['velocities'], np.zeros((len(charges) - count, 2))))
+    else:
+        velocities = np.zeros((len(charges), 2))
+    sim_state['positions'] = data[:, :2].copy()
+    sim_state['velocities'] = velocities
+    sim_state['charges'] = data[:, 2].copy()
+    sim_state['masses'] = np.full(len(charges), SIM_CHARGE_MASS)
+    sim_state['accelerations'] = None
+    sim_state['last_output'] = tuple(charges)
+
+def reset_simulation():
+    """
+    Drop all velocities so the next step starts from rest.
+    """
+    sim_state['velocities'] = np.zeros((0, 2))
+    sim_state['last_output'] = ()
+
+def step_simulation(charges, dielectrics, shields, time_step=SIM_TIME_STEP, substeps=SIM_SUBSTEPS,
+                    line_charges=(), plate_charges=()):
+    """
+    Advance the charges by one frame with velocity-Verlet substeps and return the new charge list.
+    """
+    sync_simulation(charges)
+    positions = sim_state['positions']
+    velocities = sim_state['velocities']
+    masses = sim_state['masses']
+    charge_values = sim_state['charges']
+    if len(charge_values) == 0:
+        return list(charges)
+
+    source_arrays = get_source_arrays(line_charges, plate_charges)
+    accelerations = sim_state['accelerations']
+    if accelerations is None:
+        accelerations = compute_accelerations(positions, charge_values, masses, dielectrics, shields, source_arrays)
+
+    h = time_step / substeps
+    for _ in range(substeps):
+        velocities += 0.5 * h * accelerations
+        positions += h * velocities
+        accelerations = compute_accelerations(positions, charge_values, masses, dielectrics, shields, source_arrays)
+        velocities += 0.5 * h * accelerations
+
+    sim_state['accelerations'] = accelerations
+    new_charges = list(zip(positions[:, 0].tolist(), positions[:, 1].tolist(), charge_values.tolist()))
+    sim_state['last_output'] = tuple(new_charges)
+    return new_charges
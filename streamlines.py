@@ -0,0 +1,349 @@
+import collections
+import math
+import numpy as np
+from settings import (
+    CHARGE_RADIUS,
+    FIELD_LINE_MAX_CROSSINGS,
+    STREAMLINE_TEST_RATIO,
+    STREAMLINE_MAX_STEPS,
+    STREAMLINE_CHARGE_SEEDS,
+    STREAMLINE_TILE_NODES,
+)
+from electric_field import calculate_field_batch, get_charge_arrays
+from charge_sources import get_source_arrays, has_sources, source_distances, get_outline, outline_point, get_outline_perimeter
+from geometry import build_region_index, query_region_index, first_crossings, region_permittivity
+
+# Refraction state of a line outside dielectrics: (normal_axis, normal_scale), see refract
+UNREFRACTED = (-1, 1.0)
+
+def create_occupancy_grid(cell_size):
+    """
+    World-space occupancy grid: the points of every accepted line, bucketed into square cells
+    of cell_size (the line separation), so distance checks only look at neighbouring cells.
+    """
+    return {'cell_size': cell_size, 'cells': collections.defaultdict(list)}
+
+def add_to_occupancy_grid(grid, path):
+    """
+    Mark the points of an accepted line as occupied.
+    """
+    cell_size = grid['cell_size']
+    for x, y in path:
+        grid['cells'][(math.floor(x / cell_size), math.floor(y / cell_size))].append((x, y))
+
+def is_free(grid, x, y, distance):
+    """
+    Returns True if no occupied point lies within distance (at most the cell size) of (x, y).
+    """
+    cell_size = grid['cell_size']
+    cell_x, cell_y = math.floor(x / cell_size), math.floor(y / cell_size)
+    distance_squared = distance * distance
+    for neighbour_x in (cell_x - 1, cell_x, cell_x + 1):
+        for neighbour_y in (cell_y - 1, cell_y, cell_y + 1):
+            for (other_x, other_y) in grid['cells'].get((neighbour_x, neighbour_y), ()):
+                if (x - other_x) ** 2 + (y - other_y) ** 2 < distance_squared:
+                    return False
+    return True
+
+def create_direction_field(scene, bounds, spacing):
+    """
+    Unit field directions sampled on a world grid of the given spacing from the corner of bounds.
+    The grid is evaluated lazily in tiles of STREAMLINE_TILE_NODES nodes, the first time a line
+    reaches them, so each evaluation is one vectorized batch and empty areas cost nothing.
+    """
+    return {'scene': scene, 'origin': bounds[:2], 'spacing': spacing, 'tiles': {}}
+
+def get_direction_tile(direction_field, tile_x, tile_y):
+    """
+    Direction components of one tile as nested lists [row][column], including the nodes it
+    shares with the next tiles, computed on first use.
+    """
+    tile = direction_field['tiles'].get((tile_x, tile_y))
+    if tile is None:
+        charges, dielectrics, shields, line_charges, plate_charges = direction_field['scene']
+        origin_x, origin_y = direction_field['origin']
+        nodes = np.arange(STREAMLINE_TILE_NODES + 1)
+        grid_xs, grid_ys = np.meshgrid(
+            origin_x + (tile_x * STREAMLINE_TILE_NODES + nodes) * direction_field['spacing'],
+            origin_y + (tile_y * STREAMLINE_TILE_NODES + nodes) * direction_field['spacing'],
+        )
+        ex, ey, _ = calculate_field_batch(
+            grid_xs, grid_ys, charges, dielectrics, shields, 'float64', line_charges, plate_charges
+        )
+        magnitude = np.hypot(ex, ey)
+        magnitude[~(magnitude > 0) | ~np.isfinite(magnitude)] = np.inf  # No direction where the field vanishes
+        tile = ((ex / magnitude).tolist(), (ey / magnitude).tolist())
+        direction_field['tiles'][(tile_x, tile_y)] = tile
+    return tile
+
+def get_direction(direction_field, x, y):
+    """
+    Bilinearly interpolated unit vector along the field at (x, y), or None where the field
+    vanishes or changes direction within a grid cell.
+    """
+    origin_x, origin_y = direction_field['origin']
+    grid_x = (x - origin_x) / direction_field['spacing']
+    grid_y = (y - origin_y) / direction_field['spacing']
+    node_x, node_y = math.floor(grid_x), math.floor(grid_y)
+    tile_x, column = divmod(node_x, STREAMLINE_TILE_NODES)
+    tile_y, row = divmod(node_y, STREAMLINE_TILE_NODES)
+    ux, uy = get_direction_tile(direction_field, tile_x, tile_y)
+    fx, fy = grid_x - node_x, grid_y - node_y
+    top_x, bottom_x = ux[row], ux[row + 1]
+    top_y, bottom_y = uy[row], uy[row + 1]
+    dx = (1 - fy) * ((1 - fx) * top_x[column] + fx * top_x[column + 1]) + fy * ((1 - fx) * bottom_x[column] + fx * bottom_x[column + 1])
+    dy = (1 - fy) * ((1 - fx) * top_y[column] + fx * top_y[column + 1]) + fy * ((1 - fx) * bottom_y[column] + fx * bottom_y[column + 1])
+    length = math.hypot(dx, dy)
+    if length < 0.5:  # Corner directions largely cancel, e.g. at a charge or a null point
+        return None
+    return dx / length, dy / length
+
+def refract(direction, refraction):
+    """
+    The unit vector direction with its component along the normal of the boundary the line last
+    crossed scaled, for a refraction state (normal_axis, normal_scale) as in
+    electric_field.get_step_directions.
+    """
+    normal_axis, normal_scale = refraction
+    if normal_axis < 0:
+        return direction
+    dx, dy = direction
+    if normal_axis == 0:
+        dx *= normal_scale
+    else:
+        dy *= normal_scale
+    length = math.hypot(dx, dy)
+    return dx / length, dy / length
+
+def step_streamline(direction_field, x, y, step_size, refraction=UNREFRACTED):
+    """
+    Direction of one midpoint (RK2) step of step_size along the field (negative: against it),
+    before refraction, or None where the field has no direction.
+    """
+    direction = get_direction(direction_field, x, y)
+    if direction is None:
+        return None
+    dx, dy = refract(direction, refraction)
+    return get_direction(direction_field, x + 0.5 * step_size * dx, y + 0.5 * step_size * dy)
+
+def advance_streamline(direction_field, region_index, x, y, step_size, refraction):
+    """
+    One step of a line from (x, y), clipped against the shield and dielectric rectangles like a
+    step of electric_field.iterate_trace_seeds: the line ends where it enters a shield, and at a
+    dielectric boundary the rest of the step continues in the refracted direction.
+    Returns (points, refraction, stopped): the points reached (boundary crossings, then the end
+    point), the refraction state there and whether a shield stopped the line; None where the
+    field has no direction.
+    """
+    direction = step_streamline(direction_field, x, y, step_size, refraction)
+    if direction is None:
+        return None
+    points = []
+    remaining = step_size
+    extent = region_index['extent']
+    for _ in range(FIELD_LINE_MAX_CROSSINGS):
+        dx, dy = refract(direction, refraction)
+        end_x, end_y = x + remaining * dx, y + remaining * dy
+        if extent is None or (
+            max(x, end_x) < extent[0] or min(x, end_x) > extent[2]
+            or max(y, end_y) < extent[1] or min(y, end_y) > extent[3]
+        ):
+            break  # Nowhere near a region, which is the common case
+        start_xs, start_ys = np.array([x]), np.array([y])
+        end_xs, end_ys = np.array([end_x]), np.array([end_y])
+        candidates = query_region_index(region_index, start_xs, start_ys, end_xs, end_ys)
+        t, rect, axis = first_crossings(start_xs, start_ys, end_xs, end_ys, region_index['rects'][candidates])
+        if not t[0] <= 1:
+            break
+        t = float(t[0])
+        x, y = x + t * (end_x - x), y + t * (end_y - y)
+        points.append((x, y))
+        remaining *= 1 - t
+        if region_index['is_shield'][candidates[rect[0]]]:
+            return points, refraction, True
+        # Permittivity just past the crossing decides how the rest of the step bends
+        probe = 1e-6 * step_size
+        epsilon_r = float(region_permittivity(region_index, np.array([x + probe * dx]), np.array([y + probe * dy]))[0])
+        refraction = (int(axis[0]), 1 / epsilon_r) if epsilon_r != 1 else UNREFRACTED
+    dx, dy = refract(direction, refraction)
+    points.append((x + remaining * dx, y + remaining * dy))
+    return points, refraction, False
+
+def create_blockers(charge_arrays, source_arrays, shields):
+    """
+    Where field lines end: charges (bucketed in an occupancy grid), line and plate charges (with
+    boxes around them for a quick rejection) and shields.
+    """
+    charge_grid = create_occupancy_grid(CHARGE_RADIUS)
+    add_to_occupancy_grid(charge_grid, zip(charge_arrays[0].tolist(), charge_arrays[1].tolist()))
+    boxes = []
+    if has_sources(source_arrays):
+        for shape in source_arrays['lines']:
+            boxes.append((min(shape[0], shape[2]), min(shape[1], shape[3]), max(shape[0], shape[2]), max(shape[1], shape[3])))
+        for shape in source_arrays['plates']:
+            boxes.append((shape[0], shape[1], shape[0] + shape[2], shape[1] + shape[3]))
+    return {
+        'charge_grid': charge_grid,
+        'source_arrays': source_arrays,
+        'source_boxes': [
+            (min_x - CHARGE_RADIUS, min_y - CHARGE_RADIUS, max_x + CHARGE_RADIUS, max_y + CHARGE_RADIUS)
+            for (min_x, min_y, max_x, max_y) in boxes
+        ],
+        'shields': shields,
+    }
+
+def is_blocked(blockers, x, y):
+    """
+    Returns True if a point is on a charge, a line or plate charge, or inside a shield.
+    """
+    if not is_free(blockers['charge_grid'], x, y, CHARGE_RADIUS):
+        return True
+    if any(min_x <= x <= max_x and min_y <= y <= max_y for (min_x, min_y, max_x, max_y) in blockers['source_boxes']):
+        if source_distances(blockers['source_arrays'], [x], [y]).min() < CHARGE_RADIUS:
+            return True
+    return any(sx <= x <= sx + width and sy <= y <= sy + height for (sx, sy, width, height) in blockers['shields'])
+
+def get_initial_seeds(charge_arrays, source_arrays, region_index, bounds, separation, priority):
+    """
+    Seeds tried whenever the lines found so far have no free neighbours left: a ring of
+    STREAMLINE_CHARGE_SEEDS points around every charge, line and plate charge, then a lattice
+    over bounds so regions no line reaches are still filled. Each group is sorted by priority,
+    a function of (x, y). Lattice points inside dielectrics are left out, since the boundary a
+    line there entered through, which decides its refraction, is unknown; lines reach them from
+    outside instead.
+    """
+    xs, ys, _ = charge_arrays
+    ring = CHARGE_RADIUS + 0.5 * separation
+    angles = 2 * math.pi * np.arange(STREAMLINE_CHARGE_SEEDS) / STREAMLINE_CHARGE_SEEDS
+    charge_seeds = [
+        (x + ring * math.cos(angle), y + ring * math.sin(angle)) for x, y in zip(xs, ys) for angle in angles
+    ]
+    if has_sources(source_arrays):
+        for index in range(len(source_arrays['qs'])):
+            outline = get_outline(source_arrays, index)
+            perimeter = get_outline_perimeter(outline, ring)
+            charge_seeds += [
+                outline_point(outline, perimeter * angle / (2 * math.pi), ring) for angle in angles
+            ]
+    min_x, min_y, max_x, max_y = bounds
+    lattice_xs, lattice_ys = np.meshgrid(
+        np.arange(min_x + separation, max_x, 2 * separation), np.arange(min_y + separation, max_y, 2 * separation),
+        indexing='ij',
+    )
+    outside = region_permittivity(region_index, lattice_xs.ravel(), lattice_ys.ravel()) == 1
+    lattice_seeds = list(zip(lattice_xs.ravel()[outside].tolist(), lattice_ys.ravel()[outside].tolist()))
+    return sorted(charge_seeds, key=lambda seed: priority(*seed)) + sorted(lattice_seeds, key=lambda seed: priority(*seed))
+
+def trace_streamline(direction_field, region_index, blockers, grid, seed_x, seed_y, refraction, bounds, step_size,
+                     test_distance):
+    """
+    Generator tracing a line from a seed along and against the field in lockstep, yielding once
+    per step. refraction is the seed's refraction state (see refract). Each half stops where it
+    leaves bounds, ends on a charge or shield, or comes within test_distance of an accepted line.
+    Returns the path as a list of points along the field and the refraction state at each point.
+    """
+    min_x, min_y, max_x, max_y = bounds
+    halves = {1: [(seed_x, seed_y)], -1: [(seed_x, seed_y)]}
+    refractions = {1: [refraction], -1: [refraction]}
+    active = [1, -1]
+    for _ in range(STREAMLINE_MAX_STEPS):
+        for direction in list(active):
+            x, y = halves[direction][-1]
+            step = advance_streamline(
+                direction_field, region_index, x, y, direction * step_size, refractions[direction][-1]
+            )
+            if step is None:
+                active.remove(direction)
+                continue
+            points, refraction, stopped = step
+            point = points[-1]
+            if (
+                not (min_x <= point[0] <= max_x and min_y <= point[1] <= max_y)
+                or not is_free(grid, point[0], point[1], test_distance)
+            ):
+                active.remove(direction)
+                continue
+            halves[direction] += points
+            refractions[direction] += [refraction] * len(points)
+            if stopped or is_blocked(blockers, *point):
+                active.remove(direction)  # Keep the end point so the line touches the charge or shield
+        if not active:
+            break
+        yield
+    return halves[-1][::-1] + halves[1][1:], refractions[-1][::-1] + refractions[1][1:]
+
+def get_neighbour_seeds(path, refractions, region_index, separation):
+    """
+    Seed candidates one separation to either side of every point of a line, as (x, y, refraction).
+    A candidate in the same region as its line point takes over the point's refraction state,
+    one outside every dielectric is unrefracted, and one inside another dielectric is dropped.
+    """
+    points = np.array(path)
+    tangents = np.gradient(points, axis=0)
+    lengths = np.hypot(tangents[:, 0], tangents[:, 1])
+    lengths[lengths == 0] = 1
+    normals = np.column_stack((-tangents[:, 1], tangents[:, 0])) / lengths[:, None] * separation
+    candidates = np.empty((2 * len(points), 2))
+    candidates[0::2] = points + normals
+    candidates[1::2] = points - normals
+    point_epsilon = np.repeat(region_permittivity(region_index, points[:, 0], points[:, 1]), 2)
+    candidate_epsilon = region_permittivity(region_index, candidates[:, 0], candidates[:, 1])
+    seeds = []
+    for (x, y), epsilon_r, own_epsilon, refraction in zip(
+        candidates.tolist(), candidate_epsilon.tolist(), point_epsilon.tolist(),
+        (refraction for refraction in refractions for _ in range(2)),
+    ):
+        if epsilon_r == own_epsilon:
+            seeds.append((x, y, refraction))
+        elif epsilon_r == 1:
+            seeds.append((x, y, UNREFRACTED))
+    return seeds
+
+def iterate_streamlines(charges, dielectrics, shields, bounds, separation, step_size, priority,
+                        line_charges=(), plate_charges=(), region_index=None):
+    """
+    Evenly spaced field lines (Jobard-Lefer) within the world rectangle bounds, as a generator
+    that yields once per integration step, or a finished (path, 1) line.
+    A seed is accepted when no line lies within separation of it; lines grow until they come
+    within STREAMLINE_TEST_RATIO of the separation of another line. New seeds are taken beside
+    the lines in the order they were accepted, then from get_initial_seeds. priority(x, y)
+    orders the initial seeds, so the view and the cursor area fill first.
+    Lines refract at dielectric boundaries like the 'charges' layout's; region_index (see
+    geometry.build_region_index) is built from the dielectrics and shields if not given.
+    """
+    charge_arrays = get_charge_arrays(charges)
+    source_arrays = get_source_arrays(line_charges, plate_charges)
+    if region_index is None:
+        region_index = build_region_index(dielectrics, shields)
+    blockers = create_blockers(charge_arrays, source_arrays, shields)
+    # Sampled finely enough to resolve the field around a charge
+    direction_field = create_direction_field(
+        (charges, dielectrics, shields, line_charges, plate_charges), bounds, min(step_size, 0.5 * CHARGE_RADIUS)
+    )
+    min_x, min_y, max_x, max_y = bounds
+    grid = create_occupancy_grid(separation)
+    test_distance = STREAMLINE_TEST_RATIO * separation
+    initial_seeds = iter(get_initial_seeds(charge_arrays, source_arrays, region_index, bounds, separation, priority))
+    accepted_lines = collections.deque()  # Lines whose neighbours have not all been tried yet
+    while True:
+        if accepted_lines:
+            candidates = get_neighbour_seeds(*accepted_lines.popleft(), region_index, separation)
+        else:
+            seed = next(initial_seeds, None)
+            if seed is None:
+                return
+            candidates = [(*seed, UNREFRACTED)]
+        for seed_x, seed_y, refraction in candidates:
+            if not (min_x <= seed_x <= max_x and min_y <= seed_y <= max_y):
+                continue
+            if is_blocked(blockers, seed_x, seed_y) or not is_free(grid, seed_x, seed_y, separation):
+                continue
+            path, refractions = yield from trace_streamline(
+                direction_field, region_index, blockers, grid, seed_x, seed_y, refraction, bounds, step_size,
+                test_distance,
+            )
+            if len(path) < 3:
+                continue
+            add_to_occupancy_grid(grid, path)
+            accepted_lines.append((path, refractions))
+            yield np.array(path), 1
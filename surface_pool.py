@@ -0,0 +1,23 @@
+import pygame
+
+# Translucent fill surfaces reused across frames, keyed by (width, height, color).
+# The pool is flushed whenever the zoom level changes, since every size changes with it.
+translucent_surfaces = {}
+pool_zoom_level = None
+
+def get_translucent_surface(width, height, color, zoom_level):
+    """
+    Return a SRCALPHA surface of the given size filled with color, reusing a pooled one if possible.
+    """
+    global pool_zoom_level
+    if zoom_level != pool_zoom_level:
+        translucent_surfaces.clear()
+        pool_zoom_level = zoom_level
+
+    key = (width, height, color)
+    surface = translucent_surfaces.get(key)
+    if surface is None:
+        surface = pygame.Surface((max(0, width), max(0, height)), pygame.SRCALPHA)
+        surface.fill(color)
+        translucent_surfaces[key] = surface
+    return surface
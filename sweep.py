@@ -0,0 +1,223 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from settings import SWEEP_WORKERS, SWEEP_TASKS_PER_WORKER
+from electric_field import calculate_field_batch
+from field_cache import get_field_grid
+from scene_file import load_scene
+
+# Editable fields of each scene entry, in tuple order
+SCENE_FIELDS = {
+    'charges': ('x', 'y', 'q'),
+    'dielectrics': ('x', 'y', 'width', 'height', 'epsilon_r'),
+    'shields': ('x', 'y', 'width', 'height'),
+    'line_charges': ('x1', 'y1', 'x2', 'y2', 'q'),
+    'plate_charges': ('x', 'y', 'width', 'height', 'q'),
+}
+
+def load_sweep_spec(path):
+    """
+    Read a sweep specification:
+        {
+            "scene": "scene.json" (relative to the spec) or {"charges": [...], ...},
+            "parameters": {"dielectrics.0.epsilon_r": [1, 2, 5], "charges.1.q": {"start": 0.5, "stop": 2, "num": 4}},
+            "probes": [[x, y], ...],
+            "grid": {"bounds": [min_x, min_y, max_x, max_y], "columns": 20, "rows": 15}
+        }
+    Parameters are named kind.index.field (see SCENE_FIELDS) and take a list of values or a
+    linspace range. Probes and grid are optional.
+    """
+    with open(path) as spec_file:
+        spec = json.load(spec_file)
+    if isinstance(spec['scene'], str):
+        scene = dict(zip(SCENE_FIELDS, load_scene(os.path.join(os.path.dirname(path), spec['scene']))))
+    else:
+        scene = {kind: [tuple(entry) for entry in spec['scene'].get(kind, [])] for kind in SCENE_FIELDS}
+    parameters = {}
+    for name, values in spec.get('parameters', {}).items():
+        kind, index, field = parse_parameter(name)
+        if kind not in SCENE_FIELDS or field not in SCENE_FIELDS[kind]:
+            raise ValueError(f"Unknown sweep parameter: {name}")
+        if isinstance(values, dict):
+            values = np.linspace(values['start'], values['stop'], values['num']).tolist()
+        parameters[name] = list(values)
+    return {
+        'scene': scene,
+        'parameters': parameters,
+        'probes': [tuple(probe) for probe in spec.get('probes', [])],
+        'grid': spec.get('grid'),
+    }
+
+def parse_parameter(name):
+    """
+    Split a kind.index.field parameter name.
+    """
+    kind, index, field = name.split('.')
+    return kind, int(index), field
+
+def iterate_variants(parameters):
+    """
+    Yield (variant_id, {name: value}) for every combination of parameter values, in a fixed order.
+    """
+    names = list(parameters)
+    for variant_id, values in enumerate(itertools.product(*(parameters[name] for name in names))):
+        yield variant_id, dict(zip(names, values))
+
+def apply_variant(scene, values):
+    """
+    Copy of the scene with the parameter values substituted.
+    """
+    variant = {kind: [list(entry) for entry in entries] for kind, entries in scene.items()}
+    for name, value in values.items():
+        kind, index, field = parse_parameter(name)
+        variant[kind][index][SCENE_FIELDS[kind].index(field)] = value
+    return {kind: [tuple(entry) for entry in entries] for kind, entries in variant.items()}
+
+# Quantities stored for every grid node, in the order evaluate_variant returns them
+GRID_QUANTITIES = ('Ex', 'Ey', 'V')
+
+def get_result_columns(spec):
+    """
+    CSV output columns: variant id, parameter values, then Ex, Ey, V and |E| of every probe.
+    Grids are stored separately, see open_grid_outputs.
+    """
+    columns = ['variant'] + list(spec['parameters'])
+    for probe_index in range(len(spec['probes'])):
+        columns += [f"probe{probe_index}_{quantity}" for quantity in ('Ex', 'Ey', 'V', 'E')]
+    return columns
+
+def get_grid_output_path(output_path, quantity):
+    """
+    .npy file holding one grid quantity of every variant, next to the CSV output.
+    """
+    return f"{os.path.splitext(output_path)[0]}_grid_{quantity}.npy"
+
+def open_grid_outputs(output_path, grid, total):
+    """
+    Memory-mapped float64 arrays of shape (total, rows, columns), one per GRID_QUANTITIES entry,
+    indexed by variant id. New files start out as NaN; existing ones from an interrupted run are
+    reopened for writing, and must have the same shape.
+    """
+    shape = (total, grid['rows'], grid['columns'])
+    outputs = {}
+    for quantity in GRID_QUANTITIES:
+        path = get_grid_output_path(output_path, quantity)
+        if os.path.exists(path):
+            array = np.lib.format.open_memmap(path, mode='r+')
+            if array.shape != shape or array.dtype != np.float64:
+                raise ValueError(f"{path} was written by a different sweep specification")
+        else:
+            array = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=shape)
+            array[:] = np.nan
+        outputs[quantity] = array
+    return outputs
+
+def evaluate_variant(task):
+    """
+    Worker: evaluate one variant's probes and grid with the simulator's field code. Grids come
+    from field_cache.get_field_grid, over the grid worker pool only if use_grid_pool is set.
+    Returns a row for the CSV output and the (Ex, Ey, V) grids, or None without a grid.
+    """
+    variant_id, values, scene, probes, grid, use_grid_pool = task
+    charges, dielectrics, shields = scene['charges'], scene['dielectrics'], scene['shields']
+    sources = {'line_charges': scene['line_charges'], 'plate_charges': scene['plate_charges']}
+    row = [variant_id] + list(values.values())
+    if probes:
+        probe_xs, probe_ys = np.array(probes, dtype=np.float64).T
+        ex, ey, potential = calculate_field_batch(probe_xs, probe_ys, charges, dielectrics, shields, **sources)
+        for probe_index in range(len(probes)):
+            row += [ex[probe_index], ey[probe_index], potential[probe_index], np.hypot(ex[probe_index], ey[probe_index])]
+    grids = None
+    if grid:
+        grids = get_field_grid(
+            tuple(grid['bounds']), grid['columns'], grid['rows'], charges, dielectrics, shields, 'float64',
+            use_pool=use_grid_pool, **sources,
+        )
+    return [float(value) if isinstance(value, (float, np.floating)) else value for value in row], grids
+
+def get_completed_variants(output_path, columns):
+    """
+    Variant ids already in an output file from an interrupted run. A partly written last line
+    is cut off so appending continues cleanly.
+    """
+    if not os.path.exists(output_path):
+        return set()
+    with open(output_path, 'rb+') as output_file:
+        data = output_file.read()
+        if data and not data.endswith(b'\n'):
+            output_file.truncate(data.rfind(b'\n') + 1)
+    with open(output_path, newline='') as output_file:
+        reader = csv.reader(output_file)
+        header = next(reader, None)
+        if header is None:
+            return set()
+        if header != columns:
+            raise ValueError(f"{output_path} was written by a different sweep specification")
+        return {int(row[0]) for row in reader if row}
+
+def run_sweep(spec_path, output_path, workers=SWEEP_WORKERS):
+    """
+    Evaluate every variant of a sweep over a process pool, appending each result row to the
+    CSV output as soon as it arrives. Grids are written to per-quantity .npy files (see
+    open_grid_outputs) before their variant's row, so a row marks the variant finished.
+    Rerunning with the same output skips finished variants.
+    """
+    spec = load_sweep_spec(spec_path)
+    columns = get_result_columns(spec)
+    completed = get_completed_variants(output_path, columns)
+    workers = workers or os.cpu_count() or 1
+    # With a single sweep worker, large grids still spread over the CPUs through the grid pool
+    pending = (
+        (variant_id, values, apply_variant(spec['scene'], values), spec['probes'], spec['grid'], workers == 1)
+        for variant_id, values in iterate_variants(spec['parameters'])
+        if variant_id not in completed
+    )
+    total = int(np.prod([len(values) for values in spec['parameters'].values()]))
+    done = len(completed)
+    print(f"Sweep: {total} variants, {done} already done")
+    grid_outputs = open_grid_outputs(output_path, spec['grid'], total) if spec['grid'] else {}
+
+    with open(output_path, 'a', newline='') as output_file, ProcessPoolExecutor(max_workers=workers) as pool:
+        writer = csv.writer(output_file)
+        if not completed and output_file.tell() == 0:
+            writer.writerow(columns)
+
+        def write_finished(futures):
+            # Wait for at least one result and append every finished row
+            finished, still_running = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                row, grids = future.result()
+                if grids is not None:
+                    for quantity, values in zip(GRID_QUANTITIES, grids):
+                        grid_outputs[quantity][row[0]] = values
+                        grid_outputs[quantity].flush()
+                writer.writerow(row)
+            output_file.flush()
+            print(f"Sweep progress: {done + len(finished)}/{total}")
+            return len(finished), still_running
+
+        # Keep a bounded number of tasks in flight so huge sweeps are not queued all at once
+        in_flight = set()
+        for task in pending:
+            if len(in_flight) >= workers * SWEEP_TASKS_PER_WORKER:
+                finished_count, in_flight = write_finished(in_flight)
+                done += finished_count
+            in_flight.add(pool.submit(evaluate_variant, task))
+        while in_flight:
+            finished_count, in_flight = write_finished(in_flight)
+            done += finished_count
+    return done
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate probes and field grids over a parameter sweep.")
+    parser.add_argument('spec', help="sweep specification (JSON)")
+    parser.add_argument(
+        'output', help="CSV file results are appended to, with grids in OUTPUT_grid_<quantity>.npy; rerun to resume"
+    )
+    parser.add_argument('--workers', type=int, default=SWEEP_WORKERS, help="worker processes (default: CPU count)")
+    arguments = parser.parse_args()
+    run_sweep(arguments.spec, arguments.output, arguments.workers)
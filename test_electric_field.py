@@ -0,0 +1,22 @@
+import numpy as np
+from electric_field import calculate_field_fast, coulomb_sum, get_charge_arrays
+
+def test_coulomb_sum_integer_points():
+    """
+    Integer probe coordinates give the same float64 results as float coordinates.
+    """
+    xs, ys, qs = get_charge_arrays([(0.5, -0.25, 1.0), (7.0, 2.0, -2.0)])
+    integer = coulomb_sum(np.array([3, -4]), np.array([4, 1]), xs, ys, qs)
+    floating = coulomb_sum(np.array([3.0, -4.0]), np.array([4.0, 1.0]), xs, ys, qs)
+    for integer_values, float_values in zip(integer, floating):
+        assert integer_values.dtype == np.float64
+        np.testing.assert_allclose(integer_values, float_values, rtol=1e-12)
+
+def test_calculate_field_fast_integer_point():
+    """
+    A probe at an integer world position is not truncated.
+    """
+    charges = [(0.5, -0.25, 1.0), (7.0, 2.0, -2.0)]
+    integer = calculate_field_fast(3, 4, charges, [], [])
+    floating = calculate_field_fast(3.0, 4.0, charges, [], [])
+    np.testing.assert_allclose(integer, floating, rtol=1e-12)
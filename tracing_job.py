@@ -0,0 +1,302 @@
+import heapq
+import itertools
+import time
+import numpy as np
+from settings import (
+    TRACE_BATCH_SIZE,
+    STREAMLINE_SEPARATION,
+    STREAMLINE_TEST_RATIO,
+    STREAMLINE_STEPS_PER_FRAME,
+    LINE_COLOR,
+    LINE_WIDTH,
+    FIELD_LINE_ARROW_INTERVAL,
+)
+from electric_field import (
+    get_charge_arrays,
+    get_lod_stepping,
+    get_positive_seeds,
+    get_negative_seeds,
+    record_arrivals,
+    iterate_trace_seeds,
+    trace_seeds,
+)
+from charge_sources import get_source_arrays
+from shield import get_image_charges
+from field_cache import load_field_lines, store_field_lines
+from geometry import build_region_index
+from line_raster import create_line_layer, update_line_layer
+from streamlines import iterate_streamlines
+
+def bounds_contain(outer, inner):
+    """
+    Returns True if the (min_x, min_y, max_x, max_y) rectangle inner lies inside outer.
+    """
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+def seed_priority(seed_x, seed_y, view_bounds, cursor):
+    """
+    Sort key for a seed: seeds on screen first, then by squared distance to the cursor (world units).
+    """
+    min_x, min_y, max_x, max_y = view_bounds
+    hidden = not (min_x <= seed_x <= max_x and min_y <= seed_y <= max_y)
+    distance_squared = (seed_x - cursor[0]) ** 2 + (seed_y - cursor[1]) ** 2
+    return (hidden, distance_squared)
+
+def create_tracing_job(key, charges, dielectrics, shields, trace_bounds, view_bounds, cursor, lod,
+                       cache_key=None, line_charges=(), plate_charges=(), layout='charges', zoom_level=1.0):
+    """
+    Create a resumable field line tracing job for one scene state.
+    key identifies the scene and level of detail; trace_bounds is the world rectangle lines
+    are traced in, and view_bounds and cursor (world coordinates) prioritise the seeds.
+    With the 'charges' layout, positive charge lines are traced first, since the negative seeds
+    depend on where they arrive. The 'even' layout places evenly spaced streamlines
+    STREAMLINE_SEPARATION screen pixels apart at zoom_level (see streamlines.py).
+    With a cache_key (see field_cache.get_trace_cache_key) the job starts finished when the
+    lines are in the disk cache, and stores them there once it finishes otherwise.
+    """
+    step_size, max_steps = get_lod_stepping(lod)
+    job = {
+        'key': key,
+        'charge_arrays': get_charge_arrays(charges),
+        'source_arrays': get_source_arrays(line_charges, plate_charges),
+        'region_index': build_region_index(dielectrics, shields),
+        'image_groups': get_image_charges(charges, shields),
+        'bounds': trace_bounds,
+        'view_bounds': view_bounds,
+        'cursor': cursor,
+        'lod': lod,
+        'step_size': step_size,
+        'max_steps': max_steps,
+        'phase': 'positive',
+        'queue': [],
+        'counter': itertools.count(),  # Tie-breaker keeping equal priorities in insertion order
+        'batch': None,  # Generator tracing the current lockstep batch
+        'batch_direction': 1,
+        'arrivals': {},
+        'lines': [],  # Finished world-space lines as (path, direction)
+        'seeds': [],  # Seed of every line, None for lines from the disk cache or the 'even' layout
+        'captured': [],  # Capturing charge index of every line (see iterate_trace_seeds)
+        'scene': (tuple(charges), tuple(line_charges), tuple(plate_charges)),  # What patch_tracing_job keeps
+        'done': False,
+        'layer': None,  # Rasterized lines, see get_job_layer
+        'cache_key': cache_key,
+        'streamlines': None,  # Generator of the 'even' layout
+    }
+    cached_lines = load_field_lines(cache_key) if cache_key else None
+    if cached_lines is not None:
+        job['lines'] = cached_lines
+        job['seeds'] = None
+        job['done'] = True
+        job['cache_key'] = None  # Already stored
+    elif layout == 'even':
+        job['seeds'] = None
+        # Coarser levels of detail space the lines out in proportion to their seed fraction
+        separation = STREAMLINE_SEPARATION / zoom_level / lod['seed_fraction']
+        job['streamlines'] = iterate_streamlines(
+            charges, dielectrics, shields, trace_bounds, separation,
+            min(step_size, 0.5 * STREAMLINE_TEST_RATIO * separation),
+            lambda seed_x, seed_y: seed_priority(seed_x, seed_y, view_bounds, cursor),
+            line_charges, plate_charges, job['region_index'],
+        )
+    else:
+        push_seeds(job, *get_positive_seeds(job['charge_arrays'], lod['seed_fraction'], job['source_arrays']))
+    return job
+
+def push_seeds(job, seed_xs, seed_ys):
+    """
+    Queue seeds for the job's current phase.
+    """
+    for seed_x, seed_y in zip(seed_xs, seed_ys):
+        priority = seed_priority(seed_x, seed_y, job['view_bounds'], job['cursor'])
+        heapq.heappush(job['queue'], (priority, next(job['counter']), seed_x, seed_y))
+
+def reprioritize_job(job, view_bounds, cursor):
+    """
+    Re-sort the queued seeds for a new view or cursor position.
+    """
+    job['view_bounds'] = view_bounds
+    job['cursor'] = cursor
+    job['queue'] = [
+        (seed_priority(seed_x, seed_y, view_bounds, cursor), count, seed_x, seed_y)
+        for (_, count, seed_x, seed_y) in job['queue']
+    ]
+    heapq.heapify(job['queue'])
+
+def start_next_batch(job):
+    """
+    Start tracing the next TRACE_BATCH_SIZE seeds, moving on to the negative phase when the
+    positive seeds run out. Returns False once there is nothing left to trace.
+    """
+    if not job['queue'] and job['phase'] == 'positive':
+        job['phase'] = 'negative'
+        push_seeds(job, *get_negative_seeds(
+            job['charge_arrays'], job['arrivals'], job['lod']['seed_fraction'], job['source_arrays']
+        ))
+    if not job['queue']:
+        return False
+
+    seeds = [heapq.heappop(job['queue']) for _ in range(min(TRACE_BATCH_SIZE, len(job['queue'])))]
+    direction, capture_sign = (1, -1) if job['phase'] == 'positive' else (-1, 1)
+    job['batch_direction'] = direction
+    job['batch_seeds'] = [(seed[2], seed[3]) for seed in seeds]
+    job['batch'] = iterate_trace_seeds(
+        [seed[2] for seed in seeds],
+        [seed[3] for seed in seeds],
+        direction,
+        job['charge_arrays'],
+        job['region_index'],
+        job['bounds'],
+        capture_sign,
+        job['step_size'],
+        job['max_steps'],
+        job['source_arrays'],
+        job['image_groups'],
+    )
+    return True
+
+def finish_job(job):
+    """
+    Mark a job finished and store its lines in the disk cache if it has a cache key.
+    """
+    job['done'] = True
+    if job['cache_key']:
+        store_field_lines(job['cache_key'], job['lines'])
+
+def advance_streamlines(job):
+    """
+    Trace STREAMLINE_STEPS_PER_FRAME steps of an 'even' layout job. Returns True once finished.
+    """
+    for _ in range(STREAMLINE_STEPS_PER_FRAME):
+        try:
+            line = next(job['streamlines'])
+        except StopIteration:
+            finish_job(job)
+            break
+        if line is not None:
+            job['lines'].append(line)
+    return job['done']
+
+def advance_job(job, budget_ms):
+    """
+    Trace for up to budget_ms milliseconds, one lockstep step at a time. 'even' layout jobs
+    trace a fixed number of steps instead (see advance_streamlines).
+    Returns True once the job has finished.
+    """
+    if job['streamlines'] is not None and not job['done']:
+        return advance_streamlines(job)
+    deadline = time.perf_counter() + budget_ms / 1000
+    while not job['done'] and time.perf_counter() < deadline:
+        if job['batch'] is None and not start_next_batch(job):
+            finish_job(job)
+            break
+        try:
+            next(job['batch'])
+        except StopIteration as finished:
+            paths, captured = finished.value
+            if job['phase'] == 'positive':
+                record_arrivals(paths, captured, job['charge_arrays'], job['arrivals'], job['source_arrays'])
+            job['lines'].extend((path, job['batch_direction']) for path in paths)
+            job['seeds'].extend(job['batch_seeds'])
+            job['captured'].extend(captured.tolist())
+            job['batch'] = None
+    return job['done']
+
+def crosses_bounds(path, changed_bounds):
+    """
+    Returns True if a segment of a line (an (n, 2) point array) touches any of the world
+    rectangles changed_bounds.
+    """
+    if len(path) > 1:
+        low = np.minimum(path[:-1], path[1:])
+        high = np.maximum(path[:-1], path[1:])
+    else:
+        low = high = path
+    for (min_x, min_y, max_x, max_y) in changed_bounds:
+        if np.any((low[:, 0] <= max_x) & (high[:, 0] >= min_x) & (low[:, 1] <= max_y) & (high[:, 1] >= min_y)):
+            return True
+    return False
+
+def retrace_lines(job, region_index, indices, direction, capture_sign):
+    """
+    Trace the lines at indices again from their seeds through region_index. Returns the new
+    paths and capturing charge indices by line index.
+    """
+    if not indices:
+        return {}, {}
+    paths, captured = trace_seeds(
+        [job['seeds'][index][0] for index in indices],
+        [job['seeds'][index][1] for index in indices],
+        direction, job['charge_arrays'], region_index, job['bounds'], capture_sign,
+        job['step_size'], job['max_steps'], job['source_arrays'], job['image_groups'],
+    )
+    return dict(zip(indices, paths)), dict(zip(indices, captured.tolist()))
+
+def patch_tracing_job(job, key, charges, dielectrics, shields, changed_bounds, line_charges=(), plate_charges=(),
+                      cache_key=None):
+    """
+    Carry a finished 'charges' layout job over to a scene that differs only in its dielectrics
+    and shields, within the world rectangles changed_bounds (see scene_journal.get_changes_since).
+    Lines are traced with the vacuum field direction and only bend or stop at region boundaries,
+    so only the lines touching a changed rectangle are traced again. The negative charge lines
+    are kept only if the retraced positive lines arrive where they did before, since their seeds
+    fill the gaps between the arrivals.
+    Returns False, leaving the job alone, if it has to be traced from scratch instead.
+    """
+    if not job['done'] or job['seeds'] is None:
+        return False
+    if job['scene'] != (tuple(charges), tuple(line_charges), tuple(plate_charges)):
+        return False
+    image_groups = get_image_charges(charges, shields)
+    if len(image_groups) != len(job['image_groups']) or any(
+        plane != old_plane or not all(np.array_equal(new, old) for new, old in zip(arrays, old_arrays))
+        for (plane, *arrays), (old_plane, *old_arrays) in zip(image_groups, job['image_groups'])
+    ):
+        return False  # A shield edge now mirrors different charges, which changes the field everywhere
+
+    region_index = build_region_index(dielectrics, shields)
+    dirty = [index for index, (path, _) in enumerate(job['lines']) if crosses_bounds(path, changed_bounds)]
+    positive_paths, positive_captured = retrace_lines(
+        job, region_index, [index for index in dirty if job['lines'][index][1] == 1], 1, -1
+    )
+    if positive_paths:
+        positive = [index for index, (_, direction) in enumerate(job['lines']) if direction == 1]
+        old_arrivals = {}
+        record_arrivals(
+            [job['lines'][index][0] for index in positive], [job['captured'][index] for index in positive],
+            job['charge_arrays'], old_arrivals, job['source_arrays'],
+        )
+        arrivals = {}
+        record_arrivals(
+            [positive_paths.get(index, job['lines'][index][0]) for index in positive],
+            [positive_captured.get(index, job['captured'][index]) for index in positive],
+            job['charge_arrays'], arrivals, job['source_arrays'],
+        )
+        if arrivals != old_arrivals:
+            return False
+    negative_paths, negative_captured = retrace_lines(
+        job, region_index, [index for index in dirty if job['lines'][index][1] == -1], -1, 1
+    )
+
+    for paths, captured, direction in ((positive_paths, positive_captured, 1), (negative_paths, negative_captured, -1)):
+        for index, path in paths.items():
+            job['lines'][index] = (path, direction)
+            job['captured'][index] = captured[index]
+    job['key'] = key
+    job['region_index'] = region_index
+    job['cache_key'] = cache_key
+    if dirty:
+        job['layer'] = None  # Redraw without the replaced lines
+    finish_job(job)
+    return True
+
+def get_job_layer(job, size, zoom_level, camera_offset_x, camera_offset_y):
+    """
+    Surface with every line finished so far, rasterized in batches. Only lines added since the
+    last call are drawn, unless the camera moved or the screen size changed.
+    """
+    if job['layer'] is None or job['layer']['surface'].get_size() != size:
+        job['layer'] = create_line_layer(size, LINE_COLOR)
+    arrow_interval = FIELD_LINE_ARROW_INTERVAL if job['lod']['arrows'] else 0
+    return update_line_layer(
+        job['layer'], job['lines'], zoom_level, camera_offset_x, camera_offset_y, arrow_interval, LINE_WIDTH
+    )
@@ -1,12 +1,14 @@
 import pygame
 import io
 import math
+import numpy as np
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.figure import Figure
 from matplotlib.font_manager import FontProperties
+from surface_pool import get_translucent_surface
 from settings import (
     TOOLBOX_WIDTH,
     SIDEBAR_BACKGROUND_COLOR,
@@ -19,6 +21,14 @@ from settings import (
     DIELECTRIC_PREVIEW_COLOR,
     DIELECTRIC_PREVIEW_WIDTH,
     PROBE_INFO_MAX_WIDTH,
+    HOVER_READOUT_FONT_SIZE,
+    HOVER_READOUT_BACKGROUND,
+    HOVER_READOUT_OFFSET,
+    LINE_PROBE_COLOR,
+    LINE_PROBE_WIDTH,
+    LINE_PROBE_PANEL_WIDTH,
+    LINE_PROBE_PANEL_HEIGHT,
+    LINE_PROBE_PLOT_COLOR,
     WHITE,  
     BLACK,  
 )
@@ -26,19 +36,33 @@ from settings import (
 pygame.font.init()
 
 scroll_offset = 0
+hover_font = None  # Created on first use of the hover readout
+# Rendered probe sidebar content, rebuilt only when probe_field produces a new breakdown
+probe_info_cache = {
+    'probe_point': None,
+    'field_at_probe': None,
+    'math_details': None,
+    'title': None,
+    'lines': [],
+    'height': 0,
+}
 
 TOOLS = [
     {"label": "Add Positive", "name": "add_positive"},
     {"label": "Add Negative", "name": "add_negative"},
+    {"label": "Add Line Charge", "name": "add_line_charge"},
+    {"label": "Add Plate Charge", "name": "add_plate_charge"},
     {"label": "Erase", "name": "erase"},
     {"label": "Add Dielectric", "name": "add_dielectric"},
     {"label": "Remove Dielectric", "name": "remove_dielectric"},
     {"label": "Add Conductor", "name": "add_shield"},
     {"label": "Remove Conductor", "name": "remove_shield"},
     {"label": "Probe Field", "name": "probe_field"},
+    {"label": "Probe Line", "name": "probe_line"},
     {"label": "Zoom In", "name": "zoom_in"},
     {"label": "Zoom Out", "name": "zoom_out"},
     {"label": "Pan", "name": "pan"},  
+    {"label": "Simulate", "name": "simulate"},
 ]
 
 BUTTON_HEIGHT = 50
@@ -91,24 +115,12 @@ def render_latex(text, font_size=LATEX_FONT_SIZE, dpi=LATEX_DPI, color='black',
 
     return image.convert_alpha()  # Convert for faster blitting and transparency
 
-def draw_probe_info_sidebar(screen, probe_point, field_at_probe, math_details):
+def render_probe_info(field_at_probe, math_details):
     """
-    Display probe information in a fixed sidebar on the right side of the screen with a scrollbar.
+    Render the probe sidebar's math-formatted lines with Matplotlib.
+    Returns a list of (surface, line_height), with None surfaces for blank lines, and the total
+    content height.
     """
-    global scroll_offset  
-
-    sidebar_width = TOOLBOX_WIDTH
-    sidebar_x = screen.get_width() - sidebar_width
-    sidebar_y = 0
-    sidebar_height = screen.get_height()
-
-    # Draw sidebar background
-    pygame.draw.rect(screen, SIDEBAR_BACKGROUND_COLOR, (sidebar_x, sidebar_y, sidebar_width, sidebar_height))
-
-    title_font = pygame.font.Font(None, SIDEBAR_TITLE_FONT_SIZE)
-    title_text = title_font.render("Probe Information", True, BLACK)  # Using BLACK
-    screen.blit(title_text, (sidebar_x + 10, 10))
-
     # Prepare the math-formatted text
     lines = []
 
@@ -146,6 +158,31 @@ def draw_probe_info_sidebar(screen, probe_point, field_at_probe, math_details):
         lines.append(rf"$E_{{{idx+1}y}} = {ey:.2e}\ \mathrm{{N/C}}$")
         lines.append(r"")
 
+    # Show contributions from line and plate charges
+    if math_details.get('sources'):
+        lines.append(r"Contributions from Line/Plate Charges:")
+        for idx, source_info in enumerate(math_details['sources']):
+            angle_deg = math.degrees(math.atan2(source_info['ey'], source_info['ex']))
+            lines.append(rf"{source_info['kind'].capitalize()} charge {idx+1}:")
+            lines.append(rf"$Q_{{{idx+1}}} = {source_info['q']:+.2e}\ \mathrm{{C}}$")
+            lines.append(rf"$d_{{{idx+1}}} = {source_info['distance']:.2f}\ \mathrm{{m}}$")
+            lines.append(rf"$\theta_{{{idx+1}}} = {angle_deg:.2f}^\circ$")
+            lines.append(rf"$E_{{{idx+1}x}} = {source_info['ex']:.2e}\ \mathrm{{N/C}}$")
+            lines.append(rf"$E_{{{idx+1}y}} = {source_info['ey']:.2e}\ \mathrm{{N/C}}$")
+            lines.append(r"")
+
+    # Show contributions from shield image charges
+    if math_details.get('images'):
+        lines.append(r"Contributions from Shield Image Charges:")
+        for idx, image_info in enumerate(math_details['images']):
+            angle_deg = math.degrees(math.atan2(image_info['ey'], image_info['ex']))
+            lines.append(rf"Shield plane {idx+1} ({image_info['count']} images):")
+            lines.append(rf"$Q'_{{{idx+1}}} = {image_info['q']:+.2e}\ \mathrm{{C}}$")
+            lines.append(rf"$\theta'_{{{idx+1}}} = {angle_deg:.2f}^\circ$")
+            lines.append(rf"$E'_{{{idx+1}x}} = {image_info['ex']:.2e}\ \mathrm{{N/C}}$")
+            lines.append(rf"$E'_{{{idx+1}y}} = {image_info['ey']:.2e}\ \mathrm{{N/C}}$")
+            lines.append(r"")
+
     # Total electric field
     Ex = field_at_probe['Ex']
     Ey = field_at_probe['Ey']
@@ -162,7 +199,6 @@ def draw_probe_info_sidebar(screen, probe_point, field_at_probe, math_details):
 
     # Render each line and calculate total content height
     rendered_lines = []
-    max_line_width = 0
     total_content_height = 0
     for line in lines:
         if line.strip() == "":
@@ -172,12 +208,44 @@ def draw_probe_info_sidebar(screen, probe_point, field_at_probe, math_details):
             continue
 
         rendered_line = render_latex(line, font_size=LATEX_FONT_SIZE, dpi=LATEX_DPI, max_width=PROBE_INFO_MAX_WIDTH)
-        line_width, line_height = rendered_line.get_size()
+        line_height = rendered_line.get_height()
         rendered_lines.append((rendered_line, line_height))
-        if line_width > max_line_width:
-            max_line_width = line_width
         total_content_height += line_height + 5  # Line height + spacing
 
+    return rendered_lines, total_content_height
+
+def draw_probe_info_sidebar(screen, probe_point, field_at_probe, math_details):
+    """
+    Display probe information in a fixed sidebar on the right side of the screen with a scrollbar.
+    The rendered lines are cached in probe_info_cache until a new probe result comes in.
+    """
+    global scroll_offset  
+
+    sidebar_width = TOOLBOX_WIDTH
+    sidebar_x = screen.get_width() - sidebar_width
+    sidebar_y = 0
+    sidebar_height = screen.get_height()
+
+    cache = probe_info_cache
+    if (
+        cache['math_details'] is not math_details
+        or cache['field_at_probe'] is not field_at_probe
+        or cache['probe_point'] != probe_point
+    ):
+        if cache['title'] is None:
+            title_font = pygame.font.Font(None, SIDEBAR_TITLE_FONT_SIZE)
+            cache['title'] = title_font.render("Probe Information", True, BLACK)  # Using BLACK
+        cache['lines'], cache['height'] = render_probe_info(field_at_probe, math_details)
+        cache['probe_point'] = probe_point
+        cache['field_at_probe'] = field_at_probe
+        cache['math_details'] = math_details
+    rendered_lines = cache['lines']
+    total_content_height = cache['height']
+
+    # Draw sidebar background
+    pygame.draw.rect(screen, SIDEBAR_BACKGROUND_COLOR, (sidebar_x, sidebar_y, sidebar_width, sidebar_height))
+    screen.blit(cache['title'], (sidebar_x + 10, 10))
+
     # Clamp scroll_offset to valid range
     if total_content_height > sidebar_height - 50:  # 50px reserved for title
         max_scroll = total_content_height - (sidebar_height - 50)
@@ -213,23 +281,26 @@ def handle_scroll(event):
             scroll_offset = 0
         print(f"Scroll offset updated: {scroll_offset}")
 
-def draw_toolbox(screen):
+def build_toolbox_surface(height):
     """
-    Draws the toolbox on the left side of the screen.
+    Render the toolbox background, buttons and labels into a surface for the cached toolbox
+    layer in main.py. Must be called after the display mode has been set.
     """
-    pygame.draw.rect(screen, SIDEBAR_BACKGROUND_COLOR, (0, 0, TOOLBOX_WIDTH, screen.get_height()))
-    
+    surface = pygame.Surface((TOOLBOX_WIDTH, height))
+    surface.fill(SIDEBAR_BACKGROUND_COLOR)
+
     font = pygame.font.Font(None, 30)
-    
+
     for idx, tool in enumerate(TOOLS):
         label = tool["label"]
-        name = tool["name"]
         button_rect = pygame.Rect(10, START_Y + idx * (BUTTON_HEIGHT + BUTTON_SPACING), BUTTON_WIDTH, BUTTON_HEIGHT)
-        pygame.draw.rect(screen, BLACK, button_rect, 2)  
-        
+        pygame.draw.rect(surface, BLACK, button_rect, 2)
+
         text_surface = font.render(label, True, BLACK)
         text_rect = text_surface.get_rect(center=button_rect.center)
-        screen.blit(text_surface, text_rect)
+        surface.blit(text_surface, text_rect)
+
+    return surface.convert()
 
 def handle_toolbox_click(mouse_x, mouse_y):
     """
@@ -258,3 +329,96 @@ def draw_dielectric_preview(screen, start_pos, end_pos):
 
     rect = pygame.Rect(rect_x, rect_y, rect_width, rect_height)
     pygame.draw.rect(screen, DIELECTRIC_PREVIEW_COLOR, rect, DIELECTRIC_PREVIEW_WIDTH)  
+
+def get_readout_font():
+    """
+    Return the small font shared by the readout overlays, creating it on first use.
+    """
+    global hover_font
+    if hover_font is None:
+        hover_font = pygame.font.Font(None, HOVER_READOUT_FONT_SIZE)
+    return hover_font
+
+def draw_hover_readout(screen, position, readout, zoom_level):
+    """
+    Draw a small text box next to the cursor with the live field readout.
+    readout holds Ex, Ey, E_magnitude, theta (degrees) and V. The translucent background comes
+    from the surface pool, which zoom_level flushes like the region fills.
+    """
+    hover_font = get_readout_font()
+
+    lines = [
+        f"Ex = {readout['Ex']:.3e} N/C",
+        f"Ey = {readout['Ey']:.3e} N/C",
+        f"|E| = {readout['E_magnitude']:.3e} N/C",
+        f"theta = {readout['theta']:.1f} deg",
+        f"V = {readout['V']:.3e} V",
+    ]
+    rendered = [hover_font.render(line, True, BLACK) for line in lines]
+    line_height = hover_font.get_linesize()
+    box_width = max(text.get_width() for text in rendered) + SIDEBAR_TEXT_PADDING
+    box_height = line_height * len(rendered) + SIDEBAR_TEXT_PADDING
+
+    # Keep the box on screen, flipping it to the other side of the cursor near the edges
+    box_x = position[0] + HOVER_READOUT_OFFSET
+    box_y = position[1] + HOVER_READOUT_OFFSET
+    if box_x + box_width > screen.get_width():
+        box_x = position[0] - HOVER_READOUT_OFFSET - box_width
+    if box_y + box_height > screen.get_height():
+        box_y = position[1] - HOVER_READOUT_OFFSET - box_height
+
+    background = get_translucent_surface(box_width, box_height, HOVER_READOUT_BACKGROUND, zoom_level)
+    screen.blit(background, (box_x, box_y))
+    pygame.draw.rect(screen, BLACK, (box_x, box_y, box_width, box_height), 1)
+
+    for idx, text in enumerate(rendered):
+        screen.blit(text, (box_x + SIDEBAR_TEXT_PADDING // 2, box_y + SIDEBAR_TEXT_PADDING // 2 + idx * line_height))
+
+def draw_line_probe(screen, screen_points, result):
+    """
+    Draw the probe path and, once evaluated, a panel with the integrals and the |E| profile.
+    """
+    if len(screen_points) > 1:
+        pygame.draw.lines(screen, LINE_PROBE_COLOR, False, screen_points, LINE_PROBE_WIDTH)
+    if result is None:
+        return
+
+    font = get_readout_font()
+    padding = SIDEBAR_TEXT_PADDING
+    panel_x = TOOLBOX_WIDTH + padding
+    panel_y = screen.get_height() - LINE_PROBE_PANEL_HEIGHT - padding
+    panel_rect = pygame.Rect(panel_x, panel_y, LINE_PROBE_PANEL_WIDTH, LINE_PROBE_PANEL_HEIGHT)
+    pygame.draw.rect(screen, SIDEBAR_BACKGROUND_COLOR, panel_rect)
+    pygame.draw.rect(screen, BLACK, panel_rect, 1)
+
+    lines = [
+        f"Line integral E.dl = {result['line_integral']:.3e} V",
+        f"Potential difference = {result['potential_difference']:.3e} V",
+        f"Flux E.n dl = {result['flux']:.3e} V",
+        f"Length = {result['length']:.1f} m, {result['num_samples']} samples",
+    ]
+    line_height = font.get_linesize()
+    for idx, line in enumerate(lines):
+        screen.blit(font.render(line, True, BLACK), (panel_x + padding, panel_y + padding + idx * line_height))
+
+    # |E| profile against arc length on a log scale, resampled to the plot width
+    plot_rect = pygame.Rect(
+        panel_x + padding,
+        panel_y + 2 * padding + len(lines) * line_height,
+        LINE_PROBE_PANEL_WIDTH - 2 * padding,
+        LINE_PROBE_PANEL_HEIGHT - 3 * padding - len(lines) * line_height,
+    )
+    pygame.draw.rect(screen, WHITE, plot_rect)
+    pygame.draw.rect(screen, BLACK, plot_rect, 1)
+    arc_positions = result['arc_positions']
+    if plot_rect.width < 2 or plot_rect.height < 2 or arc_positions[-1] <= 0:
+        return
+    columns = np.linspace(0.0, arc_positions[-1], plot_rect.width)
+    log_magnitude = np.log10(np.maximum(np.interp(columns, arc_positions, result['E_magnitude']), 1e-30))
+    low, high = log_magnitude.min(), log_magnitude.max()
+    span = high - low if high > low else 1.0
+    ys = plot_rect.bottom - 1 - (log_magnitude - low) / span * (plot_rect.height - 2)
+    xs = plot_rect.left + np.arange(plot_rect.width)
+    pygame.draw.lines(screen, LINE_PROBE_PLOT_COLOR, False, list(zip(xs.tolist(), ys.tolist())), 1)
+    label = font.render("log10 |E| along path", True, BLACK)
+    screen.blit(label, (plot_rect.left + 3, plot_rect.top + 2))